@@ -1,10 +1,17 @@
+import operator
+from functools import reduce
+
 from django.contrib import admin
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.db.models import Q
 from django.utils.html import format_html
 from django.urls import reverse
+from .busqueda import ResultadosBusqueda
 from .models import (
     Oposicion, Tema, Capitulo, Articulo, Pregunta,
-    Examen, RespuestaUsuario, NotaEstudio, PerfilUsuario,
-    RecursoTema, ProgresoEstudio
+    Examen, PreguntaExamen, RespuestaUsuario, NotaEstudio, PerfilUsuario,
+    RecursoTema, ProgresoEstudio, EstadisticaCapitulo, EstadoPregunta,
+    TiempoEstudio, DocumentoBusqueda,
 )
 
 
@@ -45,16 +52,57 @@ class RespuestaUsuarioInline(admin.TabularInline):
     can_delete = False
 
 
+class PreguntaExamenInline(admin.TabularInline):
+    model = PreguntaExamen
+    extra = 0
+    fields = ('posicion', 'pregunta')
+    readonly_fields = ('posicion', 'pregunta')
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('pregunta')
+
+
 class RecursoTemaInline(admin.TabularInline):
     model = RecursoTema
     extra = 1
 
 
+# ── Búsqueda de texto completo ────────────────────────────────────────────────
+
+class BusquedaTextoAdminMixin:
+    """Resuelve el buscador del admin (y el autocompletado) con el índice de texto completo.
+
+    El texto propio del objeto se busca en el índice. Los campos de objetos
+    relacionados que no forman parte del documento indexado se indican en
+    `campos_busqueda_orm` y se buscan con el ORM, como en `search_fields`:
+    cada palabra en alguno de ellos. El resultado es la unión de ambas
+    búsquedas, sin límite. `search_fields` se mantiene porque el admin lo
+    exige para mostrar el buscador y para `autocomplete_fields`.
+    """
+
+    tipo_documento = None
+    campos_busqueda_orm = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        resultados = ResultadosBusqueda(search_term, self.tipo_documento)
+        if not resultados.terminos:
+            return super().get_search_results(request, queryset, search_term)
+        filtro = Q(pk__in=resultados.subconsulta())
+        if self.campos_busqueda_orm:
+            filtro |= reduce(operator.and_, (
+                reduce(operator.or_, (Q(**{f'{campo}__icontains': termino}) for campo in self.campos_busqueda_orm))
+                for termino in resultados.terminos
+            ))
+        duplicados = any(lookup_spawns_duplicates(self.opts, campo) for campo in self.campos_busqueda_orm)
+        return queryset.filter(filtro), duplicados
+
+
 # ── ModelAdmins ───────────────────────────────────────────────────────────────
 
 @admin.register(Oposicion)
 class OposicionAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'num_preguntas', 'penalizacion', 'descripcion')
+    list_display = ('nombre', 'num_preguntas', 'penalizacion', 'estrategia_seleccion', 'descripcion')
     search_fields = ('nombre',)
     inlines = [TemaInline]
 
@@ -81,12 +129,15 @@ class CapituloAdmin(admin.ModelAdmin):
 
 
 @admin.register(Articulo)
-class ArticuloAdmin(admin.ModelAdmin):
+class ArticuloAdmin(BusquedaTextoAdminMixin, admin.ModelAdmin):
     list_display = ('numero', 'get_capitulo', 'get_tema', 'get_oposicion')
     list_filter = ('capitulo__tema__oposiciones',)
     search_fields = ('numero', 'contenido', 'capitulo__titulo', 'capitulo__tema__titulo')
     autocomplete_fields = ['capitulo']
     inlines = [PreguntaInline]
+    tipo_documento = DocumentoBusqueda.TipoDocumento.ARTICULO
+    # El documento del artículo ya lleva su número y el título del capítulo
+    campos_busqueda_orm = ('capitulo__tema__titulo',)
 
     @admin.display(description='Capítulo')
     def get_capitulo(self, obj):
@@ -103,7 +154,7 @@ class ArticuloAdmin(admin.ModelAdmin):
 
 
 @admin.register(Pregunta)
-class PreguntaAdmin(admin.ModelAdmin):
+class PreguntaAdmin(BusquedaTextoAdminMixin, admin.ModelAdmin):
     list_display = (
         'enunciado_corto', 'respuesta_correcta',
         'get_articulo', 'get_capitulo', 'get_tema',
@@ -117,6 +168,8 @@ class PreguntaAdmin(admin.ModelAdmin):
         'enunciado', 'respuesta_a', 'respuesta_b', 'respuesta_c', 'respuesta_d',
         'articulo__numero', 'articulo__capitulo__titulo',
     )
+    tipo_documento = DocumentoBusqueda.TipoDocumento.PREGUNTA
+    campos_busqueda_orm = ('articulo__numero', 'articulo__capitulo__titulo')
     # ✅ Clave: reemplaza el <select> enorme por un widget de búsqueda
     autocomplete_fields = ['articulo']
     readonly_fields = ('get_articulo_preview',)
@@ -175,11 +228,13 @@ class PreguntaAdmin(admin.ModelAdmin):
 
 @admin.register(Examen)
 class ExamenAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'tipo', 'oposicion', 'puntuacion', 'fecha_finalizacion')
+    list_display = ('__str__', 'tipo', 'oposicion', 'puntuacion', 'porcentaje_acierto', 'fecha_finalizacion')
+    list_select_related = ('usuario', 'oposicion')
     list_filter = ('tipo', 'oposicion', 'usuario')
     readonly_fields = ('fecha_creacion', 'fecha_finalizacion', 'puntuacion',
-                       'respuestas_correctas', 'respuestas_erroneas')
-    inlines = [RespuestaUsuarioInline]
+                       'respuestas_correctas', 'respuestas_erroneas',
+                       'respuestas_en_blanco', 'total_preguntas')
+    inlines = [PreguntaExamenInline, RespuestaUsuarioInline]
 
 
 @admin.register(RespuestaUsuario)
@@ -218,6 +273,42 @@ class RecursoTemaAdmin(admin.ModelAdmin):
     search_fields = ('titulo', 'capitulo__titulo')
 
 
+@admin.register(EstadisticaCapitulo)
+class EstadisticaCapituloAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'capitulo', 'total_respuestas', 'total_fallos', 'fecha_ultimo_acierto')
+    list_filter = ('capitulo__tema__oposiciones',)
+    search_fields = ('usuario__email', 'capitulo__titulo')
+    list_select_related = ('usuario', 'capitulo')
+    readonly_fields = ('usuario', 'capitulo', 'total_respuestas', 'total_fallos', 'fecha_ultimo_acierto')
+
+
+@admin.register(EstadoPregunta)
+class EstadoPreguntaAdmin(admin.ModelAdmin):
+    list_display = (
+        'usuario', 'pregunta_id', 'veces_vista', 'veces_fallada',
+        'ultima_correcta', 'fecha_ultima_respuesta', 'fecha_proxima_revision',
+    )
+    list_filter = ('ultima_correcta',)
+    search_fields = ('usuario__email',)
+    list_select_related = ('usuario',)
+    raw_id_fields = ('pregunta',)
+    readonly_fields = (
+        'usuario', 'pregunta', 'veces_vista', 'veces_fallada',
+        'ultima_correcta', 'fecha_ultima_respuesta', 'fecha_ultimo_acierto',
+        'repeticiones', 'intervalo_dias', 'facilidad', 'fecha_proxima_revision',
+    )
+
+
+@admin.register(TiempoEstudio)
+class TiempoEstudioAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'capitulo', 'fecha', 'segundos')
+    list_filter = ('fecha', 'capitulo__tema__oposiciones')
+    search_fields = ('usuario__email', 'capitulo__titulo')
+    list_select_related = ('usuario', 'capitulo')
+    date_hierarchy = 'fecha'
+    readonly_fields = ('usuario', 'capitulo', 'fecha', 'segundos')
+
+
 # ── Cabecera del panel ────────────────────────────────────────────────────────
 admin.site.site_header = 'Panel de Administración — OPOSICIONES'
 admin.site.index_title = 'Gestión de contenido y usuarios'
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ExamenConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "examen"
+
+    def ready(self):
+        """
+        Registra las señales que invalidan las cachés del contenido y
+        mantienen el índice de búsqueda, que se instala tras cada `migrate`
+        """
+        import examen.signals
+        from examen.busqueda import instalar_indice
+
+        post_migrate.connect(instalar_indice, sender=self)
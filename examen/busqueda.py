@@ -0,0 +1,339 @@
+"""Búsqueda de texto completo en el temario y el banco de preguntas.
+
+Cada artículo, pregunta y capítulo tiene una fila en `DocumentoBusqueda` con
+su título y su texto planos. Sobre esa tabla se crea, fuera del ORM, el índice
+propio del motor:
+
+- SQLite (desarrollo y tests): una tabla virtual FTS5 de contenido externo con
+  el tokenizador `unicode61 remove_diacritics 2`, de modo que "constitucion"
+  encuentra "Constitución". Unos triggers la mantienen al día con la tabla.
+- PostgreSQL (producción): un índice GIN sobre la expresión
+  `to_tsvector('es_sin_acentos', titulo || ' ' || texto)`. La configuración
+  `es_sin_acentos` es la `spanish` con el diccionario `unaccent` delante del
+  lematizador, para que, como en SQLite, "constitucion" encuentre
+  "Constitución". Necesita la extensión `unaccent` (contrib de PostgreSQL).
+
+`instalar_indice` crea ese índice tras `migrate` (señal `post_migrate`). Las
+señales de `examen.signals` actualizan los documentos al guardar o borrar y
+`python manage.py reindexar_busqueda` los reconstruye tras cargas masivas.
+
+La consulta del usuario se reduce a sus palabras, que se buscan todas y como
+prefijo, así que nunca llega al motor sintaxis de consulta inválida.
+"""
+
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Articulo, Capitulo, DocumentoBusqueda, Pregunta
+
+TABLA_FTS = 'examen_documentobusqueda_fts'
+INDICE_GIN = 'examen_docbusq_unaccent_idx'
+# Índice de versiones anteriores, con la configuración `spanish` sin unaccent
+INDICE_GIN_ANTERIOR = 'examen_docbusq_tsvector_idx'
+CONFIGURACION_PG = 'es_sin_acentos'
+# Palabras de la consulta que se tienen en cuenta
+MAX_TERMINOS = 8
+# Marcas del fragmento resaltado: caracteres de control que no aparecen en el
+# texto y sobreviven a `escape`
+MARCA_INICIO = '\x02'
+MARCA_FIN = '\x03'
+
+Tipo = DocumentoBusqueda.TipoDocumento
+
+
+# ── Documentos ────────────────────────────────────────────────────────────────
+
+def documento_articulo(articulo) -> DocumentoBusqueda:
+    return DocumentoBusqueda(
+        tipo=Tipo.ARTICULO, objeto_id=articulo.pk, capitulo_id=articulo.capitulo_id,
+        titulo=f'Artículo {articulo.numero}. {articulo.capitulo.titulo}'[:255],
+        texto=articulo.contenido,
+    )
+
+
+def documento_pregunta(pregunta) -> DocumentoBusqueda:
+    return DocumentoBusqueda(
+        tipo=Tipo.PREGUNTA, objeto_id=pregunta.pk,
+        capitulo_id=pregunta.articulo.capitulo_id,
+        titulo=pregunta.enunciado[:255],
+        texto='\n'.join(filter(None, (
+            pregunta.enunciado, pregunta.respuesta_a, pregunta.respuesta_b,
+            pregunta.respuesta_c, pregunta.respuesta_d, pregunta.explicacion,
+        ))),
+    )
+
+
+def documento_capitulo(capitulo) -> DocumentoBusqueda:
+    return DocumentoBusqueda(
+        tipo=Tipo.CAPITULO, objeto_id=capitulo.pk, capitulo_id=capitulo.pk,
+        titulo=capitulo.titulo, texto='',
+    )
+
+
+# Modelo, tipo de documento, constructor y relaciones que necesita
+DOCUMENTOS = (
+    (Articulo, Tipo.ARTICULO, documento_articulo, ('capitulo',)),
+    (Pregunta, Tipo.PREGUNTA, documento_pregunta, ('articulo',)),
+    (Capitulo, Tipo.CAPITULO, documento_capitulo, ()),
+)
+CAMPOS_DOCUMENTO = ['capitulo', 'titulo', 'texto']
+
+
+def _guardar_documento(documento) -> None:
+    DocumentoBusqueda.objects.update_or_create(
+        tipo=documento.tipo, objeto_id=documento.objeto_id,
+        defaults={campo: getattr(documento, campo) for campo in CAMPOS_DOCUMENTO},
+    )
+
+
+def indexar_articulo(articulo) -> None:
+    """Indexa el artículo y mueve a su capítulo los documentos de sus preguntas."""
+    _guardar_documento(documento_articulo(articulo))
+    DocumentoBusqueda.objects.filter(
+        tipo=Tipo.PREGUNTA,
+        objeto_id__in=articulo.preguntasArticulo.values('pk'),
+    ).exclude(capitulo_id=articulo.capitulo_id).update(capitulo_id=articulo.capitulo_id)
+
+
+def indexar_pregunta(pregunta) -> None:
+    _guardar_documento(documento_pregunta(pregunta))
+
+
+def indexar_capitulo(capitulo) -> None:
+    """Indexa el capítulo y sus artículos, cuyo título incluye el del capítulo."""
+    _guardar_documento(documento_capitulo(capitulo))
+    for articulo in capitulo.articulosCapitulo.only('pk', 'numero', 'contenido', 'capitulo_id'):
+        articulo.capitulo = capitulo
+        _guardar_documento(documento_articulo(articulo))
+
+
+def desindexar(tipo, objeto_id) -> None:
+    DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+
+
+def reemplazar_documentos(documentos) -> None:
+    """Sustituye en bloque los documentos de los mismos objetos (cargas masivas)."""
+    por_tipo = {}
+    for documento in documentos:
+        por_tipo.setdefault(documento.tipo, []).append(documento.objeto_id)
+    with transaction.atomic():
+        for tipo, ids in por_tipo.items():
+            DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id__in=ids).delete()
+        DocumentoBusqueda.objects.bulk_create(documentos)
+
+
+def reconstruir_indice(tamano_lote: int = 1000) -> int:
+    """Vuelve a generar todos los documentos por lotes y devuelve cuántos hay."""
+    total = 0
+    with transaction.atomic():
+        DocumentoBusqueda.objects.all().delete()
+        for modelo, _tipo, construir, relaciones in DOCUMENTOS:
+            ultimo_pk = 0
+            filas = modelo.objects.select_related(*relaciones).order_by('pk')
+            while True:
+                # Paginación por clave: cada lote empieza tras el último pk procesado
+                lote = list(filas.filter(pk__gt=ultimo_pk)[:tamano_lote])
+                if not lote:
+                    break
+                ultimo_pk = lote[-1].pk
+                DocumentoBusqueda.objects.bulk_create([construir(fila) for fila in lote])
+                total += len(lote)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+    return total
+
+
+# ── Índice del motor ──────────────────────────────────────────────────────────
+
+def _sentencias_sqlite(tabla) -> list:
+    fts = TABLA_FTS
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"titulo, texto, content='{tabla}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+        f"INSERT INTO {fts}(rowid, titulo, texto) VALUES (new.id, new.titulo, new.texto); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, titulo, texto) "
+        f"VALUES ('delete', old.id, old.titulo, old.texto); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, titulo, texto) "
+        f"VALUES ('delete', old.id, old.titulo, old.texto); "
+        f"INSERT INTO {fts}(rowid, titulo, texto) VALUES (new.id, new.titulo, new.texto); END",
+    ]
+
+
+def _sentencias_configuracion_pg() -> list:
+    """Configuración de texto `spanish` que además quita las tildes (unaccent)."""
+    return [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        f"DO $$ BEGIN "
+        f"IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIGURACION_PG}') THEN "
+        f"CREATE TEXT SEARCH CONFIGURATION {CONFIGURACION_PG} (COPY = spanish); "
+        f"ALTER TEXT SEARCH CONFIGURATION {CONFIGURACION_PG} "
+        f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem; "
+        f"END IF; END $$",
+    ]
+
+
+def _vector_pg(prefijo='') -> str:
+    """Expresión del índice GIN; las consultas deben repetirla tal cual para usarlo."""
+    return (
+        f"to_tsvector('{CONFIGURACION_PG}'::regconfig, "
+        f"{prefijo}titulo || ' ' || {prefijo}texto)"
+    )
+
+
+def instalar_indice(using='default', **kwargs) -> None:
+    """Crea el índice de texto completo si no existe (receptor de `post_migrate`)."""
+    conexion = connections[using]
+    tabla = DocumentoBusqueda._meta.db_table
+    if tabla not in conexion.introspection.table_names():
+        return
+    if conexion.vendor == 'sqlite':
+        sentencias = _sentencias_sqlite(tabla)
+    elif conexion.vendor == 'postgresql':
+        sentencias = [
+            *_sentencias_configuracion_pg(),
+            f"DROP INDEX IF EXISTS {INDICE_GIN_ANTERIOR}",
+            f"CREATE INDEX IF NOT EXISTS {INDICE_GIN} ON {tabla} USING GIN ({_vector_pg()})",
+        ]
+    else:
+        return
+    with conexion.cursor() as cursor:
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+
+
+# ── Consultas ─────────────────────────────────────────────────────────────────
+
+def terminos(consulta) -> list:
+    """Palabras de la consulta, sin operadores ni signos (como mucho `MAX_TERMINOS`)."""
+    return re.findall(r'\w+', (consulta or '').lower())[:MAX_TERMINOS]
+
+
+class ResultadosBusqueda:
+    """Secuencia paginable de documentos ordenados por relevancia.
+
+    Como `PreguntasOrdenadas`, ofrece `count()` y cortes para `Paginator`. Cada
+    documento lleva además `rango` y `fragmento` (HTML escapado con las
+    coincidencias en `<mark>`).
+    """
+
+    def __init__(self, consulta, tipo=None):
+        self.terminos = terminos(consulta)
+        self.tipo = tipo
+        self._total = None
+
+    def _desde(self):
+        """FROM/WHERE comunes a la cuenta y a los cortes, con sus parámetros."""
+        tabla = DocumentoBusqueda._meta.db_table
+        filtro_tipo, parametros_tipo = ('AND d.tipo = %s', [self.tipo]) if self.tipo else ('', [])
+        if connection.vendor == 'postgresql':
+            consulta = ' & '.join(f'{termino}:*' for termino in self.terminos)
+            return (
+                f"FROM {tabla} d, to_tsquery('{CONFIGURACION_PG}'::regconfig, %s) q "
+                f"WHERE {_vector_pg('d.')} @@ q {filtro_tipo}",
+                [consulta, *parametros_tipo],
+            )
+        consulta = ' '.join(f'"{termino}"*' for termino in self.terminos)
+        return (
+            f"FROM {TABLA_FTS} f JOIN {tabla} d ON d.id = f.rowid "
+            f"WHERE {TABLA_FTS} MATCH %s {filtro_tipo}",
+            [consulta, *parametros_tipo],
+        )
+
+    @staticmethod
+    def _rango() -> str:
+        """Relevancia (mayor es mejor); el título pesa más que el texto."""
+        if connection.vendor == 'postgresql':
+            # Se calcula solo para las filas que ya han pasado el índice
+            return (
+                f"ts_rank(setweight(to_tsvector('{CONFIGURACION_PG}'::regconfig, d.titulo), 'A') || "
+                f"setweight(to_tsvector('{CONFIGURACION_PG}'::regconfig, d.texto), 'B'), q)"
+            )
+        # bm25() es menor cuanto más relevante
+        return f'-bm25({TABLA_FTS}, 5.0, 1.0)'
+
+    def ids(self, limite: int) -> list:
+        """Ids de los objetos que coinciden, los más relevantes primero, sin fragmentos."""
+        if not self.terminos:
+            return []
+        desde, parametros = self._desde()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT d.objeto_id {desde} ORDER BY {self._rango()} DESC, d.id LIMIT %s',
+                [*parametros, limite],
+            )
+            return [fila[0] for fila in cursor.fetchall()]
+
+    def subconsulta(self) -> RawSQL:
+        """Ids de todos los objetos que coinciden, para filtrar con `pk__in`."""
+        desde, parametros = self._desde()
+        return RawSQL(f'SELECT d.objeto_id {desde}', parametros)
+
+    def count(self) -> int:
+        if self._total is None:
+            if not self.terminos:
+                self._total = 0
+            else:
+                desde, parametros = self._desde()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) {desde}', parametros)
+                    self._total = cursor.fetchone()[0]
+        return self._total
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, indice):
+        if not isinstance(indice, slice):
+            return self[indice:indice + 1][0]
+        if not self.terminos:
+            return []
+        inicio = indice.start or 0
+        fin = self.count() if indice.stop is None else indice.stop
+        if fin <= inicio:
+            return []
+        desde, parametros = self._desde()
+        if connection.vendor == 'postgresql':
+            fragmento = (
+                f"ts_headline('{CONFIGURACION_PG}'::regconfig, "
+                f"CASE WHEN d.texto = '' THEN d.titulo ELSE d.texto END, q, %s)"
+            )
+            parametros_fragmento = [
+                f'StartSel={MARCA_INICIO}, StopSel={MARCA_FIN}, MaxWords=35, MinWords=15'
+            ]
+        else:
+            fragmento = (
+                f"CASE WHEN d.texto = '' THEN highlight({TABLA_FTS}, 0, %s, %s) "
+                f"ELSE snippet({TABLA_FTS}, 1, %s, %s, '…', 24) END"
+            )
+            parametros_fragmento = [MARCA_INICIO, MARCA_FIN] * 2
+        sql = (
+            f'SELECT d.id, d.tipo, d.objeto_id, d.capitulo_id, d.titulo, '
+            f'{self._rango()} AS rango, {fragmento} AS fragmento '
+            f'{desde} ORDER BY rango DESC, d.id LIMIT %s OFFSET %s'
+        )
+        documentos = list(DocumentoBusqueda.objects.raw(
+            sql, [*parametros_fragmento, *parametros, fin - inicio, inicio]
+        ).prefetch_related('capitulo__tema'))
+        for documento in documentos:
+            documento.fragmento = resaltar(documento.fragmento)
+        return documentos
+
+
+def resaltar(fragmento) -> str:
+    """Escapa el fragmento y convierte las marcas de coincidencia en `<mark>`."""
+    html = escape(fragmento or '')
+    return mark_safe(html.replace(MARCA_INICIO, '<mark>').replace(MARCA_FIN, '</mark>'))
+
+
+def ids_coincidentes(tipo, consulta, limite: int = 1000) -> list:
+    """Ids de los objetos de un tipo que coinciden, los más relevantes primero."""
+    return ResultadosBusqueda(consulta, tipo).ids(limite)
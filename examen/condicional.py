@@ -0,0 +1,131 @@
+"""Peticiones GET condicionales (ETag) para el temario y las páginas de estudio.
+
+El texto legal cambia muy poco, así que las páginas de lectura y las APIs en
+cascada del staff se validan con un ETag en lugar de volver a renderizarse.
+El ETag es una huella de:
+
+- contadores de versión del contenido (`examen.versiones`): uno por capítulo,
+  que incrementan las señales, al confirmarse la transacción, al guardar o
+  borrar el capítulo, sus artículos o sus recursos, y el del árbol del
+  temario (`examen.temario`), que cubre temas, capítulos y oposiciones;
+- lo propio del usuario que aparece en la página: la versión de su perfil
+  (barra lateral), la fecha de su nota y su progreso en el capítulo, y el
+  secreto CSRF, para no reutilizar formularios con un token antiguo.
+
+Con un ETag vigente, `condition` responde 304 sin ejecutar la vista. Las
+respuestas llevan `Cache-Control: private, no-cache`: el navegador puede
+guardarlas, pero debe revalidarlas siempre.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import NotaEstudio, ProgresoEstudio
+from .temario import VERSION_TEMARIO
+from .versiones import incrementar_version, obtener_versiones
+
+
+def ambito_capitulo(capitulo_id) -> str:
+    return f'capitulo:{capitulo_id}'
+
+
+def ambito_perfil(usuario_id) -> str:
+    return f'perfil:{usuario_id}'
+
+
+def invalidar_capitulo(capitulo_id) -> None:
+    """Cambia el ETag de las páginas de un capítulo."""
+    incrementar_version(ambito_capitulo(capitulo_id))
+
+
+def invalidar_perfil(usuario_id) -> None:
+    """Cambia el ETag de todas las páginas de un usuario (barra lateral)."""
+    incrementar_version(ambito_perfil(usuario_id))
+
+
+def _huella(*partes) -> str:
+    return hashlib.sha1('|'.join(map(str, partes)).encode()).hexdigest()
+
+
+def _partes_usuario(request) -> tuple:
+    return (request.user.pk, request.META.get('CSRF_COOKIE', ''))
+
+
+def _hay_mensajes(request) -> bool:
+    # len() carga los mensajes pendientes sin marcarlos como leídos
+    return bool(len(messages.get_messages(request)))
+
+
+# ── Funciones ETag ────────────────────────────────────────────────────────────
+
+def etag_temario(request, *args, **kwargs):
+    if _hay_mensajes(request):
+        return None
+    # La versión del perfil cubre el cambio de oposición activa
+    versiones = obtener_versiones(VERSION_TEMARIO, ambito_perfil(request.user.pk))
+    return _huella('temario', *versiones.values(), *_partes_usuario(request))
+
+
+def etag_capitulo(request, pk, *args, **kwargs):
+    """Lectura del capítulo: contenido, navegación, perfil, nota, progreso y parámetros.
+
+    Los parámetros cuentan porque la página muestra avisos según la URL
+    (p. ej. `?error=sin_preguntas`).
+    """
+    if _hay_mensajes(request):
+        return None
+    versiones = obtener_versiones(
+        ambito_capitulo(pk), VERSION_TEMARIO, ambito_perfil(request.user.pk)
+    )
+    nota = (
+        NotaEstudio.objects.filter(usuario=request.user, capitulo_id=pk)
+        .values_list('fecha_actualizacion', flat=True).first()
+    )
+    progreso = (
+        ProgresoEstudio.objects.filter(usuario=request.user, capitulo_id=pk)
+        .values_list('completado', 'fecha_completado').first()
+    )
+    return _huella(
+        'capitulo', pk, request.GET.urlencode(), *versiones.values(), nota, progreso,
+        *_partes_usuario(request),
+    )
+
+
+def etag_capitulo_impresion(request, pk, *args, **kwargs):
+    versiones = obtener_versiones(ambito_capitulo(pk), VERSION_TEMARIO)
+    return _huella('impresion', pk, *versiones.values())
+
+
+def etag_api_temario(request, *args, **kwargs):
+    """APIs de temas y capítulos: dependen solo del árbol y de los parámetros."""
+    return _huella(
+        'api', request.path, request.GET.urlencode(), *obtener_versiones(VERSION_TEMARIO).values(),
+    )
+
+
+def etag_api_articulos(request, *args, **kwargs):
+    capitulo_id = request.GET.get('capitulo_id', '')
+    if not capitulo_id.isdigit():
+        return None
+    return _huella(
+        'api', request.path, capitulo_id,
+        *obtener_versiones(ambito_capitulo(capitulo_id)).values(),
+    )
+
+
+def validar_con_etag(etag_func):
+    """`condition(etag_func)` más `Cache-Control: private, no-cache`."""
+    def decorador(vista):
+        vista_condicional = condition(etag_func=etag_func)(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            respuesta = vista_condicional(request, *args, **kwargs)
+            patch_cache_control(respuesta, private=True, no_cache=True)
+            return respuesta
+        return envoltura
+    return decorador
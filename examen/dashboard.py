@@ -0,0 +1,109 @@
+"""Contexto del dashboard (HomeView) cacheado por usuario.
+
+El contexto solo cambia cuando el usuario finaliza un examen, marca su
+progreso o se vuelca su tiempo de estudio, así que se guarda en la caché bajo
+una clave versionada por usuario. `invalidar_dashboard` incrementa esa versión
+desde los puntos donde cambian los datos; `DASHBOARD_CACHE_TIMEOUT` acota
+además lo desfasadas que pueden quedar las recomendaciones, que dependen de la
+fecha actual.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+
+from .estadisticas import recomendaciones_estudio, rendimiento_por_tema, tiempo_por_tema
+from .models import Examen, RespuestaUsuario
+from .versiones import incrementar_version, obtener_version
+
+
+def _ambito(usuario_id) -> str:
+    return f'dashboard:{usuario_id}'
+
+
+def invalidar_dashboard(usuario_id) -> None:
+    """Descarta el contexto cacheado del dashboard de un usuario."""
+    incrementar_version(_ambito(usuario_id))
+
+
+def contexto_dashboard(usuario, oposicion_activa) -> dict:
+    """Contexto del dashboard, leído de la caché si su versión sigue vigente."""
+    version = obtener_version(_ambito(usuario.pk))
+    clave = f'dashboard:{usuario.pk}:{oposicion_activa.pk if oposicion_activa else 0}:{version}'
+    contexto = cache.get(clave)
+    if contexto is None:
+        contexto = construir_contexto_dashboard(usuario, oposicion_activa)
+        cache.set(clave, contexto, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 900))
+    return contexto
+
+
+def construir_contexto_dashboard(usuario, oposicion_activa) -> dict:
+    """Calcula KPIs, gráfico, exámenes recientes, rendimiento, tiempo de estudio y recomendaciones."""
+
+    # ── KPIs globales (solo de su oposición activa si existe) ─────────────────
+    examenes_qs = Examen.objects.filter(usuario=usuario, puntuacion__isnull=False)
+    if oposicion_activa:
+        examenes_qs = examenes_qs.filter(oposicion=oposicion_activa)
+
+    stats = examenes_qs.aggregate(
+        total=Count('id'),
+        media=Avg('puntuacion'),
+        maxima=Max('puntuacion'),
+    )
+    puntuacion_media = round(stats['media'] or 0, 2)
+    puntuacion_maxima = round(stats['maxima'] or 0, 2)
+
+    # Acierto global (sobre las respuestas de exámenes finalizados: las de los
+    # exámenes en curso cambian con el autoguardado sin invalidar el dashboard)
+    todas_respuestas = RespuestaUsuario.objects.filter(
+        examen__usuario=usuario, examen__fecha_finalizacion__isnull=False,
+    )
+    total_resp = todas_respuestas.count()
+    aciertos_resp = todas_respuestas.filter(es_correcta=True).count()
+    acierto_global_pct = round((aciertos_resp / total_resp) * 100, 1) if total_resp > 0 else 0
+
+    # ── Datos para el gráfico Chart.js ────────────────────────────────────────
+    examenes_chart = list(
+        examenes_qs.order_by('fecha_finalizacion')
+        .values('fecha_finalizacion', 'puntuacion')
+    )
+    chart_labels = [
+        e['fecha_finalizacion'].strftime('%d/%m') for e in examenes_chart
+    ]
+    chart_data = [round(float(e['puntuacion']), 2) for e in examenes_chart]
+
+    # ── Últimos 10 exámenes ───────────────────────────────────────────────────
+    ultimos_examenes = list(
+        examenes_qs.select_related('oposicion').order_by('-fecha_finalizacion')[:10]
+    )
+
+    # ── Preguntas urgentes: las más falladas por este usuario ─────────────────
+    preguntas_urgentes = list(
+        RespuestaUsuario.objects
+        .filter(examen__usuario=usuario, es_correcta=False)
+        .values(
+            'pregunta__enunciado',
+            'pregunta__articulo__capitulo__titulo',
+        )
+        .annotate(veces_fallada=Count('id'))
+        .order_by('-veces_fallada')[:5]
+    )
+
+    return {
+        'total_examenes': stats['total'],
+        'puntuacion_media': puntuacion_media,
+        'puntuacion_maxima': puntuacion_maxima,
+        'acierto_global_pct': acierto_global_pct,
+        'chart_labels': json.dumps(chart_labels),
+        'chart_data': json.dumps(chart_data),
+        'ultimos_examenes': ultimos_examenes,
+        'rendimiento_por_tema': rendimiento_por_tema(usuario, oposicion_activa),
+        'tiempo_por_tema': tiempo_por_tema(usuario, oposicion_activa),
+        'preguntas_urgentes': preguntas_urgentes,
+        'recomendaciones_estudio': recomendaciones_estudio(
+            usuario, oposicion_activa, ahora=timezone.now()
+        ),
+    }
@@ -0,0 +1,169 @@
+"""Entrega de ficheros protegidos (PDF de los temas y recursos de los capítulos).
+
+Las vistas comprueban el acceso y delegan aquí el envío, que admite:
+
+- Validación por metadatos del fichero: el ETag sale del tamaño y la fecha de
+  modificación, y `Last-Modified` de esta última, así que las peticiones
+  condicionales se responden con 304 sin abrir el fichero.
+- Peticiones `Range` de un solo intervalo (206 o 416) y `If-Range`, para que
+  los visores de PDF y los reproductores de audio y vídeo puedan saltar a
+  cualquier punto. Varios intervalos se responden con el fichero completo.
+- Delegación en el proxy según `DESCARGAS_BACKEND`:
+  * `'django'` (por defecto): el propio worker lee y envía el fichero.
+  * `'x-accel'` (nginx): cabecera `X-Accel-Redirect` con la ruta bajo
+    `DESCARGAS_X_ACCEL_PREFIJO`, una `location` marcada como `internal`.
+  * `'x-sendfile'` (Apache, lighttpd): cabecera `X-Sendfile` con la ruta
+    absoluta.
+  En los dos últimos casos el proxy se encarga de los rangos y el worker de
+  gunicorn queda libre en cuanto valida el acceso.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+BACKEND_DJANGO = 'django'
+BACKEND_X_ACCEL = 'x-accel'
+BACKEND_X_SENDFILE = 'x-sendfile'
+
+TAMANO_BLOQUE = 64 * 1024
+RANGO_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag_fichero(estado) -> str:
+    return f'"{estado.st_size:x}-{estado.st_mtime_ns:x}"'
+
+
+def _rango_solicitado(request, tamano: int, etag: str, modificado: int):
+    """Intervalo (inicio, fin) pedido, `None` si hay que enviar todo o `False` si no es satisfacible.
+
+    `If-Range` solo conserva el rango si el fichero no ha cambiado; si no,
+    se envía completo.
+    """
+    cabecera = request.META.get('HTTP_RANGE', '').strip()
+    if not cabecera or not tamano:
+        # Un fichero vacío no tiene bytes que acotar: se envía entero (vacío)
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            # Comparación fuerte: los ETag débiles nunca validan un rango
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != modificado:
+            return None
+
+    coincidencia = RANGO_RE.match(cabecera.replace(' ', ''))
+    if not coincidencia:
+        # Sintaxis desconocida o varios intervalos: se ignora la cabecera
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # Sufijo: los últimos N bytes
+        longitud = int(fin)
+        if longitud == 0:
+            return False
+        return max(tamano - longitud, 0), tamano - 1
+    inicio = int(inicio)
+    if fin and int(fin) < inicio:
+        # Intervalo invertido: sintácticamente inválido, se ignora (RFC 7233 §2.1)
+        return None
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano:
+        return False
+    return inicio, fin
+
+
+def _leer_intervalo(ruta, inicio: int, longitud: int):
+    with open(ruta, 'rb') as fichero:
+        fichero.seek(inicio)
+        while longitud > 0:
+            bloque = fichero.read(min(TAMANO_BLOQUE, longitud))
+            if not bloque:
+                break
+            longitud -= len(bloque)
+            yield bloque
+
+
+def _content_disposition(nombre: str, adjunto: bool) -> str:
+    tipo = 'attachment' if adjunto else 'inline'
+    try:
+        nombre.encode('ascii')
+        return f'{tipo}; filename="{nombre}"'
+    except UnicodeEncodeError:
+        return f"{tipo}; filename*=utf-8''{quote(nombre)}"
+
+
+def servir_fichero(request, campo, adjunto: bool = False):
+    """Respuesta para el fichero de un `FileField` ya autorizado (404 si no existe)."""
+    if not campo:
+        raise Http404('El fichero no existe')
+    ruta = campo.path
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        raise Http404('El fichero no existe')
+
+    etag = etag_fichero(estado)
+    modificado = int(estado.st_mtime)
+    nombre = os.path.basename(campo.name)
+    tipo, codificacion = mimetypes.guess_type(nombre)
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if respuesta is None:
+        respuesta = _respuesta_fichero(request, campo, ruta, estado, etag, modificado)
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(modificado)
+    respuesta['Accept-Ranges'] = 'bytes'
+    # Ficheros protegidos: ningún proxy compartido debe guardarlos
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    if respuesta.status_code in (200, 206):
+        respuesta['Content-Type'] = tipo or 'application/octet-stream'
+        if codificacion:
+            respuesta['Content-Encoding'] = codificacion
+        respuesta['Content-Disposition'] = _content_disposition(nombre, adjunto)
+    return respuesta
+
+
+def _respuesta_fichero(request, campo, ruta, estado, etag, modificado):
+    backend = getattr(settings, 'DESCARGAS_BACKEND', BACKEND_DJANGO)
+    if backend == BACKEND_X_ACCEL:
+        respuesta = HttpResponse()
+        prefijo = getattr(settings, 'DESCARGAS_X_ACCEL_PREFIJO', '/protegido/')
+        respuesta['X-Accel-Redirect'] = quote(prefijo.rstrip('/') + '/' + campo.name.lstrip('/'))
+        return respuesta
+    if backend == BACKEND_X_SENDFILE:
+        respuesta = HttpResponse()
+        respuesta['X-Sendfile'] = ruta
+        return respuesta
+
+    tamano = estado.st_size
+    rango = _rango_solicitado(request, tamano, etag, modificado)
+    if rango is False:
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{tamano}'
+        return respuesta
+    if rango is None:
+        if request.method == 'HEAD':
+            respuesta = HttpResponse()
+            respuesta['Content-Length'] = str(tamano)
+            return respuesta
+        return FileResponse(open(ruta, 'rb'))
+
+    inicio, fin = rango
+    longitud = fin - inicio + 1
+    if request.method == 'HEAD':
+        respuesta = HttpResponse(status=206)
+    else:
+        respuesta = StreamingHttpResponse(_leer_intervalo(ruta, inicio, longitud), status=206)
+    respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    respuesta['Content-Length'] = str(longitud)
+    return respuesta
@@ -0,0 +1,244 @@
+"""Detección de preguntas casi duplicadas con MinHash y LSH.
+
+El texto de cada pregunta (enunciado y respuestas, normalizado sin tildes ni
+mayúsculas) se divide en shingles de `TAMANO_SHINGLE` caracteres. Su firma
+MinHash son los mínimos de `NUM_PERMUTACIONES` funciones hash sobre esos
+shingles: la fracción de posiciones iguales entre dos firmas estima la
+similitud de Jaccard de los textos.
+
+Para no comparar con todo el banco, la firma se parte en `BANDAS` bandas de
+`FILAS_POR_BANDA` valores (LSH). Cada banda se guarda como una fila
+`BandaPregunta` con el hash de sus valores, indexada por (banda, valor): dos
+preguntas son candidatas si coinciden en alguna banda, lo que se resuelve con
+`BANDAS` búsquedas por índice. Con 16 bandas de 4 filas, un par con
+similitud 0,7 es candidato con probabilidad ~0,98 y uno con 0,3 con ~0,12.
+Los candidatos se confirman comparando las firmas completas con
+`UMBRAL_SIMILITUD`.
+
+Las señales firman cada pregunta al guardarla (solo si su texto ha cambiado);
+las importaciones masivas llaman a `indexar_preguntas` y
+`python manage.py indexar_duplicados` firma las que falten.
+"""
+
+import hashlib
+import itertools
+import re
+import struct
+import unicodedata
+from random import Random
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BandaPregunta, FirmaPregunta, Pregunta
+
+CAMPOS_FIRMADOS = ('enunciado', 'respuesta_a', 'respuesta_b', 'respuesta_c', 'respuesta_d')
+TAMANO_SHINGLE = 5
+NUM_PERMUTACIONES = 64
+BANDAS = 16
+FILAS_POR_BANDA = NUM_PERMUTACIONES // BANDAS
+UMBRAL_SIMILITUD = 0.7
+# Cambiarla (o los parámetros anteriores) obliga a volver a firmar todo el banco
+VERSION_FIRMA = 1
+TAMANO_LOTE = 500
+
+_PRIMO = (1 << 61) - 1
+_MASCARA = (1 << 32) - 1
+_FORMATO_FIRMA = f'<{NUM_PERMUTACIONES}I'
+# Semilla fija: las firmas guardadas dependen de estas permutaciones
+_azar = Random(20240217)
+PERMUTACIONES = tuple(
+    (_azar.randrange(1, _PRIMO), _azar.randrange(0, _PRIMO)) for _ in range(NUM_PERMUTACIONES)
+)
+
+
+# ── Firmas ────────────────────────────────────────────────────────────────────
+
+def textos_pregunta(pregunta) -> tuple:
+    return tuple(getattr(pregunta, campo) or '' for campo in CAMPOS_FIRMADOS)
+
+
+def normalizar(texto: str) -> str:
+    """Palabras del texto en minúsculas y sin tildes, separadas por un espacio."""
+    descompuesto = unicodedata.normalize('NFKD', texto.casefold())
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', sin_tildes))
+
+
+def _hash64(datos: bytes, firmado: bool = False) -> int:
+    return int.from_bytes(hashlib.blake2b(datos, digest_size=8).digest(), 'little', signed=firmado)
+
+
+def shingles(textos) -> set:
+    texto = normalizar(' '.join(textos))
+    if len(texto) <= TAMANO_SHINGLE:
+        fragmentos = {texto} if texto else set()
+    else:
+        fragmentos = {texto[i:i + TAMANO_SHINGLE] for i in range(len(texto) - TAMANO_SHINGLE + 1)}
+    return {_hash64(fragmento.encode()) for fragmento in fragmentos}
+
+
+def firma_minhash(textos) -> tuple:
+    valores = shingles(textos)
+    if not valores:
+        return (_MASCARA,) * NUM_PERMUTACIONES
+    return tuple(
+        min(((a * x + b) % _PRIMO) & _MASCARA for x in valores) for a, b in PERMUTACIONES
+    )
+
+
+def similitud(firma_a, firma_b) -> float:
+    """Similitud de Jaccard estimada: fracción de posiciones iguales."""
+    return sum(a == b for a, b in zip(firma_a, firma_b)) / NUM_PERMUTACIONES
+
+
+def bandas(firma) -> list:
+    """(banda, valor) de las cubetas LSH de la firma."""
+    return [
+        (banda, _hash64(struct.pack(f'<H{FILAS_POR_BANDA}I', banda, *firma[inicio:inicio + FILAS_POR_BANDA]), True))
+        for banda, inicio in enumerate(range(0, NUM_PERMUTACIONES, FILAS_POR_BANDA))
+    ]
+
+
+def huella(textos) -> str:
+    return hashlib.sha256('\x00'.join((str(VERSION_FIRMA), *textos)).encode()).hexdigest()
+
+
+def codificar(firma) -> bytes:
+    return struct.pack(_FORMATO_FIRMA, *firma)
+
+
+def decodificar(datos) -> tuple:
+    return struct.unpack(_FORMATO_FIRMA, bytes(datos))
+
+
+# ── Índice ────────────────────────────────────────────────────────────────────
+
+def indexar_preguntas(preguntas) -> int:
+    """Firma las preguntas cuyo texto ha cambiado; devuelve cuántas se firmaron."""
+    preguntas = {p.pk: p for p in preguntas}
+    huellas_guardadas = dict(
+        FirmaPregunta.objects.filter(pk__in=preguntas).values_list('pregunta_id', 'huella')
+    )
+    firmas, filas_bandas = [], []
+    for pregunta_id, pregunta in preguntas.items():
+        textos = textos_pregunta(pregunta)
+        huella_actual = huella(textos)
+        if huellas_guardadas.get(pregunta_id) == huella_actual:
+            continue
+        firma = firma_minhash(textos)
+        firmas.append(FirmaPregunta(pregunta_id=pregunta_id, firma=codificar(firma), huella=huella_actual))
+        filas_bandas.extend(
+            BandaPregunta(pregunta_id=pregunta_id, banda=banda, valor=valor) for banda, valor in bandas(firma)
+        )
+    if firmas:
+        ids = [firma.pregunta_id for firma in firmas]
+        with transaction.atomic():
+            FirmaPregunta.objects.filter(pk__in=ids).delete()
+            BandaPregunta.objects.filter(pregunta_id__in=ids).delete()
+            FirmaPregunta.objects.bulk_create(firmas)
+            BandaPregunta.objects.bulk_create(filas_bandas)
+    return len(firmas)
+
+
+def indexar_pregunta(pregunta) -> None:
+    indexar_preguntas([pregunta])
+
+
+def indexar_banco(tamano_lote: int = TAMANO_LOTE) -> tuple:
+    """Recorre el banco por lotes y firma lo que falte: (revisadas, firmadas)."""
+    revisadas = firmadas = 0
+    ultimo_pk = 0
+    filas = Pregunta.objects.only('pk', *CAMPOS_FIRMADOS).order_by('pk')
+    while True:
+        # Paginación por clave: cada lote empieza tras el último pk procesado
+        lote = list(filas.filter(pk__gt=ultimo_pk)[:tamano_lote])
+        if not lote:
+            break
+        ultimo_pk = lote[-1].pk
+        revisadas += len(lote)
+        firmadas += indexar_preguntas(lote)
+    return revisadas, firmadas
+
+
+# ── Consultas ─────────────────────────────────────────────────────────────────
+
+def _firmas(ids) -> dict:
+    firmas = {}
+    ids = list(ids)
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        for pregunta_id, datos in FirmaPregunta.objects.filter(
+            pk__in=ids[inicio:inicio + TAMANO_LOTE]
+        ).values_list('pregunta_id', 'firma'):
+            firmas[pregunta_id] = decodificar(datos)
+    return firmas
+
+
+def buscar_similares(textos, excluir=None, umbral: float = UMBRAL_SIMILITUD, limite: int = 5) -> list:
+    """Preguntas del banco parecidas a `textos`, la más parecida primero.
+
+    Cada una lleva en `similitud` la similitud estimada (0-1).
+    """
+    firma = firma_minhash(textos)
+    condicion = Q()
+    for banda, valor in bandas(firma):
+        condicion |= Q(banda=banda, valor=valor)
+    candidatos = BandaPregunta.objects.filter(condicion).values_list('pregunta_id', flat=True).distinct()
+    if excluir is not None:
+        candidatos = candidatos.exclude(pregunta_id=excluir)
+
+    parecidas = sorted(
+        ((similitud(firma, otra), pregunta_id) for pregunta_id, otra in _firmas(candidatos).items()),
+        reverse=True,
+    )
+    parecidas = [(valor, pregunta_id) for valor, pregunta_id in parecidas if valor >= umbral][:limite]
+    preguntas = Pregunta.objects.select_related('articulo__capitulo__tema').in_bulk(
+        [pregunta_id for _, pregunta_id in parecidas]
+    )
+    resultado = []
+    for valor, pregunta_id in parecidas:
+        pregunta = preguntas[pregunta_id]
+        pregunta.similitud = valor
+        resultado.append(pregunta)
+    return resultado
+
+
+def grupos_duplicados(umbral: float = UMBRAL_SIMILITUD) -> list:
+    """Grupos de preguntas casi duplicadas (ids), el más numeroso primero.
+
+    Solo se comparan las preguntas que comparten alguna cubeta LSH; los pares
+    que superan el umbral se unen en grupos (union-find).
+    """
+    repetida = BandaPregunta.objects.filter(
+        banda=OuterRef('banda'), valor=OuterRef('valor'),
+    ).exclude(pk=OuterRef('pk'))
+    filas = (
+        BandaPregunta.objects.filter(Exists(repetida))
+        .order_by('banda', 'valor', 'pregunta_id')
+        .values_list('banda', 'valor', 'pregunta_id')
+    )
+    pares = set()
+    for _cubeta, miembros in itertools.groupby(filas, key=lambda fila: fila[:2]):
+        pares.update(itertools.combinations([fila[2] for fila in miembros], 2))
+
+    firmas = _firmas({pregunta_id for par in pares for pregunta_id in par})
+    padre = {}
+
+    def raiz(nodo):
+        padre.setdefault(nodo, nodo)
+        while padre[nodo] != nodo:
+            padre[nodo] = padre[padre[nodo]]
+            nodo = padre[nodo]
+        return nodo
+
+    for a, b in pares:
+        if a in firmas and b in firmas and raiz(a) != raiz(b) and similitud(firmas[a], firmas[b]) >= umbral:
+            padre[raiz(a)] = raiz(b)
+
+    grupos = {}
+    for nodo in padre:
+        grupos.setdefault(raiz(nodo), []).append(nodo)
+    return sorted(
+        (sorted(miembros) for miembros in grupos.values() if len(miembros) > 1),
+        key=lambda miembros: (-len(miembros), miembros[0]),
+    )
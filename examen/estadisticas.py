@@ -0,0 +1,328 @@
+"""Estadísticas de estudio precalculadas por usuario.
+
+El dashboard lee de `EstadisticaCapitulo` y el algoritmo adaptativo de
+exámenes de `EstadoPregunta`, en lugar de recorrer el histórico de
+`RespuestaUsuario`. Ambas tablas se mantienen de forma incremental al
+finalizar cada examen y pueden reconstruirse desde cero con
+`python manage.py reconstruir_estadisticas`.
+"""
+
+import heapq
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, FilteredRelation, Max, Q, Sum
+
+from .models import (
+    Capitulo, EstadisticaCapitulo, EstadoPregunta, Examen, RespuestaUsuario, TiempoEstudio,
+)
+from .seleccion import programar_repaso
+
+logger = logging.getLogger(__name__)
+
+# Días sin acertar a partir de los cuales un capítulo se considera olvidado
+DIAS_OLVIDO = 30
+# Prioridad de los capítulos que el usuario aún no ha respondido nunca
+PUNTUACION_INEXPLORADO = 40.0
+# Tamaño de lote para las inserciones masivas
+TAMANO_LOTE = 500
+
+
+def _filas_bloqueadas(modelo, usuario_id, campo, ids) -> dict:
+    """Filas del usuario para los ids indicados, creadas si faltan y bloqueadas.
+
+    El INSERT ignora las filas que ya existen o que otra transacción está
+    creando a la vez, y `select_for_update` espera a que termine la
+    transacción concurrente (otro examen del mismo usuario finalizado a la
+    vez), así que lo leído ya incluye sus cambios. Las filas se bloquean en el
+    mismo orden en todas las transacciones para no provocar interbloqueos.
+    Debe llamarse dentro de una transacción.
+    """
+    modelo.objects.bulk_create(
+        [modelo(usuario_id=usuario_id, **{campo: id_}) for id_ in ids],
+        batch_size=TAMANO_LOTE, ignore_conflicts=True,
+    )
+    return {
+        getattr(fila, campo): fila
+        for fila in (
+            modelo.objects.select_for_update()
+            .filter(usuario_id=usuario_id, **{f'{campo}__in': ids})
+            .order_by(campo)
+        )
+    }
+
+
+@transaction.atomic
+def actualizar_estadisticas_capitulos(examen) -> None:
+    """Suma las respuestas de un examen recién finalizado al acumulado por capítulo."""
+    resumen = {
+        fila['capitulo_id']: (
+            fila['total'],
+            fila['fallos'],
+            examen.fecha_finalizacion if fila['total'] > fila['fallos'] else None,
+        )
+        for fila in (
+            examen.respuestas_usuario
+            .values(capitulo_id=F('pregunta__articulo__capitulo_id'))
+            .annotate(
+                total=Count('id'),
+                fallos=Count('id', filter=Q(es_correcta=False)),
+            )
+        )
+    }
+    if not resumen:
+        return
+
+    estadisticas = _filas_bloqueadas(EstadisticaCapitulo, examen.usuario_id, 'capitulo_id', resumen.keys())
+    for capitulo_id, (total, fallos, fecha_acierto) in resumen.items():
+        estadistica = estadisticas[capitulo_id]
+        estadistica.total_respuestas += total
+        estadistica.total_fallos += fallos
+        if fecha_acierto and (
+            estadistica.fecha_ultimo_acierto is None
+            or fecha_acierto > estadistica.fecha_ultimo_acierto
+        ):
+            estadistica.fecha_ultimo_acierto = fecha_acierto
+
+    EstadisticaCapitulo.objects.bulk_update(
+        estadisticas.values(),
+        ['total_respuestas', 'total_fallos', 'fecha_ultimo_acierto'],
+        batch_size=TAMANO_LOTE,
+    )
+
+
+@transaction.atomic
+def reconstruir_estadisticas_capitulos(usuario=None) -> int:
+    """Recalcula `EstadisticaCapitulo` a partir de los exámenes finalizados.
+
+    Si se indica `usuario` solo se reconstruyen sus filas. Devuelve el número
+    de filas creadas.
+    """
+    estadisticas = EstadisticaCapitulo.objects.all()
+    respuestas = RespuestaUsuario.objects.filter(examen__fecha_finalizacion__isnull=False)
+    if usuario is not None:
+        estadisticas = estadisticas.filter(usuario=usuario)
+        respuestas = respuestas.filter(examen__usuario=usuario)
+    estadisticas.delete()
+
+    filas = (
+        respuestas
+        .values(
+            usuario_id=F('examen__usuario_id'),
+            capitulo_id=F('pregunta__articulo__capitulo_id'),
+        )
+        .annotate(
+            total=Count('id'),
+            fallos=Count('id', filter=Q(es_correcta=False)),
+            ultimo_acierto=Max('examen__fecha_finalizacion', filter=Q(es_correcta=True)),
+        )
+        .order_by()
+    )
+    creadas = EstadisticaCapitulo.objects.bulk_create(
+        (
+            EstadisticaCapitulo(
+                usuario_id=fila['usuario_id'],
+                capitulo_id=fila['capitulo_id'],
+                total_respuestas=fila['total'],
+                total_fallos=fila['fallos'],
+                fecha_ultimo_acierto=fila['ultimo_acierto'],
+            )
+            for fila in filas.iterator()
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    logger.info('Estadísticas por capítulo reconstruidas: %d filas.', len(creadas))
+    return len(creadas)
+
+
+CAMPOS_ESTADO = [
+    'veces_vista', 'veces_fallada', 'fecha_ultima_respuesta', 'fecha_ultimo_acierto',
+    'ultima_correcta', 'repeticiones', 'intervalo_dias', 'facilidad', 'fecha_proxima_revision',
+]
+
+
+def _registrar_respuesta(estado, correcta: bool, fecha) -> None:
+    """Aplica una respuesta al estado de la pregunta, incluida su planificación SM-2."""
+    estado.fecha_ultima_respuesta = fecha
+    estado.ultima_correcta = correcta
+    if correcta:
+        estado.fecha_ultimo_acierto = fecha
+    else:
+        estado.veces_fallada += 1
+    programar_repaso(estado, correcta, fecha)
+
+
+@transaction.atomic
+def actualizar_estado_preguntas(examen) -> None:
+    """Actualiza la memoria por pregunta del usuario con un examen recién finalizado.
+
+    Las filas se bloquean antes de calcular el nuevo estado SM-2, de modo que
+    dos exámenes del mismo usuario finalizados a la vez se aplican uno tras otro.
+    """
+    fecha = examen.fecha_finalizacion
+    respuestas = dict(examen.respuestas_usuario.values_list('pregunta_id', 'es_correcta'))
+    pregunta_ids = set(examen.preguntas.values_list('id', flat=True)) | respuestas.keys()
+    if not pregunta_ids:
+        return
+
+    estados = _filas_bloqueadas(EstadoPregunta, examen.usuario_id, 'pregunta_id', pregunta_ids)
+    for pregunta_id, estado in estados.items():
+        estado.veces_vista += 1
+        if pregunta_id in respuestas:
+            _registrar_respuesta(estado, respuestas[pregunta_id], fecha)
+
+    EstadoPregunta.objects.bulk_update(estados.values(), CAMPOS_ESTADO, batch_size=TAMANO_LOTE)
+
+
+@transaction.atomic
+def reconstruir_estado_preguntas(usuario=None) -> int:
+    """Recalcula `EstadoPregunta` a partir de los exámenes finalizados.
+
+    Se procesa un usuario cada vez para no cargar en memoria el estado de
+    todos. Devuelve el número de filas creadas.
+    """
+    estados = EstadoPregunta.objects.all()
+    examenes = Examen.objects.filter(fecha_finalizacion__isnull=False)
+    if usuario is not None:
+        estados = estados.filter(usuario=usuario)
+        examenes = examenes.filter(usuario=usuario)
+    estados.delete()
+
+    creadas = 0
+    for usuario_id in examenes.order_by().values_list('usuario_id', flat=True).distinct():
+        finalizados = {
+            'examen__usuario_id': usuario_id,
+            'examen__fecha_finalizacion__isnull': False,
+        }
+        por_pregunta = {
+            fila['pregunta_id']: EstadoPregunta(
+                usuario_id=usuario_id, pregunta_id=fila['pregunta_id'], veces_vista=fila['vistas']
+            )
+            for fila in (
+                Examen.preguntas.through.objects.filter(**finalizados)
+                .values('pregunta_id').annotate(vistas=Count('id')).order_by()
+            )
+        }
+        # Las respuestas se reproducen en orden para recalcular la planificación SM-2
+        respuestas = (
+            RespuestaUsuario.objects.filter(**finalizados)
+            .order_by('examen__fecha_finalizacion', 'examen_id')
+            .values_list('pregunta_id', 'es_correcta', 'examen__fecha_finalizacion')
+        )
+        for pregunta_id, correcta, fecha in respuestas.iterator():
+            estado = por_pregunta.get(pregunta_id)
+            if estado is None:
+                estado = por_pregunta[pregunta_id] = EstadoPregunta(
+                    usuario_id=usuario_id, pregunta_id=pregunta_id
+                )
+            _registrar_respuesta(estado, correcta, fecha)
+        creadas += len(EstadoPregunta.objects.bulk_create(por_pregunta.values(), batch_size=TAMANO_LOTE))
+
+    logger.info('Estado por pregunta reconstruido: %d filas.', creadas)
+    return creadas
+
+
+def puntuacion_recomendacion(total, fallos, fecha_ultimo_acierto, ahora) -> float:
+    """Prioridad de repaso de un capítulo: 60% tasa de fallo y 40% tiempo sin acertar."""
+    if not total:
+        return PUNTUACION_INEXPLORADO
+    pct_fallo = (fallos / total) * 100.0
+    if fecha_ultimo_acierto:
+        dias_sin_acierto = (ahora - fecha_ultimo_acierto).days
+    else:
+        dias_sin_acierto = DIAS_OLVIDO
+    olvido_normalizado = min(dias_sin_acierto / DIAS_OLVIDO, 1.0) * 100.0
+    return (pct_fallo * 0.6) + (olvido_normalizado * 0.4)
+
+
+def recomendaciones_estudio(usuario, oposicion, ahora, limite: int = 3) -> list:
+    """Capítulos con mayor prioridad de repaso, calculados en una sola consulta."""
+    capitulos = Capitulo.objects.select_related('tema')
+    if oposicion:
+        capitulos = capitulos.filter(tema__oposiciones=oposicion)
+    capitulos = capitulos.alias(
+        estadistica=FilteredRelation(
+            'estadisticas_usuarios',
+            condition=Q(estadisticas_usuarios__usuario=usuario),
+        ),
+    ).annotate(
+        est_total=F('estadistica__total_respuestas'),
+        est_fallos=F('estadistica__total_fallos'),
+        est_ultimo_acierto=F('estadistica__fecha_ultimo_acierto'),
+    )
+
+    recomendaciones = (
+        {
+            'capitulo': capitulo,
+            'score': puntuacion_recomendacion(
+                capitulo.est_total, capitulo.est_fallos, capitulo.est_ultimo_acierto, ahora
+            ),
+        }
+        for capitulo in capitulos
+    )
+    return heapq.nlargest(limite, recomendaciones, key=lambda x: x['score'])
+
+
+def clase_rendimiento(pct: int) -> str:
+    """Clase de color Bootstrap según el porcentaje de acierto."""
+    return 'success' if pct >= 75 else ('warning' if pct >= 50 else 'danger')
+
+
+def rendimiento_por_tema(usuario, oposicion) -> list:
+    """% de acierto por tema agregado en una sola consulta sobre `EstadisticaCapitulo`.
+
+    Devuelve filas `{'nombre', 'pct', 'clase'}` ordenadas de peor a mejor
+    porcentaje; los temas sin respuestas no aparecen.
+    """
+    estadisticas = EstadisticaCapitulo.objects.filter(usuario=usuario, total_respuestas__gt=0)
+    if oposicion:
+        estadisticas = estadisticas.filter(capitulo__tema__oposiciones=oposicion)
+    filas = (
+        estadisticas
+        .values(
+            tema_id=F('capitulo__tema_id'),
+            tema_titulo=F('capitulo__tema__titulo'),
+            tema_orden=F('capitulo__tema__orden'),
+        )
+        .annotate(total=Sum('total_respuestas'), fallos=Sum('total_fallos'))
+        .order_by('tema_orden', 'tema_titulo')
+    )
+
+    rendimiento = []
+    for fila in filas:
+        pct = round(((fila['total'] - fila['fallos']) / fila['total']) * 100)
+        rendimiento.append({
+            'nombre': fila['tema_titulo'][:35],
+            'pct': pct,
+            'clase': clase_rendimiento(pct),
+        })
+    rendimiento.sort(key=lambda x: x['pct'])
+    return rendimiento
+
+
+def tiempo_por_tema(usuario, oposicion) -> list:
+    """Minutos de estudio por tema sumados en una consulta sobre `TiempoEstudio`.
+
+    Devuelve filas `{'nombre', 'minutos', 'pct'}` de más a menos tiempo, con
+    `pct` relativo al tema más estudiado; los temas sin tiempo no aparecen.
+    """
+    tiempos = TiempoEstudio.objects.filter(usuario=usuario)
+    if oposicion:
+        tiempos = tiempos.filter(capitulo__tema__oposiciones=oposicion)
+    filas = list(
+        tiempos
+        .values(tema_id=F('capitulo__tema_id'), tema_titulo=F('capitulo__tema__titulo'))
+        .annotate(segundos=Sum('segundos'))
+        .order_by('-segundos', 'tema_titulo')
+    )
+    if not filas:
+        return []
+    maximo = filas[0]['segundos']
+    return [
+        {
+            'nombre': fila['tema_titulo'][:35],
+            'minutos': round(fila['segundos'] / 60),
+            'pct': round(fila['segundos'] / maximo * 100),
+        }
+        for fila in filas
+    ]
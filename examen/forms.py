@@ -3,6 +3,8 @@
 from django import forms
 from django.utils.translation import gettext_lazy as _
 
+from .duplicados import CAMPOS_FIRMADOS, buscar_similares
+from .importacion import formato_por_nombre
 from .models import Oposicion, Tema, Capitulo, Articulo, Pregunta
 
 
@@ -20,6 +22,10 @@ class PreguntaStaffForm(forms.ModelForm):
     Incorpora campos de navegación (oposicion_selector, tema_selector,
     capitulo_selector) que NO se persisten en base de datos; se usan para
     filtrar en cascada el campo `articulo` vía AJAX desde el frontend.
+
+    Antes de guardar busca en el banco preguntas casi iguales (ver
+    `examen.duplicados`); si las hay, el formulario no es válido hasta que se
+    marca `guardar_duplicado`. Las encontradas quedan en `self.similares`.
     """
 
     # --- Campos de navegación en cascada (no son campos del modelo) ---
@@ -46,6 +52,11 @@ class PreguntaStaffForm(forms.ModelForm):
         }),
         help_text=_('Filtra los artículos disponibles según el capítulo.'),
     )
+    guardar_duplicado = forms.BooleanField(
+        label=_('Guardar aunque se parezca a otras preguntas del banco'),
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
 
     class Meta:
         model = Pregunta
@@ -142,3 +153,60 @@ class PreguntaStaffForm(forms.ModelForm):
                 self.fields['articulo'].widget.attrs.pop('disabled', None)
             except (ValueError, TypeError):
                 pass
+
+        self.similares = []
+
+    def clean(self):
+        datos = super().clean()
+        textos = [datos.get(campo) for campo in CAMPOS_FIRMADOS]
+        if all(textos) and not datos.get('guardar_duplicado'):
+            self.similares = buscar_similares(textos, excluir=self.instance.pk)
+            if self.similares:
+                raise forms.ValidationError(
+                    _('Hay preguntas muy parecidas en el banco. Revísalas o marca la casilla para guardarla igualmente.'),
+                    code='duplicada',
+                )
+        return datos
+
+
+class ImportarPreguntasForm(forms.Form):
+    """Subida de un fichero de preguntas para la importación masiva."""
+
+    FORMATO_AUTOMATICO = ''
+    FORMATOS = [
+        (FORMATO_AUTOMATICO, _('Según la extensión')),
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+        ('jsonl', 'JSON Lines'),
+        ('md', 'Markdown'),
+    ]
+
+    oposicion = forms.ModelChoiceField(
+        queryset=Oposicion.objects.order_by('nombre'),
+        label=_('Oposición'),
+        empty_label=_('-- Elige una oposición --'),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        help_text=_('Los artículos se buscan en el temario de esta oposición.'),
+    )
+    archivo = forms.FileField(
+        label=_('Fichero'),
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.json,.jsonl,.ndjson,.md'}),
+    )
+    formato = forms.ChoiceField(
+        label=_('Formato'), choices=FORMATOS, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    simular = forms.BooleanField(
+        label=_('Solo validar (no guarda nada)'), required=False, initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
+    def clean(self):
+        datos = super().clean()
+        archivo = datos.get('archivo')
+        if archivo and not datos.get('formato'):
+            formato = formato_por_nombre(archivo.name)
+            if formato is None:
+                self.add_error('formato', _('No se reconoce la extensión del fichero: elige el formato.'))
+            datos['formato'] = formato
+        return datos
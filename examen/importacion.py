@@ -0,0 +1,316 @@
+"""Importación masiva de preguntas desde CSV, JSON, JSON Lines o Markdown.
+
+El fichero se lee en streaming, fila a fila, y se procesa por lotes: cada
+lote se valida en memoria y las filas válidas se insertan con un único
+`bulk_create`. Las referencias al artículo se resuelven con un mapa
+(tema, capítulo, número) → artículo construido una vez por importación con
+una sola consulta; tema y capítulo pueden indicarse por título o por número
+de orden, y el artículo con o sin el prefijo "Art.".
+
+Campos de cada pregunta: `tema`, `capitulo`, `articulo`, `enunciado`,
+`respuesta_a` … `respuesta_d`, `respuesta_correcta` (A-D) y `explicacion`
+(opcional).
+
+Formato Markdown: bloques separados por una línea `---`:
+
+    @ Tema 1 | Capítulo I | Art. 14
+    ¿Enunciado de la pregunta? (puede ocupar varias líneas)
+    A) Primera opción
+    B) Segunda opción
+    C) Tercera opción
+    D) Cuarta opción
+    Correcta: B
+    Explicación: texto opcional hasta el final del bloque.
+
+`bulk_create` no ejecuta `save()` ni las señales, así que aquí se renderiza
+el Markdown de cada pregunta, se indexan en la búsqueda, se firman para la
+detección de duplicados y se invalidan los pools de preguntas al terminar.
+
+Con `simular=True` se valida todo sin escribir nada.
+"""
+
+import csv
+import json
+import re
+
+from django.db import transaction
+
+from . import busqueda, duplicados
+from .models import Articulo, DocumentoBusqueda, Pregunta
+from .muestreo import invalidar_pools
+
+FORMATOS = ('csv', 'json', 'jsonl', 'md')
+CAMPOS_TEXTO = ('enunciado', 'respuesta_a', 'respuesta_b', 'respuesta_c', 'respuesta_d')
+LETRAS = frozenset(Pregunta.OpcionesRespuesta.values)
+TAMANO_LOTE = 500
+# Errores que se muestran en el panel de staff (el comando puede volcarlos todos)
+MAX_ERRORES_MOSTRADOS = 200
+# Referencia compartida por varios artículos (p. ej. dos temas con el mismo orden)
+AMBIGUA = object()
+
+
+class ErrorImportacion(Exception):
+    """El fichero no se puede leer con el formato indicado."""
+
+
+class ResultadoImportacion:
+    """Resumen de una importación: filas leídas, insertadas y errores por fila."""
+
+    def __init__(self, simulacion: bool):
+        self.simulacion = simulacion
+        self.leidas = 0
+        self.validas = 0
+        self.importadas = 0
+        self.errores = []   # [(fila, mensaje)]
+
+    @property
+    def con_errores(self) -> int:
+        return len({fila for fila, _ in self.errores})
+
+
+# ── Lectores en streaming ─────────────────────────────────────────────────────
+# Cada lector es un generador de (número de fila, dict con los campos).
+
+def leer_csv(flujo):
+    lector = csv.DictReader(flujo)
+    for datos in lector:
+        # La fila física tras la cabecera (las celdas multilínea cuentan como una)
+        yield lector.line_num, datos
+
+
+def leer_jsonl(flujo):
+    for numero, linea in enumerate(flujo, start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except json.JSONDecodeError as error:
+            yield numero, ErrorImportacion(f'JSON inválido: {error.msg}')
+
+
+def leer_json(flujo, tamano_bloque: int = 64 * 1024):
+    """Lee un array JSON de objetos sin cargar el fichero completo.
+
+    Se decodifica objeto a objeto con `raw_decode` sobre un búfer que solo
+    retiene el texto aún no consumido.
+    """
+    decodificador = json.JSONDecoder()
+    bufer = ''
+    posicion = 0
+    abierto = False
+    numero = 0
+    fin_fichero = False
+    while True:
+        # Saltar espacios, la apertura del array y las comas entre objetos
+        while True:
+            while posicion < len(bufer) and bufer[posicion] in ' \t\r\n,':
+                posicion += 1
+            if posicion < len(bufer) or fin_fichero:
+                break
+            bloque = flujo.read(tamano_bloque)
+            bufer, posicion = bufer[posicion:] + bloque, 0
+            fin_fichero = not bloque
+        if posicion >= len(bufer):
+            if abierto:
+                raise ErrorImportacion('El array JSON no está cerrado.')
+            return
+        if not abierto:
+            if bufer[posicion] != '[':
+                raise ErrorImportacion('Se esperaba un array JSON de preguntas.')
+            abierto = True
+            posicion += 1
+            continue
+        if bufer[posicion] == ']':
+            return
+        try:
+            objeto, fin = decodificador.raw_decode(bufer, posicion)
+        except json.JSONDecodeError as error:
+            if fin_fichero:
+                raise ErrorImportacion(f'JSON inválido tras el elemento {numero}: {error.msg}')
+            bloque = flujo.read(tamano_bloque)
+            bufer, posicion = bufer[posicion:] + bloque, 0
+            fin_fichero = not bloque
+            continue
+        numero += 1
+        posicion = fin
+        yield numero, objeto
+
+
+def leer_markdown(flujo):
+    bloque, inicio = [], 1
+    for numero, linea in enumerate(flujo, start=1):
+        if linea.strip() == '---':
+            if any(l.strip() for l in bloque):
+                yield inicio, _bloque_markdown(bloque)
+            bloque, inicio = [], numero + 1
+        else:
+            bloque.append(linea.rstrip('\n'))
+    if any(l.strip() for l in bloque):
+        yield inicio, _bloque_markdown(bloque)
+
+
+OPCION_MD = re.compile(r'^([A-D])\)\s*(.*)$')
+
+
+def _bloque_markdown(lineas) -> dict:
+    datos = {}
+    campo = 'enunciado'
+    partes = {'enunciado': []}
+    for linea in lineas:
+        if not datos and linea.startswith('@'):
+            referencia = [p.strip() for p in linea[1:].split('|')]
+            datos.update(zip(('tema', 'capitulo', 'articulo'), referencia))
+            continue
+        opcion = OPCION_MD.match(linea) if campo != 'explicacion' else None
+        if opcion:
+            campo = f'respuesta_{opcion.group(1).lower()}'
+            partes[campo] = [opcion.group(2)]
+        elif campo != 'explicacion' and linea.lower().startswith('correcta:'):
+            datos['respuesta_correcta'] = linea.split(':', 1)[1].strip()
+        elif linea.lower().startswith(('explicación:', 'explicacion:')):
+            campo = 'explicacion'
+            partes[campo] = [linea.split(':', 1)[1].strip()]
+        else:
+            partes.setdefault(campo, []).append(linea)
+    datos.update({c: '\n'.join(texto).strip() for c, texto in partes.items()})
+    return datos
+
+
+LECTORES = {'csv': leer_csv, 'json': leer_json, 'jsonl': leer_jsonl, 'md': leer_markdown}
+
+
+def contar_filas(flujo, formato: str, hasta: int) -> int:
+    """Filas del fichero, sin validarlas, contando como mucho hasta `hasta`.
+
+    Solo lee el fichero: sirve para rechazar los que son demasiado grandes
+    antes de empezar. Un error de lectura detiene la cuenta.
+    """
+    filas = 0
+    try:
+        for _fila in LECTORES[formato](flujo):
+            filas += 1
+            if filas >= hasta:
+                break
+    except (ErrorImportacion, UnicodeDecodeError, csv.Error):
+        pass
+    return filas
+
+
+def formato_por_nombre(nombre: str):
+    """Formato deducido de la extensión del fichero (None si no se reconoce)."""
+    extension = nombre.rsplit('.', 1)[-1].lower() if '.' in nombre else ''
+    return {'markdown': 'md', 'ndjson': 'jsonl'}.get(extension, extension if extension in FORMATOS else None)
+
+
+# ── Referencias a artículos ───────────────────────────────────────────────────
+
+def _clave(valor) -> str:
+    return ' '.join(str(valor or '').split()).casefold()
+
+
+def _clave_articulo(valor) -> str:
+    return re.sub(r'^(art[íi]culo|art\.?)\s*', '', _clave(valor))
+
+
+def mapa_articulos(oposicion) -> dict:
+    """(tema, capítulo, número) → artículo, con tema y capítulo por título o por orden."""
+    mapa = {}
+    filas = Articulo.objects.filter(capitulo__tema__oposiciones=oposicion).values_list(
+        'id', 'capitulo_id', 'numero',
+        'capitulo__titulo', 'capitulo__orden', 'capitulo__tema__titulo', 'capitulo__tema__orden',
+    )
+    for articulo_id, capitulo_id, numero, cap_titulo, cap_orden, tema_titulo, tema_orden in filas:
+        articulo = Articulo(pk=articulo_id, capitulo_id=capitulo_id)
+        for tema in {_clave(tema_titulo), str(tema_orden)}:
+            for capitulo in {_clave(cap_titulo), str(cap_orden)}:
+                clave = (tema, capitulo, _clave_articulo(numero))
+                mapa[clave] = AMBIGUA if clave in mapa else articulo
+    return mapa
+
+
+# ── Validación e inserción ────────────────────────────────────────────────────
+
+def validar_fila(datos, mapa):
+    """Devuelve (pregunta sin guardar, []) o (None, [mensajes de error])."""
+    if isinstance(datos, ErrorImportacion):
+        return None, [str(datos)]
+    if not isinstance(datos, dict):
+        return None, ['Cada elemento debe ser un objeto con los campos de la pregunta.']
+
+    errores = []
+    textos = {campo: str(datos.get(campo) or '').strip() for campo in CAMPOS_TEXTO}
+    for campo, texto in textos.items():
+        if not texto:
+            errores.append(f'Falta el campo "{campo}".')
+    correcta = str(datos.get('respuesta_correcta') or '').strip().upper()
+    if correcta not in LETRAS:
+        errores.append(f'Respuesta correcta inválida: "{correcta}" (debe ser A, B, C o D).')
+
+    clave = (_clave(datos.get('tema')), _clave(datos.get('capitulo')), _clave_articulo(datos.get('articulo')))
+    articulo = mapa.get(clave)
+    if articulo is None:
+        errores.append(
+            f'No existe el artículo "{datos.get("articulo")}" del capítulo '
+            f'"{datos.get("capitulo")}" en el tema "{datos.get("tema")}".'
+        )
+    elif articulo is AMBIGUA:
+        errores.append('La referencia al artículo es ambigua: indica tema y capítulo por su título.')
+    if errores:
+        return None, errores
+
+    pregunta = Pregunta(
+        articulo=articulo, respuesta_correcta=correcta,
+        explicacion=str(datos.get('explicacion') or '').strip() or None,
+        **textos,
+    )
+    pregunta.actualizar_html()
+    return pregunta, []
+
+
+def _insertar(preguntas) -> None:
+    with transaction.atomic():
+        creadas = Pregunta.objects.bulk_create(preguntas)
+        DocumentoBusqueda.objects.bulk_create(
+            [busqueda.documento_pregunta(pregunta) for pregunta in creadas]
+        )
+        duplicados.indexar_preguntas(creadas)
+
+
+def importar_preguntas(flujo, formato: str, oposicion, simular: bool = False,
+                       tamano_lote: int = TAMANO_LOTE) -> ResultadoImportacion:
+    """Importa las preguntas de `flujo` (texto) al temario de `oposicion`."""
+    if formato not in LECTORES:
+        raise ErrorImportacion(f'Formato no soportado: {formato}')
+    resultado = ResultadoImportacion(simular)
+    mapa = mapa_articulos(oposicion)
+
+    lote = []
+    filas = LECTORES[formato](flujo)
+    while True:
+        try:
+            numero, datos = next(filas)
+        except StopIteration:
+            break
+        except (ErrorImportacion, UnicodeDecodeError, csv.Error) as error:
+            # Error de lectura: no se puede seguir, pero lo ya validado se conserva
+            resultado.errores.append((resultado.leidas + 1, f'Lectura interrumpida: {error}'))
+            break
+        resultado.leidas += 1
+        pregunta, errores = validar_fila(datos, mapa)
+        resultado.errores.extend((numero, mensaje) for mensaje in errores)
+        if pregunta is None:
+            continue
+        resultado.validas += 1
+        lote.append(pregunta)
+        if len(lote) >= tamano_lote:
+            if not simular:
+                _insertar(lote)
+                resultado.importadas += len(lote)
+            lote = []
+    if lote and not simular:
+        _insertar(lote)
+        resultado.importadas += len(lote)
+
+    if resultado.importadas:
+        invalidar_pools()
+    return resultado
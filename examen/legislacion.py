@@ -0,0 +1,253 @@
+"""Carga masiva de una ley consolidada en los capítulos y artículos de un tema.
+
+`leer_ley` divide un texto plano o Markdown (como el consolidado del BOE) en
+capítulos y artículos:
+
+- `CAPÍTULO I`, `Capítulo primero. Título` o con el título en la línea
+  siguiente abren un capítulo. Los artículos anteriores al primero van al
+  capítulo `CAPITULO_PRELIMINAR`.
+- `Artículo 14.`, `Art. 14 bis. Epígrafe` abren un artículo; el epígrafe se
+  guarda en negrita al comienzo del contenido.
+- Las disposiciones (adicionales, transitorias, derogatorias y finales) se
+  cargan como artículos de un capítulo `CAPITULO_DISPOSICIONES`.
+- Las líneas de `TÍTULO`, `LIBRO` y `Sección` solo estructuran el texto y
+  se descartan. En Markdown se ignoran las marcas `#` y `**` de los
+  encabezados.
+
+`cargar_ley` compara el resultado con lo que ya hay en el tema y escribe solo
+las diferencias con `bulk_create`/`bulk_update`: un artículo se reescribe
+únicamente si cambia la huella de su contenido (`huella_textos`, la misma
+que decide si hay que volver a renderizar el Markdown). Si el tema ya tenía
+artículos, los capítulos con artículos nuevos o modificados se marcan como
+modificación reciente con la fecha de actualización indicada.
+
+Los artículos que ya no aparecen en el texto no se borran (arrastrarían sus
+preguntas): se informan para revisarlos a mano.
+"""
+
+import re
+from datetime import date
+
+from django.db import transaction
+
+from . import busqueda
+from .condicional import invalidar_capitulo
+from .models import Articulo, Capitulo
+from .renderizado import huella_textos
+from .temario import invalidar_temario
+
+CAPITULO_PRELIMINAR = 'Preliminar'
+CAPITULO_DISPOSICIONES = 'Disposiciones'
+MAX_NUMERO = Articulo._meta.get_field('numero').max_length
+MAX_TITULO = Capitulo._meta.get_field('titulo').max_length
+
+_SEPARADOR = r'\s*[.:\-–—]?\s*'
+CAPITULO_RE = re.compile(r'^cap[íi]tulo\s+([\wáéíóúü]+)' + _SEPARADOR + r'(.*)$', re.IGNORECASE)
+ARTICULO_RE = re.compile(
+    r'^(?:art[íi]culo|art\.)\s*(\d+(?:\s*(?:bis|ter|quater|quinquies|sexies|septies|octies))?)'
+    + _SEPARADOR + r'(.*)$',
+    re.IGNORECASE,
+)
+DISPOSICION_RE = re.compile(
+    r'^(disposici[óo]n\s+(?:adicional|transitoria|derogatoria|final)(?:\s+(?!\d)[\wáéíóú]+)?)'
+    + _SEPARADOR + r'(.*)$',
+    re.IGNORECASE,
+)
+ESTRUCTURA_RE = re.compile(r'^(t[íi]tulo|libro|secci[óo]n)\s+[\wáéíóú]+\b', re.IGNORECASE)
+
+
+class CapituloLeido:
+    __slots__ = ('titulo', 'articulos')
+
+    def __init__(self, titulo):
+        self.titulo = titulo
+        self.articulos = []   # [(numero, contenido)]
+
+
+class ResultadoCarga:
+    """Resumen de la carga: contadores y capítulos marcados como modificados."""
+
+    def __init__(self, simulacion: bool):
+        self.simulacion = simulacion
+        self.capitulos_nuevos = 0
+        self.articulos_nuevos = 0
+        self.articulos_modificados = 0
+        self.articulos_sin_cambios = 0
+        self.capitulos_marcados = []   # títulos
+        self.articulos_ausentes = []   # (capítulo, número) que ya no están en el texto
+
+
+# ── Lectura del texto ─────────────────────────────────────────────────────────
+
+def _limpiar(linea: str) -> str:
+    """Quita las marcas Markdown de encabezado y énfasis de una línea."""
+    linea = linea.strip().lstrip('#').replace('**', '').replace('__', '')
+    return ' '.join(linea.split())
+
+
+def _texto(lineas) -> str:
+    return '\n'.join(lineas).strip()
+
+
+def leer_ley(flujo) -> list:
+    """Divide el texto en `CapituloLeido`s con sus artículos, en orden de aparición."""
+    capitulos = []
+    capitulo = None
+    numero, epigrafe, cuerpo = None, '', []
+    nombre_pendiente = False
+
+    def cerrar_articulo():
+        if capitulo is not None and numero is not None:
+            contenido = _texto(cuerpo)
+            if epigrafe:
+                contenido = f'**{epigrafe}**\n\n{contenido}'.strip()
+            capitulo.articulos.append((numero, contenido))
+
+    def abrir_capitulo(titulo):
+        nuevo = CapituloLeido(titulo[:MAX_TITULO])
+        capitulos.append(nuevo)
+        return nuevo
+
+    for bruta in flujo:
+        linea = _limpiar(bruta)
+        if nombre_pendiente and linea:
+            nombre_pendiente = False
+            if not (CAPITULO_RE.match(linea) or ARTICULO_RE.match(linea)
+                    or DISPOSICION_RE.match(linea) or ESTRUCTURA_RE.match(linea)):
+                capitulo.titulo = f'{capitulo.titulo}. {linea}'[:MAX_TITULO]
+                continue
+
+        encabezado = CAPITULO_RE.match(linea)
+        if encabezado:
+            cerrar_articulo()
+            numero, cuerpo = None, []
+            etiqueta = f'Capítulo {encabezado.group(1)}'
+            nombre = encabezado.group(2).strip()
+            capitulo = abrir_capitulo(f'{etiqueta}. {nombre}' if nombre else etiqueta)
+            nombre_pendiente = not nombre
+            continue
+
+        articulo = ARTICULO_RE.match(linea)
+        disposicion = None if articulo else DISPOSICION_RE.match(linea)
+        if articulo or disposicion:
+            cerrar_articulo()
+            if articulo:
+                numero = ' '.join(articulo.group(1).lower().split())
+                if capitulo is None:
+                    capitulo = abrir_capitulo(CAPITULO_PRELIMINAR)
+            else:
+                numero = ' '.join(disposicion.group(1).split()).capitalize()
+                if capitulo is None or capitulo.titulo != CAPITULO_DISPOSICIONES:
+                    capitulo = abrir_capitulo(CAPITULO_DISPOSICIONES)
+            numero = numero[:MAX_NUMERO]
+            epigrafe = (articulo or disposicion).group(2).strip()
+            cuerpo = []
+            continue
+
+        if ESTRUCTURA_RE.match(linea) and not cuerpo:
+            continue
+        if numero is not None:
+            cuerpo.append(bruta.rstrip())
+
+    cerrar_articulo()
+    return [c for c in capitulos if c.articulos]
+
+
+# ── Carga en la base de datos ─────────────────────────────────────────────────
+
+def cargar_ley(flujo, tema, fecha_actualizacion: date = None, simular: bool = False) -> ResultadoCarga:
+    """Sincroniza los capítulos y artículos de `tema` con el texto de la ley."""
+    resultado = ResultadoCarga(simular)
+    fecha_actualizacion = fecha_actualizacion or date.today()
+    leidos = leer_ley(flujo)
+
+    existentes = {c.titulo: c for c in Capitulo.objects.filter(tema=tema)}
+    articulos = {
+        (a.capitulo_id, a.numero): a
+        for a in Articulo.objects.filter(capitulo__tema=tema).only('pk', 'capitulo_id', 'numero', 'huella_html')
+    }
+    tema_con_contenido = bool(articulos)
+
+    nuevos_capitulos, capitulos_reordenados = [], []
+    for orden, leido in enumerate(leidos, start=1):
+        capitulo = existentes.get(leido.titulo)
+        if capitulo is None:
+            capitulo = Capitulo(tema=tema, titulo=leido.titulo, orden=orden)
+            nuevos_capitulos.append(capitulo)
+            existentes[leido.titulo] = capitulo
+        elif capitulo.orden != orden:
+            capitulo.orden = orden
+            capitulos_reordenados.append(capitulo)
+    resultado.capitulos_nuevos = len(nuevos_capitulos)
+
+    with transaction.atomic():
+        if not simular:
+            Capitulo.objects.bulk_create(nuevos_capitulos)
+            Capitulo.objects.bulk_update(capitulos_reordenados, ['orden'])
+
+        nuevos, modificados, marcados = [], [], []
+        vistos = set()   # (capítulo, número) de los artículos existentes presentes en el texto
+        for leido in leidos:
+            capitulo = existentes[leido.titulo]
+            numeros = set()
+            cambios = False
+            for numero, contenido in leido.articulos:
+                if numero in numeros:
+                    continue  # Número repetido en el capítulo: cuenta el primero
+                numeros.add(numero)
+                # En simulación los capítulos nuevos no tienen pk: todo es nuevo
+                articulo = articulos.get((capitulo.pk, numero)) if capitulo.pk else None
+                if articulo is None:
+                    articulo = Articulo(capitulo=capitulo, numero=numero, contenido=contenido)
+                    articulo.actualizar_html()
+                    nuevos.append(articulo)
+                    cambios = True
+                    continue
+                vistos.add((capitulo.pk, numero))
+                if articulo.huella_html != huella_textos(contenido):
+                    articulo.contenido = contenido
+                    articulo.capitulo = capitulo
+                    articulo.actualizar_html()
+                    modificados.append(articulo)
+                    cambios = True
+                else:
+                    resultado.articulos_sin_cambios += 1
+            if cambios and tema_con_contenido:
+                capitulo.es_modificacion_reciente = True
+                capitulo.fecha_actualizacion_ley = fecha_actualizacion
+                marcados.append(capitulo)
+
+        resultado.articulos_nuevos = len(nuevos)
+        resultado.articulos_modificados = len(modificados)
+        resultado.capitulos_marcados = [c.titulo for c in marcados]
+        titulos = {c.pk: c.titulo for c in existentes.values() if c.pk}
+        resultado.articulos_ausentes = sorted(
+            (titulos.get(capitulo_id, ''), numero)
+            for (capitulo_id, numero) in articulos.keys() - vistos
+        )
+        if simular:
+            return resultado
+
+        Articulo.objects.bulk_create(nuevos)
+        Articulo.objects.bulk_update(modificados, ['contenido', 'contenido_html', 'huella_html'])
+        Capitulo.objects.bulk_update(marcados, ['es_modificacion_reciente', 'fecha_actualizacion_ley'])
+        _despues_de_cargar(nuevos_capitulos + capitulos_reordenados + marcados, nuevos + modificados)
+    return resultado
+
+
+def _despues_de_cargar(capitulos, articulos) -> None:
+    """Lo que harían las señales, que `bulk_create`/`bulk_update` no disparan."""
+    capitulos = {c.pk: c for c in capitulos}
+    busqueda.reemplazar_documentos(
+        [busqueda.documento_capitulo(c) for c in capitulos.values()]
+        + [busqueda.documento_articulo(a) for a in articulos]
+    )
+    # Las versiones se incrementan al confirmar, como en `examen.signals`
+    capitulo_ids = capitulos.keys() | {a.capitulo_id for a in articulos}
+
+    def invalidar():
+        for capitulo_id in capitulo_ids:
+            invalidar_capitulo(capitulo_id)
+        if capitulos:
+            invalidar_temario()
+    transaction.on_commit(invalidar)
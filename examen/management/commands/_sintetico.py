@@ -0,0 +1,90 @@
+"""Datos sintéticos para los comandos de benchmark.
+
+Django ignora los módulos de `management/commands` que empiezan por guion
+bajo, así que este fichero no se registra como comando.
+"""
+
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from examen.models import Oposicion, Tema, Capitulo, Articulo, Pregunta, EstadoPregunta
+from examen.muestreo import invalidar_pools
+
+CAPITULOS = 50
+ARTICULOS_POR_CAPITULO = 10
+TAMANO_LOTE = 5000
+
+
+def crear_banco_sintetico(num_preguntas: int, num_preguntas_examen: int = 100) -> Oposicion:
+    """Crea una oposición con un tema, 500 artículos y `num_preguntas` preguntas."""
+    sufijo = uuid.uuid4().hex[:8]
+    oposicion = Oposicion.objects.create(
+        nombre=f'Benchmark {sufijo}', num_preguntas=num_preguntas_examen
+    )
+    tema = Tema.objects.create(titulo=f'Tema benchmark {sufijo}')
+    tema.oposiciones.add(oposicion)
+    capitulos = Capitulo.objects.bulk_create(
+        Capitulo(tema=tema, titulo=f'Capítulo {n}', orden=n) for n in range(CAPITULOS)
+    )
+    articulos = Articulo.objects.bulk_create(
+        Articulo(capitulo=capitulo, numero=str(n), contenido='Contenido sintético.')
+        for capitulo in capitulos
+        for n in range(ARTICULOS_POR_CAPITULO)
+    )
+
+    lote = []
+    for n in range(num_preguntas):
+        lote.append(Pregunta(
+            articulo=articulos[n % len(articulos)],
+            enunciado=f'Pregunta sintética {n}',
+            respuesta_a='A', respuesta_b='B', respuesta_c='C', respuesta_d='D',
+            respuesta_correcta='A',
+        ))
+        if len(lote) == TAMANO_LOTE:
+            Pregunta.objects.bulk_create(lote)
+            lote = []
+    Pregunta.objects.bulk_create(lote)
+    # bulk_create no emite post_save: los pools en memoria se invalidan a mano
+    invalidar_pools()
+    return oposicion
+
+
+def crear_usuario_sintetico(oposicion):
+    """Crea un usuario con la oposición indicada como activa."""
+    email = f'benchmark-{uuid.uuid4().hex[:8]}@example.com'
+    usuario = get_user_model().objects.create_user(email=email, username=email)
+    usuario.perfil.oposicion_activa = oposicion
+    usuario.perfil.save(update_fields=['oposicion_activa'])
+    return usuario
+
+
+def crear_historial_sintetico(usuario, oposicion, num_estados: int, semilla: int = 0) -> None:
+    """Crea `num_estados` filas de `EstadoPregunta` con aciertos, fallos y revisiones al azar."""
+    rng = random.Random(semilla)
+    ahora = timezone.now()
+    pregunta_ids = (
+        Pregunta.objects.filter(articulo__capitulo__tema__oposiciones=oposicion)
+        .order_by().values_list('id', flat=True)
+    )
+    lote = []
+    for pregunta_id in rng.sample(list(pregunta_ids), num_estados):
+        correcta = rng.random() < 0.7
+        respuesta = ahora - timedelta(days=rng.randint(0, 365))
+        intervalo = rng.randint(1, 60)
+        lote.append(EstadoPregunta(
+            usuario=usuario, pregunta_id=pregunta_id,
+            veces_vista=1, veces_fallada=0 if correcta else 1,
+            fecha_ultima_respuesta=respuesta,
+            fecha_ultimo_acierto=respuesta if correcta else None,
+            ultima_correcta=correcta,
+            repeticiones=1 if correcta else 0, intervalo_dias=intervalo,
+            fecha_proxima_revision=respuesta + timedelta(days=intervalo),
+        ))
+        if len(lote) == TAMANO_LOTE:
+            EstadoPregunta.objects.bulk_create(lote)
+            lote = []
+    EstadoPregunta.objects.bulk_create(lote)
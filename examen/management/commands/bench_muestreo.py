@@ -0,0 +1,79 @@
+"""Benchmark de la selección aleatoria de preguntas al iniciar un examen.
+
+Compara `ORDER BY RANDOM()` con el muestreo por ids de `examen.muestreo`
+(leyendo los ids en cada examen y desde el pool en memoria del proceso) y
+mide la latencia completa de `StartExamenView` sobre bancos sintéticos de
+distinto tamaño. Todo se crea dentro de una transacción que se deshace al
+terminar, así que se puede lanzar contra la base de datos de desarrollo.
+
+    python manage.py bench_muestreo --tamanos 10000 100000 1000000
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+
+from examen.models import Pregunta
+from examen.muestreo import ids_candidatos, muestrear, pool_oposicion
+from examen.views import StartExamenView
+
+from ._sintetico import crear_banco_sintetico, crear_usuario_sintetico
+
+
+def _medir(funcion, repeticiones: int) -> float:
+    """Mediana en milisegundos de `repeticiones` ejecuciones."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de inicio de examen con bancos de 10k, 100k y 1M preguntas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos', nargs='+', type=int, default=[10_000, 100_000, 1_000_000],
+            help='Número de preguntas de cada banco sintético.',
+        )
+        parser.add_argument('--preguntas-examen', type=int, default=100)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        k = options['preguntas_examen']
+        repeticiones = options['repeticiones']
+
+        self.stdout.write(
+            f"{'preguntas':>10} | {'ORDER BY RANDOM()':>18} | {'muestreo por ids':>17} | {'pool en memoria':>16} | {'StartExamenView':>16}"
+        )
+        for tamano in options['tamanos']:
+            with transaction.atomic():
+                oposicion = crear_banco_sintetico(tamano, k)
+                usuario = crear_usuario_sintetico(oposicion)
+                base = Pregunta.objects.filter(articulo__capitulo__tema__oposiciones=oposicion)
+
+                aleatorio = _medir(lambda: list(base.order_by('?')[:k]), repeticiones)
+                muestreo = _medir(lambda: muestrear(ids_candidatos(base), k), repeticiones)
+                pool_oposicion(oposicion.pk)  # calentamiento: la primera lectura construye el pool
+                en_memoria = _medir(lambda: muestrear(pool_oposicion(oposicion.pk), k), repeticiones)
+
+                factory = RequestFactory()
+                vista = StartExamenView.as_view()
+
+                def iniciar_examen():
+                    peticion = factory.post(reverse('examen:simular_examen'))
+                    peticion.user = usuario
+                    vista(peticion)
+
+                inicio_examen = _medir(iniciar_examen, repeticiones)
+
+                self.stdout.write(
+                    f'{tamano:>10} | {aleatorio:>15.1f} ms | {muestreo:>14.1f} ms | {en_memoria:>13.1f} ms | {inicio_examen:>13.1f} ms'
+                )
+                transaction.set_rollback(True)
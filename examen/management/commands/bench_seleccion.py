@@ -0,0 +1,65 @@
+"""Benchmark de las estrategias de selección de preguntas de `examen.seleccion`.
+
+Mide, para cada estrategia registrada, la latencia de `seleccionar` sobre
+bancos sintéticos de distinto tamaño y con historiales de usuario de distinta
+longitud, para comprobar que el coste depende del tamaño del examen y no del
+historial. Todo se crea dentro de una transacción que se deshace al terminar.
+
+    python manage.py bench_seleccion --tamanos 100000 --historiales 0 10000 50000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from examen.muestreo import pool_oposicion
+from examen.seleccion import ESTRATEGIAS
+
+from ._sintetico import crear_banco_sintetico, crear_historial_sintetico, crear_usuario_sintetico
+from .bench_muestreo import _medir
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de cada estrategia de selección según el historial del usuario.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanos', nargs='+', type=int, default=[100_000],
+            help='Número de preguntas de cada banco sintético.',
+        )
+        parser.add_argument(
+            '--historiales', nargs='+', type=int, default=[0, 1_000, 10_000, 50_000],
+            help='Preguntas ya respondidas por el usuario en cada medición.',
+        )
+        parser.add_argument('--preguntas-examen', type=int, default=100)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        k = options['preguntas_examen']
+        repeticiones = options['repeticiones']
+
+        cabecera = f"{'preguntas':>10} | {'historial':>10}"
+        for codigo in ESTRATEGIAS:
+            cabecera += f' | {codigo:>12}'
+        self.stdout.write(cabecera)
+
+        for tamano in options['tamanos']:
+            if max(options['historiales']) > tamano:
+                raise CommandError(f'El historial no puede superar el tamaño del banco ({tamano}).')
+            for historial in options['historiales']:
+                with transaction.atomic():
+                    oposicion = crear_banco_sintetico(tamano, k)
+                    usuario = crear_usuario_sintetico(oposicion)
+                    crear_historial_sintetico(usuario, oposicion, historial)
+                    pool = pool_oposicion(oposicion.pk)
+                    ahora = timezone.now()
+
+                    fila = f'{tamano:>10} | {historial:>10}'
+                    for estrategia in ESTRATEGIAS.values():
+                        instancia = estrategia()
+                        tiempo = _medir(
+                            lambda: instancia.seleccionar(usuario.pk, pool, k, ahora), repeticiones
+                        )
+                        fila += f' | {tiempo:>9.1f} ms'
+                    self.stdout.write(fila)
+                    transaction.set_rollback(True)
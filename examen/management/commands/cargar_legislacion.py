@@ -0,0 +1,52 @@
+"""Carga o actualiza el texto consolidado de una ley en los capítulos de un tema.
+
+Solo se reescriben los artículos cuyo contenido ha cambiado; si el tema ya
+tenía artículos, sus capítulos afectados se marcan como modificación reciente.
+Ver `examen.legislacion` para el formato del texto.
+
+    python manage.py cargar_legislacion constitucion.md --tema 1 --fecha 2024-02-17
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examen.legislacion import cargar_ley
+from examen.models import Tema
+
+
+class Command(BaseCommand):
+    help = 'Carga el texto consolidado de una ley (texto plano o Markdown) en un tema.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichero', help='Ruta del texto de la ley.')
+        parser.add_argument('--tema', type=int, required=True, help='Id del tema de destino.')
+        parser.add_argument(
+            '--fecha', type=date.fromisoformat,
+            help='Fecha de la actualización legislativa (AAAA-MM-DD, por defecto hoy).',
+        )
+        parser.add_argument('--simular', action='store_true', help='Muestra los cambios sin guardar nada.')
+
+    def handle(self, *args, **options):
+        try:
+            tema = Tema.objects.get(pk=options['tema'])
+        except Tema.DoesNotExist:
+            raise CommandError(f'No existe el tema {options["tema"]}.')
+
+        try:
+            with open(options['fichero'], encoding='utf-8-sig') as flujo:
+                resultado = cargar_ley(flujo, tema, options['fecha'], simular=options['simular'])
+        except (OSError, UnicodeDecodeError) as error:
+            raise CommandError(str(error))
+
+        for titulo in resultado.capitulos_marcados:
+            self.stdout.write(f'Modificado: {titulo}')
+        for titulo, numero in resultado.articulos_ausentes:
+            self.stderr.write(f'Ya no aparece en el texto (no se borra): {titulo}, art. {numero}')
+
+        prefijo = 'Simulación: ' if resultado.simulacion else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}{resultado.capitulos_nuevos} capítulos nuevos, '
+            f'{resultado.articulos_nuevos} artículos nuevos, {resultado.articulos_modificados} modificados '
+            f'y {resultado.articulos_sin_cambios} sin cambios.'
+        ))
@@ -0,0 +1,69 @@
+"""Importa preguntas en bloque desde un fichero CSV, JSON, JSON Lines o Markdown.
+
+El formato se deduce de la extensión si no se indica. Con `--simular` solo se
+valida el fichero; con `--informe` los errores se escriben en un CSV
+(fila, error). Ver `examen.importacion` para los campos y el formato Markdown.
+
+    python manage.py importar_preguntas banco.csv --oposicion "Auxiliar Administrativo"
+"""
+
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from examen.importacion import (
+    FORMATOS, TAMANO_LOTE, ErrorImportacion, formato_por_nombre, importar_preguntas,
+)
+from examen.models import Oposicion
+
+
+class Command(BaseCommand):
+    help = 'Importa preguntas en bloque desde CSV, JSON, JSON Lines o Markdown.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichero', help='Ruta del fichero a importar.')
+        parser.add_argument('--oposicion', required=True, help='Id o nombre de la oposición.')
+        parser.add_argument('--formato', choices=FORMATOS, help='Formato del fichero (por defecto, según la extensión).')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Preguntas por lote.')
+        parser.add_argument('--simular', action='store_true', help='Valida el fichero sin guardar nada.')
+        parser.add_argument('--informe', help='Fichero CSV donde escribir los errores por fila.')
+
+    def handle(self, *args, **options):
+        oposicion = self._oposicion(options['oposicion'])
+        formato = options['formato'] or formato_por_nombre(options['fichero'])
+        if formato is None:
+            raise CommandError('No se reconoce el formato del fichero: usa --formato.')
+
+        try:
+            with open(options['fichero'], encoding='utf-8-sig', newline='') as flujo:
+                resultado = importar_preguntas(
+                    flujo, formato, oposicion, simular=options['simular'], tamano_lote=options['lote'],
+                )
+        except (OSError, ErrorImportacion) as error:
+            raise CommandError(str(error))
+
+        if options['informe']:
+            with open(options['informe'], 'w', encoding='utf-8', newline='') as salida:
+                escritor = csv.writer(salida)
+                escritor.writerow(['fila', 'error'])
+                escritor.writerows(resultado.errores)
+        else:
+            for fila, mensaje in resultado.errores:
+                self.stderr.write(f'Fila {fila}: {mensaje}')
+
+        if resultado.simulacion:
+            final = f'Simulación: se importarían {resultado.validas} preguntas.'
+        else:
+            final = f'Preguntas importadas: {resultado.importadas}.'
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.leidas} filas leídas, {resultado.validas} válidas, '
+            f'{resultado.con_errores} con errores. {final}'
+        ))
+
+    @staticmethod
+    def _oposicion(valor):
+        filtro = {'pk': int(valor)} if valor.isdigit() else {'nombre': valor}
+        try:
+            return Oposicion.objects.get(**filtro)
+        except Oposicion.DoesNotExist:
+            raise CommandError(f'No existe la oposición "{valor}".')
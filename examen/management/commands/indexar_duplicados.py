@@ -0,0 +1,32 @@
+"""Firma las preguntas del banco para la detección de duplicados.
+
+Las señales firman cada pregunta al guardarla, pero no ven las cargas con
+`update()` ni los fixtures. El comando solo recalcula las firmas cuyo texto
+ha cambiado, así que puede repetirse sin coste. Con `--informe` lista además
+los grupos de preguntas casi duplicadas.
+
+    python manage.py indexar_duplicados --informe
+"""
+
+from django.core.management.base import BaseCommand
+
+from examen.duplicados import TAMANO_LOTE, grupos_duplicados, indexar_banco
+
+
+class Command(BaseCommand):
+    help = 'Calcula las firmas MinHash de las preguntas y, opcionalmente, lista los duplicados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Preguntas por lote.')
+        parser.add_argument('--informe', action='store_true', help='Lista los grupos de duplicados.')
+
+    def handle(self, *args, **options):
+        revisadas, firmadas = indexar_banco(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{revisadas} preguntas revisadas, {firmadas} firmas nuevas o actualizadas.'
+        ))
+        if options['informe']:
+            grupos = grupos_duplicados()
+            for miembros in grupos:
+                self.stdout.write(' '.join(f'#{pregunta_id}' for pregunta_id in miembros))
+            self.stdout.write(self.style.SUCCESS(f'Grupos de posibles duplicados: {len(grupos)}.'))
@@ -0,0 +1,32 @@
+"""Reconstruye las estadísticas precalculadas a partir del histórico de respuestas."""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from examen.estadisticas import reconstruir_estadisticas_capitulos, reconstruir_estado_preguntas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula las tablas de estadísticas por usuario y capítulo y de estado '
+        'por usuario y pregunta a partir de los exámenes finalizados. Útil tras '
+        'desplegar las tablas o si se desincronizan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--email', help='Reconstruye solo las estadísticas del usuario con este email.'
+        )
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options['email']:
+            try:
+                usuario = get_user_model().objects.get(email=options['email'])
+            except get_user_model().DoesNotExist as exc:
+                raise CommandError(f"No existe ningún usuario con email {options['email']}.") from exc
+
+        filas = reconstruir_estadisticas_capitulos(usuario)
+        self.stdout.write(self.style.SUCCESS(f'Estadísticas por capítulo: {filas} filas.'))
+        filas = reconstruir_estado_preguntas(usuario)
+        self.stdout.write(self.style.SUCCESS(f'Estado por pregunta: {filas} filas.'))
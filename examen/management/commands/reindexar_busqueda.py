@@ -0,0 +1,25 @@
+"""Reconstruye el índice de búsqueda de artículos, preguntas y capítulos.
+
+Las señales mantienen el índice al día con cada guardado, pero no ven las
+cargas con `bulk_create`, `update()` ni los fixtures: tras ellas hay que
+reconstruirlo. También instala el índice del motor si aún no existe.
+
+    python manage.py reindexar_busqueda
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from examen.busqueda import instalar_indice, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Filas por lote.')
+
+    def handle(self, *args, **options):
+        instalar_indice(using=DEFAULT_DB_ALIAS)
+        total = reconstruir_indice(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda reconstruido: {total} documentos.'))
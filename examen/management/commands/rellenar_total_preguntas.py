@@ -0,0 +1,58 @@
+"""Rellena `Examen.total_preguntas` en los exámenes creados antes de existir el campo."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from examen.models import Examen
+
+
+class Command(BaseCommand):
+    help = (
+        'Calcula por lotes el total de preguntas de los exámenes que aún no lo '
+        'tienen guardado (y sus respuestas en blanco si ya están finalizados).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Exámenes por lote.')
+
+    def handle(self, *args, **options):
+        tamano_lote = options['lote']
+        pendientes = Examen.objects.filter(total_preguntas=0).order_by('pk')
+        ultimo_pk = 0
+        actualizados = 0
+
+        while True:
+            # Paginación por clave: cada lote empieza tras el último pk procesado
+            lote = list(
+                pendientes.filter(pk__gt=ultimo_pk)
+                .annotate(num_preguntas=Count('posiciones_preguntas'))
+                .only('pk', 'fecha_finalizacion', 'respuestas_correctas', 'respuestas_erroneas')
+                [:tamano_lote]
+            )
+            if not lote:
+                break
+            ultimo_pk = lote[-1].pk
+
+            finalizados, en_curso = [], []
+            for examen in lote:
+                if not examen.num_preguntas:
+                    continue
+                examen.total_preguntas = examen.num_preguntas
+                if examen.fecha_finalizacion:
+                    examen.respuestas_en_blanco = max(
+                        0,
+                        examen.num_preguntas - examen.respuestas_correctas - examen.respuestas_erroneas,
+                    )
+                    finalizados.append(examen)
+                else:
+                    en_curso.append(examen)
+            # Cada grupo solo escribe los campos que tiene cargados: leer un
+            # campo diferido haría una consulta por examen
+            with transaction.atomic():
+                Examen.objects.bulk_update(finalizados, ['total_preguntas', 'respuestas_en_blanco'])
+                Examen.objects.bulk_update(en_curso, ['total_preguntas'])
+            actualizados += len(finalizados) + len(en_curso)
+            self.stdout.write(f'  ... {actualizados} exámenes actualizados (hasta #{ultimo_pk}).')
+
+        self.stdout.write(self.style.SUCCESS(f'Total de preguntas rellenado en {actualizados} exámenes.'))
@@ -0,0 +1,60 @@
+"""Renderiza por lotes el Markdown de artículos y preguntas a su columna HTML.
+
+Solo se procesan las filas cuya huella no coincide con sus textos (filas
+anteriores a las columnas HTML, cargas masivas con `bulk_create` o un cambio
+de `VERSION_RENDERIZADO`). Con `--forzar` se renderiza todo de nuevo.
+
+    python manage.py renderizar_markdown
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from examen.models import Articulo, Pregunta
+
+MODELOS = (
+    (Articulo, ['contenido'], ['contenido_html', 'huella_html']),
+    (Pregunta, ['enunciado', 'explicacion'], ['enunciado_html', 'explicacion_html', 'huella_html']),
+)
+
+
+class Command(BaseCommand):
+    help = 'Renderiza el Markdown de artículos y preguntas y guarda el HTML saneado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Filas por lote.')
+        parser.add_argument(
+            '--forzar', action='store_true', help='Renderiza todas las filas aunque su huella coincida.'
+        )
+
+    def handle(self, *args, **options):
+        for modelo, campos_origen, campos_html in MODELOS:
+            revisadas, renderizadas = self._renderizar(
+                modelo, campos_origen, campos_html, options['lote'], options['forzar']
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'{modelo._meta.verbose_name_plural}: {renderizadas} de {revisadas} renderizadas.'
+            ))
+
+    def _renderizar(self, modelo, campos_origen, campos_html, tamano_lote, forzar):
+        revisadas = renderizadas = 0
+        ultimo_pk = 0
+        filas = modelo.objects.only('pk', *campos_origen, *campos_html).order_by('pk')
+        while True:
+            # Paginación por clave: cada lote empieza tras el último pk procesado
+            lote = list(filas.filter(pk__gt=ultimo_pk)[:tamano_lote])
+            if not lote:
+                break
+            ultimo_pk = lote[-1].pk
+
+            modificadas = []
+            for fila in lote:
+                if forzar:
+                    fila.huella_html = ''
+                if fila.actualizar_html():
+                    modificadas.append(fila)
+            with transaction.atomic():
+                modelo.objects.bulk_update(modificadas, campos_html)
+            revisadas += len(lote)
+            renderizadas += len(modificadas)
+        return revisadas, renderizadas
@@ -1,16 +1,22 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .renderizado import huella_textos, renderizar_markdown
+
 
 # --- Modelos para el Temario ---
 
 class Oposicion(models.Model):
     """Representa una oposición específica. Ej: 'Auxiliar Administrativo del Estado'."""
 
+    class EstrategiaSeleccion(models.TextChoices):
+        ADAPTATIVA = 'ADAPTATIVA', _('Adaptativa 40/30/30')
+        REPASO_ESPACIADO = 'SM2', _('Repaso espaciado (SM-2)')
+
     nombre = models.CharField(
         _("nombre de la oposición"), max_length=255, unique=True,
         help_text=_("Nombre único para la oposición.")
@@ -27,6 +33,11 @@ class Oposicion(models.Model):
         _("penalización por error"), max_digits=4, decimal_places=2, default='0.33',
         help_text=_("Fracción de punto que se resta por cada respuesta errónea.")
     )
+    estrategia_seleccion = models.CharField(
+        _("estrategia de selección"), max_length=20,
+        choices=EstrategiaSeleccion.choices, default=EstrategiaSeleccion.ADAPTATIVA,
+        help_text=_("Cómo se eligen las preguntas de cada simulacro (ver examen.seleccion).")
+    )
 
     class Meta:
         verbose_name = _("oposición")
@@ -159,6 +170,14 @@ class Articulo(models.Model):
         _("número del artículo"), max_length=50,
         help_text=_("Número o identificador del artículo dentro del capítulo.")
     )
+    contenido_html = models.TextField(
+        _("contenido en HTML"), blank=True, default='', editable=False,
+        help_text=_("Markdown de `contenido` ya renderizado y saneado.")
+    )
+    huella_html = models.CharField(
+        _("huella del HTML"), max_length=64, blank=True, default='', editable=False,
+        help_text=_("SHA-256 del texto a partir del que se renderizó el HTML.")
+    )
 
     class Meta:
         verbose_name = _("artículo")
@@ -169,6 +188,20 @@ class Articulo(models.Model):
     def __str__(self):
         return f"Art. {self.numero} - {self.capitulo.titulo}"
 
+    def actualizar_html(self) -> bool:
+        """Renderiza `contenido` si ha cambiado desde el último renderizado."""
+        huella = huella_textos(self.contenido)
+        if huella == self.huella_html:
+            return False
+        self.contenido_html = renderizar_markdown(self.contenido)
+        self.huella_html = huella
+        return True
+
+    def save(self, *args, **kwargs):
+        if self.actualizar_html() and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'contenido_html', 'huella_html'}
+        super().save(*args, **kwargs)
+
 
 # --- Modelos de Recursos y Progreso ---
 
@@ -288,6 +321,16 @@ class Pregunta(models.Model):
         Articulo, on_delete=models.CASCADE, related_name='preguntasArticulo',
         verbose_name=_("artículo"), help_text=_("Artículo al que pertenece esta pregunta.")
     )
+    enunciado_html = models.TextField(
+        _("enunciado en HTML"), blank=True, default='', editable=False,
+    )
+    explicacion_html = models.TextField(
+        _("explicación en HTML"), blank=True, default='', editable=False,
+    )
+    huella_html = models.CharField(
+        _("huella del HTML"), max_length=64, blank=True, default='', editable=False,
+        help_text=_("SHA-256 de los textos a partir de los que se renderizó el HTML.")
+    )
 
     class Meta:
         verbose_name = _("pregunta")
@@ -297,6 +340,23 @@ class Pregunta(models.Model):
     def __str__(self):
         return f"{self.enunciado[:60]}..."
 
+    def actualizar_html(self) -> bool:
+        """Renderiza enunciado y explicación si han cambiado desde el último renderizado."""
+        huella = huella_textos(self.enunciado, self.explicacion)
+        if huella == self.huella_html:
+            return False
+        self.enunciado_html = renderizar_markdown(self.enunciado)
+        self.explicacion_html = renderizar_markdown(self.explicacion)
+        self.huella_html = huella
+        return True
+
+    def save(self, *args, **kwargs):
+        if self.actualizar_html() and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'enunciado_html', 'explicacion_html', 'huella_html',
+            }
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('pregunta-detalle', kwargs={'pk': self.pk})
 
@@ -355,7 +415,7 @@ class Examen(models.Model):
         _("fecha de finalización"), null=True, blank=True
     )
     preguntas = models.ManyToManyField(
-        Pregunta, related_name='examenes', verbose_name=_("preguntas")
+        Pregunta, through='PreguntaExamen', related_name='examenes', verbose_name=_("preguntas")
     )
     respuestas_correctas = models.PositiveIntegerField(
         default=0, verbose_name=_("Respuestas correctas"),
@@ -363,10 +423,20 @@ class Examen(models.Model):
     respuestas_erroneas = models.PositiveIntegerField(
         default=0, verbose_name=_("Respuestas erróneas"),
     )
+    respuestas_en_blanco = models.PositiveIntegerField(
+        default=0, verbose_name=_("Respuestas en blanco"),
+    )
+    total_preguntas = models.PositiveIntegerField(
+        default=0, verbose_name=_("Total de preguntas"),
+    )
     puntuacion = models.FloatField(
         _("puntuación"), null=True, blank=True,
         help_text=_("Puntuación total obtenida en el examen.")
     )
+    version_respuestas = models.PositiveIntegerField(
+        _("versión de las respuestas"), default=0,
+        help_text=_("Se incrementa con cada lote del autoguardado; descarta lotes desfasados.")
+    )
 
     class Meta:
         verbose_name = _("examen")
@@ -382,13 +452,83 @@ class Examen(models.Model):
     def get_absolute_url(self):
         return reverse('examen:simulacion_resultados', kwargs={'examen_id': self.pk})
 
+    def asignar_preguntas(self, pregunta_ids) -> None:
+        """Guarda las preguntas de un examen nuevo, en el orden dado, con un único INSERT.
+
+        Si el examen no se creó ya con `total_preguntas`, lo actualiza.
+        """
+        filas = PreguntaExamen.objects.bulk_create(
+            PreguntaExamen(examen=self, pregunta_id=pregunta_id, posicion=posicion)
+            for posicion, pregunta_id in enumerate(pregunta_ids)
+        )
+        if self.total_preguntas != len(filas):
+            self.total_preguntas = len(filas)
+            self.save(update_fields=['total_preguntas'])
+
+    def guardar_respuestas(self, respuestas: dict) -> int:
+        """Guarda o sustituye las respuestas `{pregunta_id: letra}` en una transacción.
+
+        La plantilla de respuestas se lee con una sola consulta, limitada a las
+        preguntas del examen, y todas las respuestas se escriben con un único
+        upsert que ya lleva calculado `es_correcta`. Se ignoran las preguntas
+        ajenas al examen y las letras no válidas. Devuelve cuántas se guardan.
+        """
+        letras = set(Pregunta.OpcionesRespuesta.values)
+        respuestas = {pid: letra for pid, letra in respuestas.items() if letra in letras}
+        if not respuestas:
+            return 0
+
+        with transaction.atomic():
+            correctas = dict(
+                Pregunta.objects
+                .filter(posiciones_examenes__examen=self, id__in=respuestas.keys())
+                .values_list('id', 'respuesta_correcta')
+            )
+            filas = [
+                RespuestaUsuario(
+                    examen=self, pregunta_id=pregunta_id, respuesta_seleccionada=letra,
+                    es_correcta=(letra == correctas[pregunta_id]),
+                )
+                for pregunta_id, letra in respuestas.items()
+                if pregunta_id in correctas
+            ]
+            RespuestaUsuario.objects.bulk_create(
+                filas,
+                update_conflicts=True,
+                unique_fields=['examen', 'pregunta'],
+                update_fields=['respuesta_seleccionada', 'es_correcta'],
+            )
+        return len(filas)
+
+    def guardar_lote_respuestas(self, respuestas: dict, version: int):
+        """Guarda un lote del autoguardado si `version` sigue siendo la vigente.
+
+        El UPDATE condicional sobre `version_respuestas` bloquea la fila del
+        examen, así que los lotes concurrentes se aplican de uno en uno y un
+        lote desfasado no puede pisar respuestas más recientes. Devuelve la
+        nueva versión, o None si el lote se rechaza (versión desfasada o
+        examen ya finalizado).
+        """
+        with transaction.atomic():
+            aceptado = Examen.objects.filter(
+                pk=self.pk, version_respuestas=version, fecha_finalizacion__isnull=True,
+            ).update(version_respuestas=models.F('version_respuestas') + 1)
+            if not aceptado:
+                return None
+            self.guardar_respuestas(respuestas)
+        self.version_respuestas = version + 1
+        return self.version_respuestas
+
+    def preguntas_ordenadas(self) -> 'PreguntasOrdenadas':
+        """Preguntas del examen en su orden, listas para pasar a un `Paginator`."""
+        return PreguntasOrdenadas(self)
+
     @property
     def porcentaje_acierto(self) -> float:
-        """Calcula el porcentaje de acierto del examen sobre el total de preguntas."""
-        total = self.preguntas.count()
-        if total == 0:
+        """Porcentaje de acierto sobre `total_preguntas` (sin consultar la base de datos)."""
+        if self.total_preguntas == 0:
             return 0.0
-        return round((self.respuestas_correctas / total) * 100, 2)
+        return round((self.respuestas_correctas / self.total_preguntas) * 100, 2)
 
     @property
     def total_respondidas(self) -> int:
@@ -396,6 +536,76 @@ class Examen(models.Model):
         return self.respuestas_correctas + self.respuestas_erroneas
 
 
+class PreguntaExamen(models.Model):
+    """Pregunta de un examen con su posición dentro de él.
+
+    Usa la tabla de la antigua relación M2M automática, así que los exámenes
+    previos conservan sus preguntas (todas con posición 0, ordenadas por id).
+    """
+
+    examen = models.ForeignKey(
+        Examen, on_delete=models.CASCADE, related_name='posiciones_preguntas',
+        verbose_name=_("examen")
+    )
+    pregunta = models.ForeignKey(
+        Pregunta, on_delete=models.CASCADE, related_name='posiciones_examenes',
+        verbose_name=_("pregunta")
+    )
+    posicion = models.PositiveIntegerField(_("posición"), default=0)
+
+    class Meta:
+        db_table = 'examen_examen_preguntas'
+        verbose_name = _("pregunta de examen")
+        verbose_name_plural = _("preguntas de examen")
+        unique_together = ('examen', 'pregunta')
+        indexes = [
+            models.Index(fields=['examen', 'posicion'], name='pregunta_examen_posicion_idx'),
+        ]
+        ordering = ['posicion', 'id']
+
+    def __str__(self):
+        return f"Examen #{self.examen_id} - {self.posicion + 1}: pregunta #{self.pregunta_id}"
+
+
+class PreguntasOrdenadas:
+    """Secuencia paginable de las preguntas de un examen en su orden.
+
+    `Paginator` solo necesita `count()` y cortes. Cada corte se resuelve con un
+    recorrido por rango de `posicion` sobre el índice (examen, posicion), sin
+    OFFSET, y el orden es siempre el mismo entre peticiones.
+    """
+
+    def __init__(self, examen):
+        self.examen = examen
+        self._total = None
+        self._numeradas = True
+
+    def count(self) -> int:
+        if self._total is None:
+            resumen = PreguntaExamen.objects.filter(examen=self.examen).aggregate(
+                total=models.Count('id'), ultima=models.Max('posicion'),
+            )
+            self._total = resumen['total']
+            # Los exámenes anteriores a la columna `posicion` la tienen toda a 0
+            self._numeradas = resumen['ultima'] is None or resumen['ultima'] == self._total - 1
+        return self._total
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, indice):
+        if not isinstance(indice, slice):
+            return self[indice:indice + 1][0]
+        inicio = indice.start or 0
+        fin = self.count() if indice.stop is None else indice.stop
+        filas = PreguntaExamen.objects.filter(examen=self.examen).select_related('pregunta')
+        if self._numeradas:
+            filas = filas.filter(posicion__gte=inicio, posicion__lt=fin)
+        else:
+            filas = filas[inicio:fin]
+        return [fila.pregunta for fila in filas]
+
+
 class RespuestaUsuario(models.Model):
     """Almacena la respuesta de un usuario a una pregunta en un examen."""
 
@@ -430,4 +640,229 @@ class RespuestaUsuario(models.Model):
         """Retorna el texto de la respuesta seleccionada."""
         if not self.respuesta_seleccionada:
             return "Sin responder"
-        return self.pregunta.get_respuesta_texto(self.respuesta_seleccionada)
\ No newline at end of file
+        return self.pregunta.get_respuesta_texto(self.respuesta_seleccionada)
+
+# --- Modelos de Estadísticas ---
+
+class EstadisticaCapitulo(models.Model):
+    """Acumulado de respuestas de un usuario en un capítulo.
+
+    Se actualiza de forma incremental cada vez que se finaliza un examen, de
+    modo que el dashboard no tenga que recorrer todo el histórico de
+    `RespuestaUsuario` para calcular las recomendaciones.
+    """
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='estadisticas_capitulos', verbose_name=_("usuario")
+    )
+    capitulo = models.ForeignKey(
+        Capitulo, on_delete=models.CASCADE, related_name='estadisticas_usuarios',
+        verbose_name=_("capítulo")
+    )
+    total_respuestas = models.PositiveIntegerField(_("respuestas totales"), default=0)
+    total_fallos = models.PositiveIntegerField(_("respuestas falladas"), default=0)
+    fecha_ultimo_acierto = models.DateTimeField(
+        _("fecha del último acierto"), null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = _("estadística de capítulo")
+        verbose_name_plural = _("estadísticas de capítulo")
+        unique_together = ('usuario', 'capitulo')
+
+    def __str__(self):
+        return f"{self.usuario.email} - {self.capitulo.titulo}: {self.total_fallos}/{self.total_respuestas}"
+
+    @property
+    def porcentaje_fallo(self) -> float:
+        """Porcentaje de respuestas falladas sobre el total respondido."""
+        if self.total_respuestas == 0:
+            return 0.0
+        return (self.total_fallos / self.total_respuestas) * 100.0
+
+
+class EstadoPregunta(models.Model):
+    """Memoria de un usuario sobre una pregunta concreta.
+
+    Se actualiza al finalizar cada examen y alimenta el algoritmo adaptativo
+    de `StartExamenView`: las preguntas falladas, olvidadas y nuevas se
+    obtienen con consultas acotadas sobre esta tabla en lugar de recorrer todo
+    el histórico de `RespuestaUsuario`.
+    """
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='estados_preguntas', verbose_name=_("usuario")
+    )
+    pregunta = models.ForeignKey(
+        Pregunta, on_delete=models.CASCADE, related_name='estados_usuarios',
+        verbose_name=_("pregunta")
+    )
+    veces_vista = models.PositiveIntegerField(
+        _("veces vista"), default=0,
+        help_text=_("Exámenes finalizados en los que ha aparecido la pregunta.")
+    )
+    veces_fallada = models.PositiveIntegerField(_("veces fallada"), default=0)
+    fecha_ultima_respuesta = models.DateTimeField(
+        _("fecha de la última respuesta"), null=True, blank=True
+    )
+    fecha_ultimo_acierto = models.DateTimeField(
+        _("fecha del último acierto"), null=True, blank=True
+    )
+    ultima_correcta = models.BooleanField(
+        _("última respuesta correcta"), null=True, blank=True,
+        help_text=_("Vacío si el usuario nunca la ha respondido.")
+    )
+
+    # Planificación del repaso espaciado (SM-2)
+    repeticiones = models.PositiveIntegerField(
+        _("repeticiones seguidas"), default=0,
+        help_text=_("Aciertos consecutivos desde el último fallo.")
+    )
+    intervalo_dias = models.PositiveIntegerField(_("intervalo (días)"), default=0)
+    facilidad = models.FloatField(_("factor de facilidad"), default=2.5)
+    fecha_proxima_revision = models.DateTimeField(
+        _("fecha de la próxima revisión"), null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = _("estado de pregunta")
+        verbose_name_plural = _("estados de preguntas")
+        unique_together = ('usuario', 'pregunta')
+        indexes = [
+            # Falladas: última respuesta incorrecta, las más recientes primero.
+            # Índices parciales: el filtro booleano se compila sin `=` y no
+            # podría usarse como prefijo de un índice compuesto.
+            models.Index(
+                fields=['usuario', 'fecha_ultima_respuesta'],
+                condition=models.Q(ultima_correcta=False),
+                name='estado_preg_falladas_idx',
+            ),
+            # Olvidadas: última respuesta correcta, el acierto más antiguo primero
+            models.Index(
+                fields=['usuario', 'fecha_ultimo_acierto'],
+                condition=models.Q(ultima_correcta=True),
+                name='estado_preg_olvidadas_idx',
+            ),
+            # Repaso espaciado: preguntas vencidas, la más atrasada primero
+            models.Index(
+                fields=['usuario', 'fecha_proxima_revision'],
+                name='estado_preg_proxima_rev_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.email} - pregunta #{self.pregunta_id}: {self.veces_fallada}/{self.veces_vista}"
+
+
+class TiempoEstudio(models.Model):
+    """Segundos que un usuario ha pasado en un capítulo en un día.
+
+    Se alimenta de los latidos que envían las páginas de capítulo y de
+    simulacro, sumados con un UPDATE atómico (ver `examen.tiempo_estudio`).
+    """
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='tiempos_estudio', verbose_name=_("usuario")
+    )
+    capitulo = models.ForeignKey(
+        Capitulo, on_delete=models.CASCADE, related_name='tiempos_estudio',
+        verbose_name=_("capítulo")
+    )
+    fecha = models.DateField(_("fecha"))
+    segundos = models.PositiveIntegerField(_("segundos"), default=0)
+
+    class Meta:
+        verbose_name = _("tiempo de estudio")
+        verbose_name_plural = _("tiempos de estudio")
+        unique_together = ('usuario', 'capitulo', 'fecha')
+
+    def __str__(self):
+        return f"{self.usuario.email} - {self.capitulo.titulo} ({self.fecha}): {self.segundos} s"
+
+
+# --- Modelo para la Búsqueda ---
+
+class DocumentoBusqueda(models.Model):
+    """Texto indexado para la búsqueda de texto completo (ver `examen.busqueda`).
+
+    Cada artículo, pregunta y capítulo tiene un documento. El índice propio
+    del motor (FTS5 en SQLite, `tsvector` + GIN en PostgreSQL) se crea fuera
+    del ORM sobre esta tabla.
+    """
+
+    class TipoDocumento(models.TextChoices):
+        ARTICULO = 'ART', _('Artículo')
+        PREGUNTA = 'PRE', _('Pregunta')
+        CAPITULO = 'CAP', _('Capítulo')
+
+    tipo = models.CharField(_("tipo"), max_length=3, choices=TipoDocumento.choices)
+    objeto_id = models.PositiveBigIntegerField(_("id del objeto"))
+    capitulo = models.ForeignKey(
+        Capitulo, on_delete=models.CASCADE, related_name='documentos_busqueda',
+        verbose_name=_("capítulo"), help_text=_("Capítulo al que enlaza el resultado.")
+    )
+    titulo = models.CharField(_("título"), max_length=255, blank=True, default='')
+    texto = models.TextField(_("texto"), blank=True, default='')
+
+    class Meta:
+        verbose_name = _("documento de búsqueda")
+        verbose_name_plural = _("documentos de búsqueda")
+        unique_together = ('tipo', 'objeto_id')
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.objeto_id}: {self.titulo[:60]}"
+
+    def get_absolute_url(self):
+        url = reverse('examen:capitulo_detalle', kwargs={'pk': self.capitulo_id})
+        if self.tipo == self.TipoDocumento.ARTICULO:
+            url += f'#articulo-{self.objeto_id}'
+        return url
+
+
+# --- Modelos para la Detección de Duplicados ---
+
+class FirmaPregunta(models.Model):
+    """Firma MinHash del texto de una pregunta (ver `examen.duplicados`)."""
+
+    pregunta = models.OneToOneField(
+        Pregunta, on_delete=models.CASCADE, primary_key=True, related_name='firma',
+        verbose_name=_("pregunta")
+    )
+    firma = models.BinaryField(_("firma MinHash"))
+    huella = models.CharField(
+        _("huella del texto"), max_length=64,
+        help_text=_("SHA-256 del texto firmado: si no cambia, no se recalcula la firma.")
+    )
+
+    class Meta:
+        verbose_name = _("firma de pregunta")
+        verbose_name_plural = _("firmas de preguntas")
+
+    def __str__(self):
+        return f"Firma de la pregunta #{self.pregunta_id}"
+
+
+class BandaPregunta(models.Model):
+    """Cubeta LSH de una banda de la firma: preguntas con el mismo valor son candidatas a duplicado."""
+
+    pregunta = models.ForeignKey(
+        Pregunta, on_delete=models.CASCADE, related_name='bandas_lsh',
+        verbose_name=_("pregunta")
+    )
+    banda = models.PositiveSmallIntegerField(_("banda"))
+    valor = models.BigIntegerField(_("valor de la banda"))
+
+    class Meta:
+        verbose_name = _("banda LSH de pregunta")
+        verbose_name_plural = _("bandas LSH de preguntas")
+        unique_together = ('pregunta', 'banda')
+        indexes = [
+            # Búsqueda de candidatos: una consulta por índice y banda
+            models.Index(fields=['banda', 'valor'], name='banda_preg_valor_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pregunta #{self.pregunta_id}, banda {self.banda}"
@@ -0,0 +1,182 @@
+"""Muestreo aleatorio uniforme de preguntas sin `ORDER BY RANDOM()`.
+
+`order_by('?')` obliga a la base de datos a ordenar todo el conjunto de
+candidatas (con sus JOINs) para quedarse con unas pocas filas. Aquí solo se
+leen los ids de las candidatas y el sorteo se hace en Python; como la
+relación M2M del examen se guarda por id, no hace falta cargar después las
+filas elegidas.
+
+Además, cada proceso guarda en memoria el pool de ids elegibles de cada
+oposición y capítulo (`pool_oposicion`, `pool_capitulo`) en un `array('q')`
+ordenado. El pool se reconstruye de forma perezosa cuando cambia la versión
+global del contenido, que incrementan las señales de `examen.signals` al
+guardar o borrar temas, capítulos, artículos o preguntas.
+
+Los cubos del algoritmo adaptativo (falladas, olvidadas y nuevas) se leen de
+`EstadoPregunta` con consultas acotadas por el tamaño del examen.
+"""
+
+import random
+import threading
+from array import array
+from bisect import bisect_left
+
+from .models import EstadoPregunta, Pregunta
+from .versiones import incrementar_version, obtener_version
+
+# Ámbito del contador de versión del contenido del temario y el banco de preguntas
+VERSION_CONTENIDO = 'contenido'
+# Filas de estado leídas por cada hueco de un cubo, para compensar las que caen fuera del pool
+SOBREMUESTREO = 4
+# Rondas del muestreo por rechazo de preguntas nuevas
+INTENTOS_NUEVAS = 3
+
+
+def ids_candidatos(queryset) -> list:
+    """Ids de las preguntas de un queryset, sin ordenar ni cargar columnas."""
+    return list(queryset.order_by().values_list('id', flat=True))
+
+
+def muestrear(ids, k: int, excluir=frozenset(), rng=random) -> list:
+    """Devuelve hasta `k` ids distintos de `ids`, al azar y sin los de `excluir`.
+
+    Se sortean `k + len(excluir)` posiciones: como entre ellas caben como mucho
+    `len(excluir)` excluidas, siempre quedan `k` válidas si las hay, y cada
+    subconjunto de candidatas no excluidas es igual de probable. El coste es
+    proporcional a `k + len(excluir)`, no al tamaño de `ids`.
+    """
+    total = len(ids)
+    if k <= 0 or total == 0:
+        return []
+
+    elegidos = []
+    for posicion in rng.sample(range(total), min(total, k + len(excluir))):
+        pregunta_id = ids[posicion]
+        if pregunta_id not in excluir:
+            elegidos.append(pregunta_id)
+            if len(elegidos) == k:
+                break
+    return elegidos
+
+
+class PoolPreguntas:
+    """Ids de preguntas elegibles, ordenados y guardados en un `array('q')`.
+
+    Ocupa 8 bytes por pregunta y admite `len()`, acceso por posición (lo que
+    necesita `muestrear`) y pertenencia en O(log n) por búsqueda binaria.
+    """
+
+    __slots__ = ('ids', 'version')
+
+    def __init__(self, ids, version: int):
+        self.ids = array('q', sorted(ids))
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, posicion: int) -> int:
+        return self.ids[posicion]
+
+    def __contains__(self, pregunta_id) -> bool:
+        posicion = bisect_left(self.ids, pregunta_id)
+        return posicion < len(self.ids) and self.ids[posicion] == pregunta_id
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _obtener_pool(clave, queryset) -> PoolPreguntas:
+    version = obtener_version(VERSION_CONTENIDO)
+    pool = _pools.get(clave)
+    if pool is None or pool.version != version:
+        pool = PoolPreguntas(ids_candidatos(queryset), version)
+        with _pools_lock:
+            _pools[clave] = pool
+    return pool
+
+
+def pool_oposicion(oposicion_id=None) -> PoolPreguntas:
+    """Pool de preguntas de una oposición (o de todo el banco si no se indica)."""
+    queryset = Pregunta.objects.all()
+    if oposicion_id is not None:
+        queryset = queryset.filter(articulo__capitulo__tema__oposiciones=oposicion_id)
+    return _obtener_pool(('oposicion', oposicion_id), queryset)
+
+
+def pool_capitulo(capitulo_id) -> PoolPreguntas:
+    """Pool de preguntas de un capítulo."""
+    return _obtener_pool(
+        ('capitulo', capitulo_id), Pregunta.objects.filter(articulo__capitulo=capitulo_id)
+    )
+
+
+def invalidar_pools() -> None:
+    """Marca como obsoletos los pools de todos los procesos."""
+    incrementar_version(VERSION_CONTENIDO)
+
+
+# ── Cubos del algoritmo adaptativo ────────────────────────────────────────────
+
+def preguntas_falladas(usuario_id, pool, k: int) -> list:
+    """Hasta `k` preguntas del pool cuya última respuesta fue un fallo.
+
+    Se leen como mucho `SOBREMUESTREO * k` filas, las de fallo más reciente,
+    y se sortea entre las que pertenecen al pool.
+    """
+    if k <= 0:
+        return []
+    ids = (
+        EstadoPregunta.objects
+        .filter(usuario_id=usuario_id, ultima_correcta=False)
+        .order_by('-fecha_ultima_respuesta')
+        .values_list('pregunta_id', flat=True)[:k * SOBREMUESTREO]
+    )
+    return muestrear([pid for pid in ids if pid in pool], k)
+
+
+def preguntas_olvidadas(usuario_id, pool, k: int) -> list:
+    """Hasta `k` preguntas del pool acertadas por última vez hace más tiempo."""
+    if k <= 0:
+        return []
+    ids = (
+        EstadoPregunta.objects
+        .filter(usuario_id=usuario_id, ultima_correcta=True)
+        .order_by('fecha_ultimo_acierto')
+        .values_list('pregunta_id', flat=True)[:k * SOBREMUESTREO]
+    )
+    return [pid for pid in ids if pid in pool][:k]
+
+
+def preguntas_nuevas(usuario_id, pool, k: int, excluir=frozenset()) -> list:
+    """Hasta `k` preguntas del pool que el usuario no ha respondido nunca.
+
+    Muestreo por rechazo: se sortean candidatas del pool y se descartan las ya
+    respondidas con una consulta `IN` sobre las propias candidatas, de modo
+    que el coste depende de `k` y no del historial del usuario.
+    """
+    elegidas = []
+    descartadas = set(excluir)
+    for _ in range(INTENTOS_NUEVAS):
+        faltan = k - len(elegidas)
+        if faltan <= 0:
+            break
+        candidatas = muestrear(pool, faltan * 2, excluir=descartadas)
+        if not candidatas:
+            break
+        respondidas = set(
+            EstadoPregunta.objects
+            .filter(
+                usuario_id=usuario_id, pregunta_id__in=candidatas,
+                fecha_ultima_respuesta__isnull=False,
+            )
+            .values_list('pregunta_id', flat=True)
+        )
+        for pregunta_id in candidatas:
+            descartadas.add(pregunta_id)
+            if pregunta_id not in respondidas:
+                elegidas.append(pregunta_id)
+                if len(elegidas) == k:
+                    break
+    return elegidas
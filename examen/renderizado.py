@@ -0,0 +1,36 @@
+"""Renderizado de Markdown a HTML saneado, calculado al guardar.
+
+`Articulo` y `Pregunta` guardan junto a sus textos el HTML ya renderizado y una
+huella SHA-256 de los textos de origen. Al guardar solo se vuelve a renderizar
+si la huella ha cambiado, y las vistas sirven el HTML almacenado sin procesar
+Markdown en cada petición.
+
+`markdown2` trabaja en `safe_mode='escape'`: el HTML que venga en el texto se
+escapa y los enlaces con protocolos no seguros (p. ej. `javascript:`) se
+descartan, así que el resultado puede marcarse como seguro en las plantillas.
+"""
+
+import hashlib
+
+import markdown2
+
+# Cambiar los extras altera el HTML: la versión forma parte de la huella para
+# que `renderizar_markdown` vuelva a procesar todas las filas
+VERSION_RENDERIZADO = 1
+EXTRAS = ['break-on-newline', 'cuddled-lists', 'fenced-code-blocks', 'strike', 'tables']
+
+
+def renderizar_markdown(texto) -> str:
+    """Convierte Markdown a HTML saneado (cadena vacía si no hay texto)."""
+    if not texto:
+        return ''
+    return markdown2.markdown(texto, safe_mode='escape', extras=EXTRAS).strip()
+
+
+def huella_textos(*textos) -> str:
+    """Huella SHA-256 de los textos de origen y de la versión del renderizado."""
+    digest = hashlib.sha256(str(VERSION_RENDERIZADO).encode())
+    for texto in textos:
+        digest.update(b'\x00')
+        digest.update((texto or '').encode())
+    return digest.hexdigest()
@@ -0,0 +1,131 @@
+"""Estrategias de selección de preguntas para los simulacros.
+
+Cada oposición elige su estrategia en `Oposicion.estrategia_seleccion`.
+Todas trabajan sobre el pool de ids en memoria (`examen.muestreo`) y sobre
+`EstadoPregunta`, con consultas acotadas por el tamaño del examen:
+
+- `EstrategiaAdaptativa`: el reparto 40/30/30 de falladas, olvidadas y
+  nuevas (estrategia por defecto).
+- `EstrategiaRepasoEspaciado`: planificador SM-2 que sirve primero las
+  preguntas vencidas, leídas del índice por `fecha_proxima_revision`.
+
+Para añadir una estrategia basta con heredar de `EstrategiaSeleccion`,
+registrarla en `ESTRATEGIAS` y añadir su código a
+`Oposicion.EstrategiaSeleccion`.
+"""
+
+from datetime import timedelta
+
+from .models import EstadoPregunta, Oposicion
+from .muestreo import (
+    SOBREMUESTREO, muestrear, preguntas_falladas, preguntas_nuevas, preguntas_olvidadas,
+)
+
+# ── Planificador SM-2 ─────────────────────────────────────────────────────────
+
+# Calidad SM-2 (0-5) asignada a cada respuesta: el test solo distingue acierto y fallo
+CALIDAD_ACIERTO = 4
+CALIDAD_FALLO = 1
+FACILIDAD_MINIMA = 1.3
+
+
+def programar_repaso(estado, correcta: bool, fecha) -> None:
+    """Aplica una respuesta al estado SM-2 de la pregunta y fija su próxima revisión."""
+    calidad = CALIDAD_ACIERTO if correcta else CALIDAD_FALLO
+    if calidad >= 3:
+        if estado.repeticiones == 0:
+            estado.intervalo_dias = 1
+        elif estado.repeticiones == 1:
+            estado.intervalo_dias = 6
+        else:
+            estado.intervalo_dias = round(estado.intervalo_dias * estado.facilidad)
+        estado.repeticiones += 1
+    else:
+        estado.repeticiones = 0
+        estado.intervalo_dias = 1
+
+    penalizacion = 5 - calidad
+    estado.facilidad = max(
+        FACILIDAD_MINIMA,
+        estado.facilidad + 0.1 - penalizacion * (0.08 + penalizacion * 0.02),
+    )
+    estado.fecha_proxima_revision = fecha + timedelta(days=estado.intervalo_dias)
+
+
+def preguntas_vencidas(usuario_id, pool, k: int, ahora) -> list:
+    """Hasta `k` preguntas del pool cuya revisión ha vencido, la más atrasada primero.
+
+    Es un recorrido por rango del índice (usuario, fecha_proxima_revision), así
+    que el coste es O(k log n) y no depende del historial del usuario.
+    """
+    if k <= 0:
+        return []
+    ids = (
+        EstadoPregunta.objects
+        .filter(usuario_id=usuario_id, fecha_proxima_revision__lte=ahora)
+        .order_by('fecha_proxima_revision')
+        .values_list('pregunta_id', flat=True)[:k * SOBREMUESTREO]
+    )
+    return [pid for pid in ids if pid in pool][:k]
+
+
+# ── Estrategias ───────────────────────────────────────────────────────────────
+
+class EstrategiaSeleccion:
+    """Interfaz común de las estrategias de selección.
+
+    `seleccionar` devuelve un diccionario ordenado `{cubo: [ids]}`; el examen
+    se compone concatenando los cubos y el desglose sirve para el log.
+    """
+
+    codigo = None
+
+    def seleccionar(self, usuario_id, pool, k: int, ahora) -> dict:
+        raise NotImplementedError
+
+    @staticmethod
+    def rellenar(cubos: dict, pool, k: int) -> dict:
+        """Completa con preguntas al azar del pool los huecos que queden."""
+        elegidas = {pid for ids in cubos.values() for pid in ids}
+        cubos['relleno'] = muestrear(pool, k - len(elegidas), excluir=elegidas)
+        return cubos
+
+
+class EstrategiaAdaptativa(EstrategiaSeleccion):
+    """40% falladas, 30% olvidadas y el resto nuevas (o relleno)."""
+
+    codigo = Oposicion.EstrategiaSeleccion.ADAPTATIVA
+
+    def seleccionar(self, usuario_id, pool, k: int, ahora) -> dict:
+        falladas = preguntas_falladas(usuario_id, pool, int(k * 0.40))
+        olvidadas = preguntas_olvidadas(
+            usuario_id, pool, min(int(k * 0.30), k - len(falladas))
+        )
+        elegidas = falladas + olvidadas
+        nuevas = preguntas_nuevas(usuario_id, pool, k - len(elegidas), excluir=set(elegidas))
+        return self.rellenar(
+            {'falladas': falladas, 'olvidadas': olvidadas, 'nuevas': nuevas}, pool, k
+        )
+
+
+class EstrategiaRepasoEspaciado(EstrategiaSeleccion):
+    """Primero las preguntas vencidas según SM-2 y después preguntas nuevas."""
+
+    codigo = Oposicion.EstrategiaSeleccion.REPASO_ESPACIADO
+
+    def seleccionar(self, usuario_id, pool, k: int, ahora) -> dict:
+        vencidas = preguntas_vencidas(usuario_id, pool, k, ahora)
+        nuevas = preguntas_nuevas(usuario_id, pool, k - len(vencidas), excluir=set(vencidas))
+        return self.rellenar({'vencidas': vencidas, 'nuevas': nuevas}, pool, k)
+
+
+ESTRATEGIAS = {
+    estrategia.codigo: estrategia
+    for estrategia in (EstrategiaAdaptativa, EstrategiaRepasoEspaciado)
+}
+
+
+def obtener_estrategia(oposicion) -> EstrategiaSeleccion:
+    """Estrategia configurada en la oposición (la adaptativa si no hay oposición)."""
+    codigo = oposicion.estrategia_seleccion if oposicion else None
+    return ESTRATEGIAS.get(codigo, EstrategiaAdaptativa)()
@@ -0,0 +1,164 @@
+"""
+    Señales que invalidan las cachés derivadas del contenido del temario
+    y mantienen al día el índice de búsqueda y las firmas de duplicados
+
+    Las versiones de las cachés se incrementan con `transaction.on_commit`:
+    si se incrementaran dentro de la transacción del guardado, otro proceso
+    podría reconstruir la caché con los datos anteriores y dejarla guardada
+    con la versión nueva.
+"""
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import busqueda, duplicados
+from .condicional import invalidar_capitulo, invalidar_perfil
+from .models import (
+    Oposicion, Tema, Capitulo, Articulo, Pregunta, DocumentoBusqueda, PerfilUsuario, RecursoTema,
+)
+from .muestreo import invalidar_pools
+from .temario import invalidar_temario
+
+
+@receiver(post_save, sender=Tema)
+@receiver(post_delete, sender=Tema)
+@receiver(post_save, sender=Capitulo)
+@receiver(post_delete, sender=Capitulo)
+@receiver(post_save, sender=Articulo)
+@receiver(post_delete, sender=Articulo)
+@receiver(post_save, sender=Pregunta)
+@receiver(post_delete, sender=Pregunta)
+def contenido_modificado(sender, **kwargs):
+    """Cualquier cambio en el temario o en el banco de preguntas cambia los pools."""
+    transaction.on_commit(invalidar_pools)
+
+
+@receiver(post_save, sender=Oposicion)
+@receiver(post_delete, sender=Oposicion)
+@receiver(post_save, sender=Tema)
+@receiver(post_delete, sender=Tema)
+@receiver(post_save, sender=Capitulo)
+@receiver(post_delete, sender=Capitulo)
+def estructura_modificada(sender, **kwargs):
+    """Los temas y capítulos forman el árbol cacheado del temario.
+
+    Las oposiciones no están en el árbol, pero su versión forma parte del ETag
+    de las páginas del temario, que muestran sus nombres.
+    """
+    transaction.on_commit(invalidar_temario)
+
+
+# ── ETags de las páginas de estudio ───────────────────────────────────────────
+
+@receiver(pre_save, sender=Articulo)
+def recordar_capitulo_articulo(sender, instance, raw=False, **kwargs):
+    """Guarda el capítulo anterior del artículo para invalidarlo si se mueve."""
+    if instance.pk and not raw:
+        instance._capitulo_anterior_id = (
+            Articulo.objects.filter(pk=instance.pk).values_list('capitulo_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Capitulo)
+@receiver(post_delete, sender=Capitulo)
+def capitulo_modificado(sender, instance, **kwargs):
+    capitulo_id = instance.pk
+    transaction.on_commit(lambda: invalidar_capitulo(capitulo_id))
+
+
+@receiver(post_save, sender=Articulo)
+@receiver(post_delete, sender=Articulo)
+@receiver(post_save, sender=RecursoTema)
+@receiver(post_delete, sender=RecursoTema)
+def contenido_capitulo_modificado(sender, instance, **kwargs):
+    capitulos = {instance.capitulo_id, getattr(instance, '_capitulo_anterior_id', None)} - {None}
+    for capitulo_id in capitulos:
+        transaction.on_commit(lambda capitulo_id=capitulo_id: invalidar_capitulo(capitulo_id))
+
+
+@receiver(post_save, sender=PerfilUsuario)
+def perfil_modificado(sender, instance, **kwargs):
+    usuario_id = instance.usuario_id
+    transaction.on_commit(lambda: invalidar_perfil(usuario_id))
+
+
+@receiver(m2m_changed, sender=PerfilUsuario.oposiciones_inscritas.through)
+def oposiciones_inscritas_modificadas(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        usuarios = [instance.usuario_id]
+    else:
+        # Desde la oposición: `pk_set` son perfiles (vacío en `post_clear`)
+        perfiles = PerfilUsuario.objects.all() if pk_set is None else PerfilUsuario.objects.filter(pk__in=pk_set)
+        usuarios = list(perfiles.values_list('usuario_id', flat=True))
+
+    def invalidar():
+        for usuario_id in usuarios:
+            invalidar_perfil(usuario_id)
+    transaction.on_commit(invalidar)
+
+
+@receiver(m2m_changed, sender=Tema.oposiciones.through)
+def oposiciones_tema_modificadas(sender, action, **kwargs):
+    """Vincular o desvincular un tema de una oposición cambia su pool y su temario."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(invalidar_pools)
+        transaction.on_commit(invalidar_temario)
+
+
+# ── Índice de búsqueda ────────────────────────────────────────────────────────
+
+# Campos de los que sale cada documento de búsqueda
+CAMPOS_INDEXADOS = {
+    Articulo: {'numero', 'contenido', 'capitulo'},
+    Pregunta: {
+        'enunciado', 'respuesta_a', 'respuesta_b', 'respuesta_c', 'respuesta_d',
+        'explicacion', 'articulo',
+    },
+    Capitulo: {'titulo'},
+}
+INDEXADORES = {
+    Articulo: busqueda.indexar_articulo,
+    Pregunta: busqueda.indexar_pregunta,
+    Capitulo: busqueda.indexar_capitulo,
+}
+TIPOS_DOCUMENTO = {
+    Articulo: DocumentoBusqueda.TipoDocumento.ARTICULO,
+    Pregunta: DocumentoBusqueda.TipoDocumento.PREGUNTA,
+    Capitulo: DocumentoBusqueda.TipoDocumento.CAPITULO,
+}
+
+
+@receiver(post_save, sender=Capitulo)
+@receiver(post_save, sender=Articulo)
+@receiver(post_save, sender=Pregunta)
+def indexar_contenido(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Actualiza el documento de búsqueda si ha cambiado alguno de sus campos.
+
+    Las cargas de fixtures (`raw`) se indexan después con `reindexar_busqueda`.
+    """
+    if raw or (update_fields is not None and not CAMPOS_INDEXADOS[sender] & set(update_fields)):
+        return
+    INDEXADORES[sender](instance)
+
+
+@receiver(post_delete, sender=Capitulo)
+@receiver(post_delete, sender=Articulo)
+@receiver(post_delete, sender=Pregunta)
+def desindexar_contenido(sender, instance, **kwargs):
+    busqueda.desindexar(TIPOS_DOCUMENTO[sender], instance.pk)
+
+
+# ── Detección de duplicados ───────────────────────────────────────────────────
+
+@receiver(post_save, sender=Pregunta)
+def firmar_pregunta(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Recalcula la firma MinHash si ha cambiado el texto (el borrado va en cascada).
+
+    Las cargas de fixtures (`raw`) se firman después con `indexar_duplicados`.
+    """
+    if raw or (update_fields is not None and not set(duplicados.CAMPOS_FIRMADOS) & set(update_fields)):
+        return
+    duplicados.indexar_pregunta(instance)
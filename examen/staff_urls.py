@@ -11,6 +11,11 @@ urlpatterns = [
 
     # ── Gestión de preguntas ──────────────────────────────────────────────────
     path('preguntas/nueva/', examen_views.NuevaPreguntaStaffView.as_view(), name='nueva_pregunta'),
+    path('preguntas/importar/', examen_views.ImportarPreguntasStaffView.as_view(), name='importar_preguntas'),
+    path('preguntas/duplicados/', examen_views.DuplicadosStaffView.as_view(), name='duplicados'),
+
+    # ── Perfiles de peticiones ────────────────────────────────────────────────
+    path('perfiles/<str:perfil_id>/', examen_views.PerfilStaffView.as_view(), name='perfil'),
 
     # ── APIs JSON para selects en cascada ─────────────────────────────────────
     path('api/temas/', examen_views.ApiTemasPorOposicionView.as_view(), name='api_temas'),
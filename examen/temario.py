@@ -0,0 +1,156 @@
+"""Árbol del temario (temas y capítulos) de cada oposición, cacheado.
+
+El temario, el detalle de un tema, la navegación entre capítulos y las APIs
+en cascada del panel de staff solo necesitan ids, títulos, el orden, el
+bloque y los enlaces anterior/siguiente. `arbol_temario` los construye con
+dos consultas y los guarda en la caché de Django bajo una clave versionada;
+cada proceso conserva además el último árbol leído mientras la versión siga
+vigente, como los pools de `examen.muestreo`.
+
+Las señales de `examen.signals` llaman a `invalidar_temario`, al confirmarse
+la transacción, cuando se guardan o borran temas y capítulos o cambian las
+oposiciones de un tema. Guardar artículos o preguntas no afecta al árbol.
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Capitulo, Tema
+from .versiones import incrementar_version, obtener_version
+
+# Ámbito del contador de versión de la estructura del temario
+VERSION_TEMARIO = 'temario'
+
+
+class NodoTema:
+    """Tema del árbol, con los ids de sus capítulos en orden."""
+
+    __slots__ = ('id', 'titulo', 'bloque', 'orden', 'documentacion', 'capitulos')
+
+    def __init__(self, id, titulo, bloque, orden, documentacion):
+        self.id = id
+        self.titulo = titulo
+        self.bloque = bloque
+        self.orden = orden
+        self.documentacion = documentacion  # Nombre del fichero ('' si no hay)
+        self.capitulos = []
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class NodoCapitulo:
+    """Capítulo del árbol con los ids de sus vecinos dentro del tema."""
+
+    __slots__ = (
+        'id', 'tema_id', 'titulo', 'orden', 'importancia', 'es_modificacion_reciente',
+        'anterior_id', 'siguiente_id',
+    )
+
+    def __init__(self, id, tema_id, titulo, orden, importancia, es_modificacion_reciente):
+        self.id = id
+        self.tema_id = tema_id
+        self.titulo = titulo
+        self.orden = orden
+        self.importancia = importancia
+        self.es_modificacion_reciente = es_modificacion_reciente
+        self.anterior_id = None
+        self.siguiente_id = None
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class ArbolTemario:
+    """Temas (ordenados por bloque, orden y título) y capítulos de una oposición."""
+
+    __slots__ = ('oposicion_id', 'version', 'temas', 'capitulos')
+
+    def __init__(self, oposicion_id, version, temas, capitulos):
+        self.oposicion_id = oposicion_id
+        self.version = version
+        self.temas = temas            # {id: NodoTema}, en el orden del temario
+        self.capitulos = capitulos    # {id: NodoCapitulo}
+
+    def lista_temas(self) -> list:
+        return list(self.temas.values())
+
+    def capitulos_de(self, tema_id) -> list:
+        tema = self.temas.get(tema_id)
+        return [self.capitulos[pk] for pk in tema.capitulos] if tema else []
+
+    def anterior(self, capitulo_id):
+        nodo = self.capitulos.get(capitulo_id)
+        return self.capitulos[nodo.anterior_id] if nodo and nodo.anterior_id else None
+
+    def siguiente(self, capitulo_id):
+        nodo = self.capitulos.get(capitulo_id)
+        return self.capitulos[nodo.siguiente_id] if nodo and nodo.siguiente_id else None
+
+
+def construir_arbol(oposicion_id, version) -> ArbolTemario:
+    """Lee temas y capítulos con dos consultas y enlaza los capítulos vecinos."""
+    temas_qs = Tema.objects.all()
+    if oposicion_id is not None:
+        temas_qs = temas_qs.filter(oposiciones=oposicion_id)
+    temas = {
+        fila['id']: NodoTema(**fila)
+        for fila in temas_qs.order_by('bloque', 'orden', 'titulo').values(
+            'id', 'titulo', 'bloque', 'orden', 'documentacion',
+        )
+    }
+
+    capitulos = {}
+    filas = (
+        Capitulo.objects.filter(tema_id__in=list(temas))
+        .order_by('tema_id', 'orden', 'titulo')
+        .values('id', 'tema_id', 'titulo', 'orden', 'importancia', 'es_modificacion_reciente')
+    )
+    anterior = None
+    for fila in filas:
+        nodo = NodoCapitulo(**fila)
+        if anterior is not None and anterior.tema_id == nodo.tema_id:
+            anterior.siguiente_id = nodo.id
+            nodo.anterior_id = anterior.id
+        capitulos[nodo.id] = nodo
+        temas[nodo.tema_id].capitulos.append(nodo.id)
+        anterior = nodo
+    return ArbolTemario(oposicion_id, version, temas, capitulos)
+
+
+_arboles = {}
+_arboles_lock = threading.Lock()
+
+
+def arbol_temario(oposicion_id=None) -> ArbolTemario:
+    """Árbol de una oposición (o de todo el temario si no se indica)."""
+    version = obtener_version(VERSION_TEMARIO)
+    arbol = _arboles.get(oposicion_id)
+    if arbol is not None and arbol.version == version:
+        return arbol
+
+    clave = f'temario:{oposicion_id or 0}:{version}'
+    arbol = cache.get(clave)
+    if arbol is None:
+        arbol = construir_arbol(oposicion_id, version)
+        cache.set(clave, arbol, getattr(settings, 'TEMARIO_CACHE_TIMEOUT', 24 * 3600))
+    with _arboles_lock:
+        _arboles[oposicion_id] = arbol
+    return arbol
+
+
+def arbol_con_capitulo(capitulo_id, oposicion_id=None) -> ArbolTemario:
+    """Árbol de la oposición si contiene el capítulo; si no, el del temario completo."""
+    arbol = arbol_temario(oposicion_id)
+    if capitulo_id in arbol.capitulos or oposicion_id is None:
+        return arbol
+    return arbol_temario(None)
+
+
+def invalidar_temario() -> None:
+    """Marca como obsoletos los árboles de todas las oposiciones."""
+    incrementar_version(VERSION_TEMARIO)
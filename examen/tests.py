@@ -1,3 +1,1204 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .busqueda import ResultadosBusqueda, ids_coincidentes
+from .importacion import importar_preguntas, leer_json
+from .legislacion import cargar_ley, leer_ley
+from .dashboard import contexto_dashboard, invalidar_dashboard
+from .duplicados import buscar_similares, grupos_duplicados, indexar_banco
+from .estadisticas import (
+    actualizar_estadisticas_capitulos, actualizar_estado_preguntas,
+    reconstruir_estado_preguntas, rendimiento_por_tema, tiempo_por_tema,
+)
+from .models import (
+    Oposicion, Tema, Capitulo, Articulo, Pregunta, Examen, RespuestaUsuario, EstadoPregunta,
+    EstadisticaCapitulo, DocumentoBusqueda, RecursoTema, FirmaPregunta, TiempoEstudio,
+)
+from .muestreo import (
+    INTENTOS_NUEVAS, pool_capitulo, pool_oposicion,
+    preguntas_falladas, preguntas_nuevas, preguntas_olvidadas,
+)
+from .temario import arbol_temario
+from .tiempo_estudio import registrar_latido
+from .seleccion import (
+    EstrategiaAdaptativa, EstrategiaRepasoEspaciado, obtener_estrategia,
+    preguntas_vencidas, programar_repaso,
+)
+
+
+def crear_usuario(email='opositor@example.com'):
+    return get_user_model().objects.create_user(email=email, username=email, password='clave-segura')
+
+
+def crear_temario(oposicion, num_temas, preguntas_por_tema=2):
+    """Crea `num_temas` temas con un capítulo, un artículo y varias preguntas cada uno."""
+    preguntas = []
+    for orden in range(1, num_temas + 1):
+        tema = Tema.objects.create(titulo=f'Tema {orden}', orden=orden)
+        tema.oposiciones.add(oposicion)
+        capitulo = Capitulo.objects.create(tema=tema, titulo=f'Capítulo {orden}', orden=1)
+        articulo = Articulo.objects.create(capitulo=capitulo, numero='1', contenido='Texto del artículo.')
+        for n in range(preguntas_por_tema):
+            preguntas.append(Pregunta.objects.create(
+                articulo=articulo, enunciado=f'Pregunta {orden}.{n}',
+                respuesta_a='a', respuesta_b='b', respuesta_c='c', respuesta_d='d',
+                respuesta_correcta='A',
+            ))
+    return preguntas
+
+
+def finalizar_examen(usuario, oposicion, respuestas, fecha=None, sin_responder=()):
+    """Crea un examen con las respuestas dadas ({pregunta: letra}) y lo finaliza."""
+    examen = Examen.objects.create(usuario=usuario, oposicion=oposicion)
+    examen.asignar_preguntas([p.pk for p in (*respuestas.keys(), *sin_responder)])
+    for pregunta, letra in respuestas.items():
+        RespuestaUsuario.objects.create(examen=examen, pregunta=pregunta, respuesta_seleccionada=letra)
+    examen.fecha_finalizacion = fecha or timezone.now()
+    examen.puntuacion = 0
+    examen.save()
+    actualizar_estadisticas_capitulos(examen)
+    actualizar_estado_preguntas(examen)
+    return examen
+
+
+class RendimientoPorTemaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+
+    def test_porcentaje_y_clase_por_tema(self):
+        p1, p2, p3, p4 = crear_temario(self.oposicion, num_temas=2)
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'A', p2: 'A', p3: 'A', p4: 'B'})
+
+        self.assertEqual(rendimiento_por_tema(self.usuario, self.oposicion), [
+            {'nombre': 'Tema 2', 'pct': 50, 'clase': 'warning'},
+            {'nombre': 'Tema 1', 'pct': 100, 'clase': 'success'},
+        ])
+
+    def test_temas_sin_respuestas_no_aparecen(self):
+        crear_temario(self.oposicion, num_temas=3)
+        self.assertEqual(rendimiento_por_tema(self.usuario, self.oposicion), [])
+
+    def test_numero_de_consultas_no_crece_con_los_temas(self):
+        def consultas_con(num_temas):
+            oposicion = Oposicion.objects.create(nombre=f'Oposición {num_temas}')
+            preguntas = crear_temario(oposicion, num_temas)
+            finalizar_examen(self.usuario, oposicion, {p: 'A' for p in preguntas})
+            with CaptureQueriesContext(connection) as ctx:
+                filas = rendimiento_por_tema(self.usuario, oposicion)
+            self.assertEqual(len(filas), num_temas)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(consultas_con(2), consultas_con(20))
+
+
+class EstadisticasCapituloTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.otro = crear_usuario('otro@example.com')
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=3)
+
+    def estadisticas(self):
+        return sorted(EstadisticaCapitulo.objects.values_list(
+            'usuario_id', 'capitulo_id', 'total_respuestas', 'total_fallos', 'fecha_ultimo_acierto',
+        ))
+
+    def test_incremental_coincide_con_la_reconstruccion(self):
+        p1, p2, p3, p4, p5, _p6 = self.preguntas
+        ahora = timezone.now()
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'A', p2: 'B', p3: 'A'},
+                         fecha=ahora - timedelta(days=10), sin_responder=[p5])
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'B', p3: 'C', p4: 'A'},
+                         fecha=ahora - timedelta(days=2))
+        finalizar_examen(self.otro, self.oposicion, {p2: 'A', p5: 'B'}, fecha=ahora)
+        incremental = self.estadisticas()
+        self.assertIn((self.usuario.pk, p1.articulo.capitulo_id, 3, 2, ahora - timedelta(days=10)), incremental)
+
+        call_command('reconstruir_estadisticas', stdout=StringIO())
+        self.assertEqual(self.estadisticas(), incremental)
+
+        # Con --email solo se reconstruyen las filas de ese usuario
+        EstadisticaCapitulo.objects.filter(usuario=self.otro).update(total_respuestas=99)
+        call_command('reconstruir_estadisticas', email=self.usuario.email, stdout=StringIO())
+        self.assertTrue(
+            EstadisticaCapitulo.objects.filter(usuario=self.otro, total_respuestas=99).exists()
+        )
+        self.assertEqual(
+            [fila for fila in self.estadisticas() if fila[0] == self.usuario.pk],
+            [fila for fila in incremental if fila[0] == self.usuario.pk],
+        )
+
+    def test_fila_creada_a_la_vez_por_otro_examen_se_suma(self):
+        p1 = self.preguntas[0]
+        crear_filas = EstadisticaCapitulo.objects.bulk_create
+
+        def crear_tras_otro_examen(filas, **kwargs):
+            # Otra finalización del mismo usuario inserta la fila justo antes
+            EstadisticaCapitulo.objects.create(
+                usuario=self.usuario, capitulo_id=p1.articulo.capitulo_id, total_respuestas=5, total_fallos=1,
+            )
+            return crear_filas(filas, **kwargs)
+
+        with mock.patch.object(EstadisticaCapitulo.objects, 'bulk_create', crear_tras_otro_examen):
+            examen = finalizar_examen(self.usuario, self.oposicion, {p1: 'B'})
+        self.assertEqual(self.estadisticas(), [
+            (self.usuario.pk, p1.articulo.capitulo_id, 6, 2, None),
+        ])
+        self.assertIsNotNone(examen.fecha_finalizacion)
+
+
+class ContextoDashboardCacheMixin:
+    """Pruebas de la caché del dashboard, comunes a varios backends."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=2)
+
+    def test_segunda_lectura_no_consulta_la_base_de_datos(self):
+        contexto_dashboard(self.usuario, self.oposicion)
+        with self.assertNumQueries(0):
+            contexto = contexto_dashboard(self.usuario, self.oposicion)
+        self.assertEqual(contexto['total_examenes'], 0)
+
+    def test_invalidar_recalcula_el_contexto(self):
+        self.assertEqual(contexto_dashboard(self.usuario, self.oposicion)['total_examenes'], 0)
+        finalizar_examen(self.usuario, self.oposicion, {self.preguntas[0]: 'A'})
+        self.assertEqual(contexto_dashboard(self.usuario, self.oposicion)['total_examenes'], 0)
+
+        invalidar_dashboard(self.usuario.pk)
+
+        contexto = contexto_dashboard(self.usuario, self.oposicion)
+        self.assertEqual(contexto['total_examenes'], 1)
+        self.assertEqual(contexto['rendimiento_por_tema'][0]['pct'], 100)
+
+    def test_acierto_global_ignora_los_examenes_en_curso(self):
+        finalizar_examen(self.usuario, self.oposicion, {self.preguntas[0]: 'A'})
+        en_curso = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        en_curso.asignar_preguntas([self.preguntas[1].pk])
+        en_curso.guardar_respuestas({self.preguntas[1].pk: 'B'})
+        self.assertEqual(contexto_dashboard(self.usuario, self.oposicion)['acierto_global_pct'], 100)
+
+    def test_invalidar_solo_afecta_al_usuario_indicado(self):
+        otro = crear_usuario('otro@example.com')
+        contexto_dashboard(self.usuario, self.oposicion)
+        contexto_dashboard(otro, self.oposicion)
+        finalizar_examen(otro, self.oposicion, {self.preguntas[0]: 'B'})
+
+        invalidar_dashboard(otro.pk)
+
+        with self.assertNumQueries(0):
+            contexto_dashboard(self.usuario, self.oposicion)
+        self.assertEqual(contexto_dashboard(otro, self.oposicion)['total_examenes'], 1)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+})
+class ContextoDashboardLocMemTests(ContextoDashboardCacheMixin, TestCase):
+    pass
+
+
+class ContextoDashboardFicheroTests(ContextoDashboardCacheMixin, TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directorio.name,
+            },
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        super().setUp()
+
+
+class PoolPreguntasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=2)
+
+    def test_pool_contiene_las_preguntas_de_la_oposicion(self):
+        otra = Oposicion.objects.create(nombre='Otra oposición')
+        ajena = crear_temario(otra, num_temas=1)[0]
+
+        pool = pool_oposicion(self.oposicion.pk)
+        self.assertEqual(list(pool), sorted(p.pk for p in self.preguntas))
+        self.assertIn(self.preguntas[0].pk, pool)
+        self.assertNotIn(ajena.pk, pool)
+
+    def test_segunda_lectura_no_consulta_la_base_de_datos(self):
+        pool_oposicion(self.oposicion.pk)
+        with self.assertNumQueries(0):
+            pool_oposicion(self.oposicion.pk)
+
+    def test_cambios_en_el_contenido_reconstruyen_el_pool(self):
+        capitulo = self.preguntas[0].articulo.capitulo
+        self.assertEqual(len(pool_capitulo(capitulo.pk)), 2)
+
+        # La versión cambia al confirmar la transacción, no antes
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.preguntas[0].delete()
+        self.assertEqual(len(pool_capitulo(capitulo.pk)), 2)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(pool_capitulo(capitulo.pk)), 1)
+
+        tema = capitulo.tema
+        with self.captureOnCommitCallbacks(execute=True):
+            tema.oposiciones.remove(self.oposicion)
+        self.assertEqual(len(pool_oposicion(self.oposicion.pk)), 2)
+
+
+class EstadoPreguntaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=3)
+        self.pool = pool_oposicion(self.oposicion.pk)
+
+    def test_finalizar_examen_actualiza_el_estado(self):
+        p1, p2, p3 = self.preguntas[:3]
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'A', p2: 'B'}, fecha=hace_una_semana)
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'B', p2: 'A'}, sin_responder=[p3])
+
+        estados = {e.pregunta_id: e for e in EstadoPregunta.objects.filter(usuario=self.usuario)}
+        self.assertEqual((estados[p1.pk].veces_vista, estados[p1.pk].veces_fallada), (2, 1))
+        self.assertIs(estados[p1.pk].ultima_correcta, False)
+        self.assertEqual(estados[p1.pk].fecha_ultimo_acierto, hace_una_semana)
+        self.assertIs(estados[p2.pk].ultima_correcta, True)
+        self.assertIsNone(estados[p3.pk].ultima_correcta)
+        self.assertEqual(estados[p3.pk].veces_vista, 1)
+
+    def test_cubos_del_algoritmo_adaptativo(self):
+        p1, p2, p3, p4 = self.preguntas[:4]
+        ahora = timezone.now()
+        finalizar_examen(self.usuario, self.oposicion, {p3: 'A'}, fecha=ahora - timedelta(days=30))
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'B', p4: 'A'}, fecha=ahora, sin_responder=[p2])
+
+        self.assertEqual(preguntas_falladas(self.usuario.pk, self.pool, 10), [p1.pk])
+        self.assertEqual(preguntas_olvidadas(self.usuario.pk, self.pool, 1), [p3.pk])
+        nuevas = preguntas_nuevas(self.usuario.pk, self.pool, 10)
+        self.assertCountEqual(nuevas, [p2.pk, *(p.pk for p in self.preguntas[4:])])
+
+    def test_consultas_no_dependen_del_historial(self):
+        for pregunta in self.preguntas[:4]:
+            finalizar_examen(self.usuario, self.oposicion, {pregunta: 'A'})
+        with CaptureQueriesContext(connection) as ctx:
+            nuevas = preguntas_nuevas(self.usuario.pk, self.pool, 2)
+        self.assertLessEqual(len(ctx.captured_queries), INTENTOS_NUEVAS)
+        self.assertTrue(set(nuevas) <= {p.pk for p in self.preguntas[4:]})
+
+    def test_reconstruir_coincide_con_el_incremental(self):
+        p1, p2 = self.preguntas[:2]
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'A', p2: 'B'}, fecha=timezone.now() - timedelta(days=2))
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'B'}, sin_responder=[p2])
+        campos = (
+            'pregunta_id', 'veces_vista', 'veces_fallada', 'ultima_correcta',
+            'fecha_ultima_respuesta', 'fecha_ultimo_acierto',
+            'repeticiones', 'intervalo_dias', 'facilidad', 'fecha_proxima_revision',
+        )
+        incremental = sorted(EstadoPregunta.objects.values_list(*campos))
+
+        self.assertEqual(reconstruir_estado_preguntas(self.usuario), 2)
+        self.assertEqual(sorted(EstadoPregunta.objects.values_list(*campos)), incremental)
+
+    def test_estado_creado_a_la_vez_por_otro_examen_se_aplica_encima(self):
+        p1 = self.preguntas[0]
+        crear_filas = EstadoPregunta.objects.bulk_create
+
+        def crear_tras_otro_examen(filas, **kwargs):
+            # Otra finalización del mismo usuario guarda su acierto justo antes
+            EstadoPregunta.objects.create(
+                usuario=self.usuario, pregunta=p1, veces_vista=1, ultima_correcta=True,
+                repeticiones=1, intervalo_dias=1,
+            )
+            return crear_filas(filas, **kwargs)
+
+        with mock.patch.object(EstadoPregunta.objects, 'bulk_create', crear_tras_otro_examen):
+            finalizar_examen(self.usuario, self.oposicion, {p1: 'A'})
+        estado = EstadoPregunta.objects.get()
+        self.assertEqual((estado.veces_vista, estado.repeticiones, estado.intervalo_dias), (2, 2, 6))
+
+
+class RepasoEspaciadoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(
+            nombre='Auxiliar Administrativo',
+            estrategia_seleccion=Oposicion.EstrategiaSeleccion.REPASO_ESPACIADO,
+        )
+        self.preguntas = crear_temario(self.oposicion, num_temas=3)
+        self.pool = pool_oposicion(self.oposicion.pk)
+
+    def test_intervalos_sm2(self):
+        estado = EstadoPregunta()
+        ahora = timezone.now()
+        intervalos = []
+        for correcta in (True, True, True, False):
+            programar_repaso(estado, correcta, ahora)
+            intervalos.append(estado.intervalo_dias)
+        self.assertEqual(intervalos, [1, 6, 15, 1])
+        self.assertEqual(estado.repeticiones, 0)
+        self.assertEqual(estado.fecha_proxima_revision, ahora + timedelta(days=1))
+        self.assertGreaterEqual(estado.facilidad, 1.3)
+
+    def test_vencidas_primero_la_mas_atrasada(self):
+        p1, p2, p3 = self.preguntas[:3]
+        ahora = timezone.now()
+        finalizar_examen(self.usuario, self.oposicion, {p1: 'B'}, fecha=ahora - timedelta(days=10))
+        finalizar_examen(self.usuario, self.oposicion, {p2: 'B'}, fecha=ahora - timedelta(days=3))
+        finalizar_examen(self.usuario, self.oposicion, {p3: 'A'}, fecha=ahora)
+
+        self.assertEqual(preguntas_vencidas(self.usuario.pk, self.pool, 5, ahora), [p1.pk, p2.pk])
+
+    def test_estrategia_por_oposicion(self):
+        self.assertIsInstance(obtener_estrategia(self.oposicion), EstrategiaRepasoEspaciado)
+        self.assertIsInstance(obtener_estrategia(None), EstrategiaAdaptativa)
+
+        cubos = obtener_estrategia(self.oposicion).seleccionar(
+            self.usuario.pk, self.pool, 4, timezone.now()
+        )
+        ids = [pid for cubo in cubos.values() for pid in cubo]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+
+
+class PreguntasOrdenadasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=5)
+
+    def test_paginas_en_el_orden_asignado(self):
+        orden = [p.pk for p in reversed(self.preguntas)]
+        examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        examen.asignar_preguntas(orden)
+
+        paginator = Paginator(examen.preguntas_ordenadas(), 4)
+        paginas = [[p.pk for p in paginator.page(n)] for n in paginator.page_range]
+        self.assertEqual(paginas, [orden[0:4], orden[4:8], orden[8:10]])
+
+    def test_una_consulta_por_pagina(self):
+        examen = Examen.objects.create(
+            usuario=self.usuario, oposicion=self.oposicion, total_preguntas=len(self.preguntas)
+        )
+        with self.assertNumQueries(1):
+            examen.asignar_preguntas([p.pk for p in self.preguntas])
+        paginator = Paginator(examen.preguntas_ordenadas(), 4)
+        with self.assertNumQueries(2):
+            list(paginator.get_page(2))
+
+    def test_examenes_sin_posiciones(self):
+        examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        examen.preguntas.set(self.preguntas[:6])
+
+        paginator = Paginator(examen.preguntas_ordenadas(), 4)
+        paginas = [[p.pk for p in paginator.page(n)] for n in paginator.page_range]
+        self.assertCountEqual(paginas[0] + paginas[1], [p.pk for p in self.preguntas[:6]])
+        self.assertEqual(len(paginas[1]), 2)
+
+
+class GuardarRespuestasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=6)
+        self.examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        self.examen.asignar_preguntas([p.pk for p in self.preguntas[:10]])
+        self.client.force_login(self.usuario)
+        self.url = reverse('examen:simulacion_pagina', kwargs={'examen_id': self.examen.pk})
+
+    def test_upsert_calcula_es_correcta(self):
+        p1, p2 = self.preguntas[:2]
+        self.examen.guardar_respuestas({p1.pk: 'A', p2.pk: 'B'})
+        self.examen.guardar_respuestas({p2.pk: 'A'})
+
+        respuestas = dict(self.examen.respuestas_usuario.values_list('pregunta_id', 'es_correcta'))
+        self.assertEqual(respuestas, {p1.pk: True, p2.pk: True})
+
+    def test_ignora_preguntas_ajenas_y_letras_invalidas(self):
+        ajena, p1 = self.preguntas[11], self.preguntas[0]
+        self.assertEqual(self.examen.guardar_respuestas({ajena.pk: 'A', p1.pk: 'Z'}), 0)
+        self.assertFalse(self.examen.respuestas_usuario.exists())
+
+    def test_consultas_no_dependen_del_numero_de_respuestas(self):
+        def consultas_con(preguntas):
+            datos = {f'pregunta_{p.pk}': 'A' for p in preguntas}
+            datos['page_number'] = 1
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(self.url, datos)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(consultas_con(self.preguntas[:2]), consultas_con(self.preguntas[:10]))
+        self.assertEqual(self.examen.respuestas_usuario.count(), 10)
+
+    def test_examen_finalizado_no_admite_respuestas(self):
+        self.examen.fecha_finalizacion = timezone.now()
+        self.examen.save()
+        respuesta = self.client.post(self.url, {f'pregunta_{self.preguntas[0].pk}': 'A'})
+        self.assertRedirects(
+            respuesta, self.examen.get_absolute_url(), fetch_redirect_response=False
+        )
+        self.assertFalse(self.examen.respuestas_usuario.exists())
+
+
+class AutoguardadoRespuestasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=2)
+        self.examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        self.examen.asignar_preguntas([p.pk for p in self.preguntas])
+        self.client.force_login(self.usuario)
+        self.url = reverse('examen:simulacion_autoguardado', kwargs={'examen_id': self.examen.pk})
+
+    def enviar(self, version, respuestas):
+        return self.client.post(
+            self.url, {'version': version, 'respuestas': respuestas}, content_type='application/json'
+        )
+
+    def test_lote_guardado_incrementa_la_version(self):
+        p1, p2 = self.preguntas[:2]
+        respuesta = self.enviar(0, {str(p1.pk): 'A', str(p2.pk): 'C'})
+
+        self.assertEqual(respuesta.json(), {'version': 1})
+        self.assertEqual(
+            dict(self.examen.respuestas_usuario.values_list('pregunta_id', 'respuesta_seleccionada')),
+            {p1.pk: 'A', p2.pk: 'C'},
+        )
+
+    def test_lote_desfasado_se_rechaza(self):
+        p1 = self.preguntas[0]
+        self.enviar(0, {str(p1.pk): 'A'})
+        respuesta = self.enviar(0, {str(p1.pk): 'B'})
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['version'], 1)
+        self.assertEqual(self.examen.respuestas_usuario.get().respuesta_seleccionada, 'A')
+
+    def test_lote_invalido(self):
+        respuesta = self.client.post(self.url, 'no es json', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_examen_finalizado(self):
+        self.examen.fecha_finalizacion = timezone.now()
+        self.examen.save()
+        respuesta = self.enviar(0, {str(self.preguntas[0].pk): 'A'})
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['url'], self.examen.get_absolute_url())
+
+    def test_examen_de_otro_usuario(self):
+        self.client.force_login(crear_usuario('otro@example.com'))
+        self.assertEqual(self.enviar(0, {}).status_code, 404)
+
+
+class FinalizarExamenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=3)
+        self.examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        self.examen.asignar_preguntas([p.pk for p in self.preguntas[:5]])
+        p1, p2, p3 = self.preguntas[:3]
+        self.examen.guardar_respuestas({p1.pk: 'A', p2.pk: 'A', p3.pk: 'B'})
+        self.client.force_login(self.usuario)
+        self.url = self.examen.get_absolute_url()
+
+    def test_guarda_contadores_y_puntuacion(self):
+        respuesta = self.client.get(self.url)
+
+        self.examen.refresh_from_db()
+        self.assertEqual(
+            (self.examen.respuestas_correctas, self.examen.respuestas_erroneas,
+             self.examen.respuestas_en_blanco, self.examen.total_preguntas),
+            (2, 1, 2, 5),
+        )
+        self.assertAlmostEqual(self.examen.puntuacion, 2 - 0.33)
+        self.assertEqual(
+            (respuesta.context['aciertos'], respuesta.context['errores'], respuesta.context['sin_contestar']),
+            (2, 1, 2),
+        )
+        self.assertEqual(len(respuesta.context['preguntas_falladas']), 1)
+
+    def test_no_finaliza_dos_veces(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        estado = EstadoPregunta.objects.get(usuario=self.usuario, pregunta=self.preguntas[0])
+        self.assertEqual(estado.veces_vista, 1)
+
+    def test_post_de_finalizar_redirige_a_resultados(self):
+        respuesta = self.client.post(self.url)
+        self.assertRedirects(respuesta, self.url, fetch_redirect_response=False)
+
+
+class TotalPreguntasTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=2)
+
+    def test_porcentaje_acierto_sin_consultas(self):
+        examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        examen.asignar_preguntas([p.pk for p in self.preguntas])
+        examen.respuestas_correctas = 3
+        with self.assertNumQueries(0):
+            self.assertEqual(examen.porcentaje_acierto, 75.0)
+
+    def test_rellenar_total_preguntas(self):
+        examenes = []
+        for _ in range(3):
+            examen = Examen.objects.create(
+                usuario=self.usuario, oposicion=self.oposicion,
+                fecha_finalizacion=timezone.now(), respuestas_correctas=1, respuestas_erroneas=1,
+            )
+            examen.preguntas.set(self.preguntas)
+            examenes.append(examen)
+        vacio = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+
+        call_command('rellenar_total_preguntas', lote=2, stdout=StringIO())
+
+        for examen in examenes:
+            examen.refresh_from_db()
+            self.assertEqual((examen.total_preguntas, examen.respuestas_en_blanco), (4, 2))
+        vacio.refresh_from_db()
+        self.assertEqual(vacio.total_preguntas, 0)
+
+    def test_rellenar_sin_una_consulta_por_examen(self):
+        for finalizado in (True, False, False, False):
+            examen = Examen.objects.create(
+                usuario=self.usuario, oposicion=self.oposicion,
+                fecha_finalizacion=timezone.now() if finalizado else None,
+            )
+            examen.preguntas.set(self.preguntas)
+
+        # Lote, SAVEPOINT, un UPDATE por grupo, RELEASE y el lote vacío final
+        with self.assertNumQueries(6):
+            call_command('rellenar_total_preguntas', lote=10, stdout=StringIO())
+        self.assertEqual(
+            sorted(Examen.objects.values_list('total_preguntas', 'respuestas_en_blanco')),
+            [(4, 0), (4, 0), (4, 0), (4, 4)],
+        )
+
+
+class MarkdownRenderizadoTests(TestCase):
+
+    def setUp(self):
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.pregunta = crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=1)[0]
+        self.articulo = self.pregunta.articulo
+
+    def test_se_renderiza_al_guardar(self):
+        self.articulo.contenido = 'Texto con **negrita**.'
+        self.articulo.save()
+        self.assertEqual(self.articulo.contenido_html, '<p>Texto con <strong>negrita</strong>.</p>')
+
+    def test_html_incrustado_se_escapa(self):
+        self.pregunta.enunciado = '<script>alert(1)</script> [enlace](javascript:alert(1))'
+        self.pregunta.save()
+        self.assertNotIn('<script>', self.pregunta.enunciado_html)
+        self.assertNotIn('javascript:', self.pregunta.enunciado_html)
+
+    def test_solo_renderiza_si_cambia_el_texto(self):
+        self.assertFalse(self.pregunta.actualizar_html())
+        self.pregunta.explicacion = 'Ver *art. 14*.'
+        self.assertTrue(self.pregunta.actualizar_html())
+        self.assertEqual(self.pregunta.explicacion_html, '<p>Ver <em>art. 14</em>.</p>')
+
+    def test_update_fields_incluye_el_html(self):
+        self.articulo.contenido = '# Título'
+        self.articulo.save(update_fields=['contenido'])
+        self.articulo.refresh_from_db()
+        self.assertEqual(self.articulo.contenido_html, '<h1>Título</h1>')
+
+    def test_comando_renderiza_filas_pendientes(self):
+        Articulo.objects.filter(pk=self.articulo.pk).update(contenido='*nuevo*', huella_html='')
+        call_command('renderizar_markdown', stdout=StringIO())
+        self.articulo.refresh_from_db()
+        self.assertEqual(self.articulo.contenido_html, '<p><em>nuevo</em></p>')
+
+
+class BusquedaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.client.force_login(self.usuario)
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.pregunta = crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=1)[0]
+        self.articulo = self.pregunta.articulo
+        self.articulo.contenido = 'La Constitución reconoce el derecho de petición.'
+        self.articulo.save()
+
+    def tipos(self, consulta, tipo=None):
+        return [(d.tipo, d.objeto_id) for d in ResultadosBusqueda(consulta, tipo)[:10]]
+
+    def test_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(self.tipos('constitucion'), [('ART', self.articulo.pk)])
+        self.assertEqual(self.tipos('peti'), [('ART', self.articulo.pk)])
+
+    def test_indexa_respuestas_y_titulo_de_capitulo(self):
+        self.pregunta.respuesta_c = 'Defensor del Pueblo'
+        self.pregunta.save()
+        self.assertEqual(self.tipos('defensor pueblo'), [('PRE', self.pregunta.pk)])
+        self.assertEqual(self.tipos('capítulo', tipo='CAP'), [('CAP', self.articulo.capitulo_id)])
+
+    def test_borrar_desindexa(self):
+        self.articulo.delete()
+        self.assertEqual(self.tipos('constitucion'), [])
+        self.assertEqual(list(DocumentoBusqueda.objects.values_list('tipo', flat=True)), ['CAP'])
+
+    def test_sintaxis_de_consulta_no_falla(self):
+        self.assertEqual(self.tipos('"constitución* AND (NOT'), [])
+        self.assertEqual(ResultadosBusqueda('  ¿?  ').count(), 0)
+
+    def test_vista_resalta_y_escapa(self):
+        self.articulo.contenido = '<b>Petición</b> ante las Cortes.'
+        self.articulo.save()
+        respuesta = self.client.get(reverse('examen:busqueda'), {'q': 'peticion'})
+        self.assertEqual(respuesta.context['page_obj'].paginator.count, 1)
+        self.assertContains(respuesta, '&lt;b&gt;<mark>Petición</mark>&lt;/b&gt;')
+
+    def test_admin_busca_en_el_indice(self):
+        self.assertEqual(ids_coincidentes('PRE', 'pregunta'), [self.pregunta.pk])
+        staff = crear_usuario('staff@example.com')
+        staff.is_staff = staff.is_superuser = True
+        staff.save()
+        self.client.force_login(staff)
+        respuesta = self.client.get(reverse('admin:examen_articulo_changelist'), {'q': 'constitucion'})
+        self.assertEqual(list(respuesta.context['cl'].result_list), [self.articulo])
+
+        # Los campos relacionados que no están en el índice se buscan con el ORM
+        Tema.objects.filter(capitulosTema__articulosCapitulo=self.articulo).update(titulo='Derechos fundamentales')
+        otra = crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=1)[0]
+        Capitulo.objects.filter(articulosCapitulo__preguntasArticulo=otra).update(titulo='Garantías')
+        respuesta = self.client.get(reverse('admin:examen_articulo_changelist'), {'q': 'fundamentales'})
+        self.assertEqual(list(respuesta.context['cl'].result_list), [self.articulo])
+        respuesta = self.client.get(reverse('admin:examen_pregunta_changelist'), {'q': 'Garantías'})
+        self.assertEqual(list(respuesta.context['cl'].result_list), [otra])
+
+    def test_comando_reconstruye_el_indice(self):
+        DocumentoBusqueda.objects.all().delete()
+        call_command('reindexar_busqueda', stdout=StringIO())
+        self.assertEqual(DocumentoBusqueda.objects.count(), 3)
+        self.assertEqual(self.tipos('constitucion'), [('ART', self.articulo.pk)])
+
+
+class ArbolTemarioTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.client.force_login(self.usuario)
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        crear_temario(self.oposicion, num_temas=2, preguntas_por_tema=1)
+        self.tema = Tema.objects.get(titulo='Tema 1')
+        self.c1 = Capitulo.objects.get(tema=self.tema)
+        self.c2 = Capitulo.objects.create(tema=self.tema, titulo='Segundo', orden=2)
+        self.c3 = Capitulo.objects.create(tema=self.tema, titulo='Tercero', orden=3)
+
+    def test_orden_y_vecinos(self):
+        arbol = arbol_temario(self.oposicion.pk)
+        self.assertEqual([t.titulo for t in arbol.lista_temas()], ['Tema 1', 'Tema 2'])
+        self.assertEqual([c.id for c in arbol.capitulos_de(self.tema.pk)], [self.c1.pk, self.c2.pk, self.c3.pk])
+        self.assertIsNone(arbol.anterior(self.c1.pk))
+        self.assertEqual(arbol.anterior(self.c2.pk).id, self.c1.pk)
+        self.assertEqual(arbol.siguiente(self.c2.pk).id, self.c3.pk)
+        self.assertIsNone(arbol.siguiente(self.c3.pk))
+
+    def test_se_construye_una_vez(self):
+        arbol_temario(self.oposicion.pk)
+        with self.assertNumQueries(0):
+            arbol_temario(self.oposicion.pk)
+
+    def test_senales_invalidan(self):
+        arbol_temario(self.oposicion.pk)
+        # El árbol cacheado sigue vigente hasta que se confirma la transacción
+        c2_id = self.c2.pk
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.c2.delete()
+        self.assertEqual(arbol_temario(self.oposicion.pk).siguiente(self.c1.pk).id, c2_id)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(arbol_temario(self.oposicion.pk).siguiente(self.c1.pk).id, self.c3.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            otro = Tema.objects.create(titulo='Tema nuevo', orden=3)
+            otro.oposiciones.add(self.oposicion)
+        self.assertIn(otro.pk, arbol_temario(self.oposicion.pk).temas)
+
+    def test_vistas_usan_el_arbol(self):
+        respuesta = self.client.get(reverse('examen:capitulo_detalle', kwargs={'pk': self.c2.pk}))
+        self.assertEqual(respuesta.context['capitulo_anterior'].pk, self.c1.pk)
+        self.assertEqual(respuesta.context['capitulo_siguiente'].pk, self.c3.pk)
+        respuesta = self.client.get(reverse('examen:temario_detalle', kwargs={'pk': self.tema.pk}))
+        self.assertEqual(len(respuesta.context['capitulos']), 3)
+        self.assertEqual(
+            self.client.get(reverse('examen:temario_detalle', kwargs={'pk': 9999})).status_code, 404
+        )
+        respuesta = self.client.get(reverse('examen:temario'))
+        self.assertEqual(len(respuesta.context['temas']), 2)
+
+
+class GetCondicionalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.client.force_login(self.usuario)
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.articulo = crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=1)[0].articulo
+        self.capitulo = self.articulo.capitulo
+        self.url = reverse('examen:capitulo_detalle', kwargs={'pk': self.capitulo.pk})
+        # La primera visita fija la cookie CSRF, que forma parte del ETag
+        self.client.get(self.url)
+
+    def revalidar(self, url=None):
+        """Pide la página y la vuelve a pedir con su ETag; devuelve el segundo código."""
+        url = url or self.url
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        return self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code
+
+    def test_304_sin_cambios_y_sin_consultas_de_articulos(self):
+        respuesta = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as consultas:
+            repetida = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+        self.assertFalse([q for q in consultas if 'examen_articulo' in q['sql']])
+
+    def test_editar_el_articulo_cambia_el_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.articulo.contenido = 'Texto reformado.'
+        # Hasta confirmar la transacción no se publica un ETag nuevo
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.articulo.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_mover_el_articulo_invalida_el_capitulo_de_origen(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            otro = Capitulo.objects.create(tema=self.capitulo.tema, titulo='Otro', orden=2)
+        etag = self.client.get(self.url)['ETag']  # crear un capítulo cambia la navegación
+        self.articulo.capitulo = otro
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articulo.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_nota_y_progreso_cambian_el_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('examen:marcar_capitulo', kwargs={'pk': self.capitulo.pk}))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('examen:guardar_nota', kwargs={'pk': self.capitulo.pk}), {'contenido': 'Repasar'})
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_parametros_cambian_el_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        respuesta = self.client.get(self.url, {'error': 'sin_preguntas'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_etag_por_usuario(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(crear_usuario('otro@example.com'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_temario_y_api_de_staff(self):
+        self.assertEqual(self.revalidar(reverse('examen:temario')), 304)
+        self.usuario.is_staff = True
+        self.usuario.save()
+        url = reverse('staff:api_capitulos') + f'?tema_id={self.capitulo.tema_id}'
+        self.assertEqual(self.revalidar(url), 304)
+        etag = self.client.get(url)['ETag']
+        self.capitulo.titulo = 'Renombrado'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.capitulo.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DescargasTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajustes = override_settings(MEDIA_ROOT=self.media.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.client.force_login(crear_usuario())
+        tema = Tema.objects.create(titulo='Tema 1', orden=1)
+        capitulo = Capitulo.objects.create(tema=tema, titulo='Capítulo 1')
+        self.contenido = bytes(range(256)) * 4
+        self.recurso = RecursoTema(capitulo=capitulo, titulo='Podcast', tipo='AUDIO')
+        self.recurso.archivo.save('podcast.mp3', ContentFile(self.contenido))
+        self.url = reverse('examen:descargar_recurso', kwargs={'pk': self.recurso.pk})
+
+    def leer(self, respuesta):
+        return b''.join(respuesta.streaming_content)
+
+    def test_completo_con_validadores(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.leer(respuesta), self.contenido)
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertEqual(respuesta['Content-Type'], 'audio/mpeg')
+        self.assertTrue(respuesta['Content-Disposition'].startswith('inline'))
+        repetida = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(repetida.status_code, 304)
+
+    def test_rangos(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 10-19/{len(self.contenido)}')
+        self.assertEqual(self.leer(respuesta), self.contenido[10:20])
+        sufijo = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.leer(sufijo), self.contenido[-5:])
+        fuera = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(fuera.status_code, 416)
+        self.assertEqual(fuera['Content-Range'], f'bytes */{len(self.contenido)}')
+        # Un intervalo invertido es inválido: se ignora y se envía el fichero completo
+        invertido = self.client.get(self.url, HTTP_RANGE='bytes=500-100')
+        self.assertEqual(invertido.status_code, 200)
+        self.assertEqual(self.leer(invertido), self.contenido)
+
+    def test_rango_de_un_fichero_vacio(self):
+        self.recurso.archivo.save('vacio.mp3', ContentFile(b''))
+        for rango in ('bytes=-5', 'bytes=0-'):
+            respuesta = self.client.get(self.url, HTTP_RANGE=rango)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('Content-Range', respuesta)
+            self.assertEqual(self.leer(respuesta), b'')
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)['ETag']
+        vigente = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(vigente.status_code, 206)
+        obsoleto = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(obsoleto.status_code, 200)
+        self.assertEqual(self.leer(obsoleto), self.contenido)
+
+    @override_settings(DESCARGAS_BACKEND='x-accel', DESCARGAS_X_ACCEL_PREFIJO='/protegido/')
+    def test_delegacion_en_nginx(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['X-Accel-Redirect'], '/protegido/' + self.recurso.archivo.name)
+        self.assertEqual(respuesta.content, b'')
+        self.assertEqual(respuesta['Content-Type'], 'audio/mpeg')
+
+    def test_requiere_sesion(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class ImportacionPreguntasTests(TestCase):
+
+    CSV = (
+        'tema,capitulo,articulo,enunciado,respuesta_a,respuesta_b,respuesta_c,respuesta_d,respuesta_correcta\n'
+        'Tema 1,Capítulo 1,Art. 1,¿Primera?,a,b,c,d,b\n'
+        '1,1,1,¿Por orden?,a,b,c,d,A\n'
+        'Tema 9,Capítulo 1,1,¿Tema inexistente?,a,b,c,d,A\n'
+        'Tema 1,Capítulo 1,1,,a,b,c,d,E\n'
+    )
+
+    def setUp(self):
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=0)
+
+    def test_csv_con_errores_por_fila(self):
+        resultado = importar_preguntas(StringIO(self.CSV), 'csv', self.oposicion, tamano_lote=1)
+        self.assertEqual((resultado.leidas, resultado.importadas, resultado.con_errores), (4, 2, 2))
+        self.assertEqual([fila for fila, _ in resultado.errores], [4, 5, 5])
+        pregunta = Pregunta.objects.get(enunciado='¿Primera?')
+        self.assertEqual(pregunta.respuesta_correcta, 'B')
+        self.assertEqual(pregunta.enunciado_html, '<p>¿Primera?</p>')
+        self.assertEqual(ids_coincidentes('PRE', 'orden'), [Pregunta.objects.get(enunciado='¿Por orden?').pk])
+
+    def test_simulacion_no_guarda(self):
+        resultado = importar_preguntas(StringIO(self.CSV), 'csv', self.oposicion, simular=True)
+        self.assertEqual((resultado.validas, resultado.importadas), (2, 0))
+        self.assertFalse(Pregunta.objects.exists())
+
+    def test_json_en_streaming(self):
+        fila = {'tema': 'Tema 1', 'capitulo': 'Capítulo 1', 'articulo': '1', 'enunciado': 'x',
+                'respuesta_a': 'a', 'respuesta_b': 'b', 'respuesta_c': 'c', 'respuesta_d': 'd',
+                'respuesta_correcta': 'C'}
+        texto = json.dumps([dict(fila, enunciado=f'¿{n}?') for n in range(30)])
+        self.assertEqual(len(list(leer_json(StringIO(texto), tamano_bloque=16))), 30)
+        resultado = importar_preguntas(StringIO(texto), 'json', self.oposicion)
+        self.assertEqual(resultado.importadas, 30)
+        roto = importar_preguntas(StringIO(texto[:-40]), 'json', self.oposicion, simular=True)
+        self.assertEqual(roto.validas, 29)
+        self.assertIn('Lectura interrumpida', roto.errores[-1][1])
+
+    def test_markdown(self):
+        texto = (
+            '@ Tema 1 | Capítulo 1 | Art. 1\n¿Qué dice\nel artículo?\n'
+            'A) Uno\nB) Dos\nC) Tres\nD) Cuatro\nCorrecta: d\nExplicación: Porque *sí*.\n---\n'
+        )
+        resultado = importar_preguntas(StringIO(texto), 'md', self.oposicion)
+        self.assertEqual(resultado.importadas, 1)
+        pregunta = Pregunta.objects.get()
+        self.assertEqual((pregunta.enunciado, pregunta.respuesta_d), ('¿Qué dice\nel artículo?', 'Cuatro'))
+        self.assertEqual(pregunta.explicacion, 'Porque *sí*.')
+
+    def test_vista_de_staff(self):
+        staff = crear_usuario('staff@example.com')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        archivo = ContentFile(self.CSV.encode(), name='banco.csv')
+        respuesta = self.client.post(reverse('staff:importar_preguntas'), {
+            'oposicion': self.oposicion.pk, 'archivo': archivo, 'formato': '',
+        })
+        self.assertEqual(respuesta.context['resultado'].importadas, 2)
+        self.assertEqual(len(respuesta.context['errores']), 3)
+
+        # Por encima del límite no se importa nada y se remite al comando
+        archivo = ContentFile(self.CSV.encode(), name='banco.csv')
+        with override_settings(IMPORTACION_WEB_MAX_PREGUNTAS=3):
+            respuesta = self.client.post(reverse('staff:importar_preguntas'), {
+                'oposicion': self.oposicion.pk, 'archivo': archivo, 'formato': '',
+            })
+        self.assertIn('importar_preguntas', respuesta.context['form'].errors['archivo'][0])
+        self.assertNotIn('resultado', respuesta.context)
+        self.assertEqual(Pregunta.objects.count(), 2)
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as fichero:
+            fichero.write(self.CSV)
+        self.addCleanup(os.remove, fichero.name)
+        salida = StringIO()
+        call_command('importar_preguntas', fichero.name, '--oposicion', self.oposicion.nombre,
+                     '--simular', stdout=salida, stderr=StringIO())
+        self.assertIn('se importarían 2', salida.getvalue())
+
+
+class CargaLegislacionTests(TestCase):
+
+    LEY = (
+        '# LEY 1/2000, de prueba\n\n'
+        'Artículo 1. Objeto.\n\nEsta ley regula la prueba.\n\n'
+        '## TÍTULO I\n\n'
+        '### CAPÍTULO I\nDe los derechos\n\n'
+        '**Artículo 2.** Igualdad.\n\n1. Todos son iguales.\n\n2. Sin excepciones.\n\n'
+        'Artículo 2 bis.\n\nTexto añadido.\n\n'
+        'CAPÍTULO II. De los deberes\n\n'
+        'Art. 3. Deber de estudiar.\n\nHay que estudiar.\n\n'
+        'Disposición final primera. Entrada en vigor.\n\nAl día siguiente.\n'
+    )
+
+    def setUp(self):
+        self.tema = Tema.objects.create(titulo='Ley de prueba', orden=1)
+
+    def test_lectura(self):
+        capitulos = leer_ley(StringIO(self.LEY))
+        self.assertEqual(
+            [(c.titulo, [n for n, _ in c.articulos]) for c in capitulos],
+            [('Preliminar', ['1']), ('Capítulo I. De los derechos', ['2', '2 bis']),
+             ('Capítulo II. De los deberes', ['3']), ('Disposiciones', ['Disposición final primera'])],
+        )
+        self.assertEqual(capitulos[1].articulos[0][1], '**Igualdad.**\n\n1. Todos son iguales.\n\n2. Sin excepciones.')
+
+    def test_carga_y_actualizacion_por_huella(self):
+        resultado = cargar_ley(StringIO(self.LEY), self.tema)
+        self.assertEqual((resultado.capitulos_nuevos, resultado.articulos_nuevos), (4, 5))
+        self.assertFalse(Capitulo.objects.filter(es_modificacion_reciente=True).exists())
+        self.assertEqual(ids_coincidentes('ART', 'estudiar'), [Articulo.objects.get(numero='3').pk])
+
+        modificada = self.LEY.replace('Hay que estudiar.', 'Hay que estudiar mucho.') + '\nArtículo 4. Nuevo.\n'
+        simulacion = cargar_ley(StringIO(modificada), self.tema, simular=True)
+        self.assertEqual((simulacion.articulos_modificados, simulacion.articulos_nuevos), (1, 1))
+        self.assertEqual(Articulo.objects.get(numero='3').contenido, '**Deber de estudiar.**\n\nHay que estudiar.')
+
+        resultado = cargar_ley(StringIO(modificada.replace('Artículo 2 bis.\n\nTexto añadido.\n\n', '')),
+                               self.tema, date(2024, 2, 17))
+        self.assertEqual(
+            (resultado.articulos_modificados, resultado.articulos_sin_cambios, resultado.articulos_nuevos),
+            (1, 3, 1),
+        )
+        self.assertEqual(resultado.articulos_ausentes, [('Capítulo I. De los derechos', '2 bis')])
+        self.assertEqual(Articulo.objects.get(numero='4').capitulo.titulo, 'Disposiciones')
+        capitulo = Capitulo.objects.get(titulo='Capítulo II. De los deberes')
+        self.assertEqual((capitulo.es_modificacion_reciente, capitulo.fecha_actualizacion_ley), (True, date(2024, 2, 17)))
+        self.assertIn('mucho', Articulo.objects.get(numero='3').contenido_html)
+        self.assertEqual(ids_coincidentes('ART', 'mucho'), [Articulo.objects.get(numero='3').pk])
+        self.assertFalse(Capitulo.objects.get(titulo='Capítulo I. De los derechos').es_modificacion_reciente)
+
+
+class DuplicadosTests(TestCase):
+
+    ENUNCIADO = '¿Qué órgano ejerce la potestad legislativa del Estado según la Constitución española?'
+    RESPUESTAS = dict(
+        respuesta_a='Las Cortes Generales', respuesta_b='El Gobierno de la Nación',
+        respuesta_c='El Consejo General del Poder Judicial', respuesta_d='El Tribunal Constitucional',
+    )
+
+    def setUp(self):
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        crear_temario(self.oposicion, num_temas=1, preguntas_por_tema=0)
+        self.articulo = Articulo.objects.get()
+        self.original = self.crear(self.ENUNCIADO)
+        self.reescrita = self.crear('¿Qué órgano ejerce la potestad legislativa del Estado, según la Constitución?')
+        self.distinta = self.crear('¿Cuántos miembros tiene el Tribunal Constitucional?', respuesta_a='Doce')
+
+    def crear(self, enunciado, **cambios):
+        return Pregunta.objects.create(
+            articulo=self.articulo, enunciado=enunciado, respuesta_correcta='A',
+            **dict(self.RESPUESTAS, **cambios),
+        )
+
+    def test_firma_al_guardar_y_grupos(self):
+        self.assertEqual(FirmaPregunta.objects.count(), 3)
+        self.assertEqual(grupos_duplicados(), [[self.original.pk, self.reescrita.pk]])
+        textos = [self.ENUNCIADO.upper(), *self.RESPUESTAS.values()]
+        self.assertEqual([p.pk for p in buscar_similares(textos, excluir=self.original.pk)], [self.reescrita.pk])
+
+        # Editar el texto actualiza la firma; guardar sin cambios no la recalcula
+        self.reescrita.enunciado = '¿Quién nombra al Presidente del Gobierno?'
+        self.reescrita.respuesta_a = 'El Rey'
+        self.reescrita.save()
+        self.assertEqual(grupos_duplicados(), [])
+        self.assertEqual(indexar_banco(), (3, 0))
+
+    def test_formulario_avisa_de_duplicado(self):
+        staff = crear_usuario('staff@example.com')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        datos = dict(
+            self.RESPUESTAS, tema_selector=self.articulo.capitulo.tema_id,
+            capitulo_selector=self.articulo.capitulo_id, articulo=self.articulo.pk,
+            enunciado=self.ENUNCIADO + ' ', respuesta_correcta='A',
+        )
+        respuesta = self.client.post(reverse('staff:nueva_pregunta'), datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn(self.original, respuesta.context['form'].similares)
+        self.assertEqual(Pregunta.objects.count(), 3)
+
+        respuesta = self.client.post(reverse('staff:nueva_pregunta'), dict(datos, guardar_duplicado='on'))
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(len(grupos_duplicados()[0]), 3)
+        respuesta = self.client.get(reverse('staff:duplicados'))
+        self.assertEqual(respuesta.context['total_repetidas'], 2)
+
+
+@override_settings(TIEMPO_ESTUDIO_LATIDO_S=30)
+class TiempoEstudioTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario()
+        self.oposicion = Oposicion.objects.create(nombre='Auxiliar Administrativo')
+        self.preguntas = crear_temario(self.oposicion, num_temas=2)
+        self.capitulos = list(Capitulo.objects.order_by('tema__orden').values_list('pk', flat=True))
+
+    def latido(self, *capitulos, **kwargs):
+        # Cada latido llega tras vencer el intervalo del anterior
+        cache.delete(f'latidos:ultimo:{self.usuario.pk}')
+        with self.captureOnCommitCallbacks(execute=True):
+            return registrar_latido(self.usuario.pk, capitulos, **kwargs)
+
+    def segundos(self):
+        return dict(TiempoEstudio.objects.values_list('capitulo_id', 'segundos'))
+
+    def test_latidos_se_suman_en_la_base_de_datos(self):
+        self.assertTrue(self.latido(self.capitulos[0]))
+        self.assertTrue(self.latido(self.capitulos[0]))
+        # El capítulo inexistente se lleva su parte, pero no se guarda
+        self.assertTrue(self.latido(*self.capitulos, 999999))
+        self.assertEqual(self.segundos(), {self.capitulos[0]: 70, self.capitulos[1]: 10})
+        # Otra pestaña dentro del mismo intervalo no suma
+        self.assertFalse(registrar_latido(self.usuario.pk, [self.capitulos[0]]))
+        self.assertFalse(self.latido(999999))
+
+        # Capítulos, INSERT que ignora las filas existentes y UPDATE (más el savepoint)
+        with self.assertNumQueries(5):
+            self.latido(*self.capitulos)
+        self.assertEqual(self.segundos(), {self.capitulos[0]: 85, self.capitulos[1]: 25})
+
+        # Cada día tiene su fila
+        self.latido(self.capitulos[1], ahora=timezone.now() - timedelta(days=1))
+        self.assertEqual(TiempoEstudio.objects.filter(capitulo_id=self.capitulos[1]).count(), 2)
+
+    def test_la_suma_no_depende_de_la_cache(self):
+        self.latido(self.capitulos[0])
+        # Nada queda pendiente en la caché: vaciarla no pierde tiempo
+        cache.clear()
+        self.latido(self.capitulos[0])
+        self.assertEqual(self.segundos(), {self.capitulos[0]: 60})
+
+        # La suma la hace la base de datos, no se escribe un total leído antes
+        fila = TiempoEstudio.objects.get()
+        self.latido(self.capitulos[0])
+        fila.refresh_from_db()
+        self.assertEqual(fila.segundos, 90)
+
+    def test_minutos_por_tema_en_el_dashboard(self):
+        contexto_dashboard(self.usuario, self.oposicion)
+        hoy = timezone.localdate()
+        TiempoEstudio.objects.create(
+            usuario=self.usuario, capitulo_id=self.capitulos[0], fecha=hoy - timedelta(days=1), segundos=1200,
+        )
+        for _ in range(4):
+            self.latido(self.capitulos[1])
+
+        self.assertEqual(tiempo_por_tema(self.usuario, self.oposicion), [
+            {'nombre': 'Tema 1', 'minutos': 20, 'pct': 100},
+            {'nombre': 'Tema 2', 'minutos': 2, 'pct': 10},
+        ])
+        # Cada latido invalida el dashboard del usuario
+        self.assertEqual(len(contexto_dashboard(self.usuario, self.oposicion)['tiempo_por_tema']), 2)
+
+    def test_vista_de_latido(self):
+        url = reverse('examen:latido_estudio')
+        self.assertEqual(self.client.post(url, {'capitulo': self.capitulos[0]}).status_code, 403)
+
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.post(url, {'capitulo': 'x'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'capitulo': self.capitulos[0]}).status_code, 204)
+        self.assertEqual(TiempoEstudio.objects.get().segundos, 30)
+
+        # La página de simulacro reparte el latido entre los capítulos de sus preguntas
+        examen = Examen.objects.create(usuario=self.usuario, oposicion=self.oposicion)
+        examen.asignar_preguntas([p.pk for p in self.preguntas])
+        respuesta = self.client.get(reverse('examen:simulacion_pagina', args=[examen.pk]))
+        self.assertEqual(
+            sorted(map(int, respuesta.context['latido_capitulos'].split(','))), self.capitulos,
+        )
+        self.assertContains(respuesta, 'js/latido_estudio.js')
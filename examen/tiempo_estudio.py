@@ -0,0 +1,79 @@
+"""Tiempo de estudio por usuario, capítulo y día a partir de latidos.
+
+Las páginas de capítulo y de simulacro envían un latido cada
+`TIEMPO_ESTUDIO_LATIDO_S` segundos mientras están visibles y el usuario
+interactúa con ellas (static/js/latido_estudio.js). Cada latido cuenta ese
+intervalo y lo reparte entre los capítulos de la página.
+
+Cada latido se suma directamente en `TiempoEstudio`: un INSERT que ignora las
+filas ya existentes y un UPDATE con `F('segundos') + n`. La suma la hace la
+base de datos, así que los latidos concurrentes de varios workers no se pisan
+y no hay nada pendiente en la caché que pueda perderse por una expulsión.
+
+- Se acepta un latido por usuario e intervalo: varias pestañas abiertas no
+  suman tiempo de más. La marca del último latido sí vive en la caché; si se
+  pierde o dos latidos coinciden en el mismo instante, como mucho se cuenta
+  un intervalo de más.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .dashboard import invalidar_dashboard
+from .models import Capitulo, TiempoEstudio
+
+PREFIJO = 'latidos'
+# Capítulos a los que puede repartirse un latido (una página de simulacro)
+MAX_CAPITULOS_POR_LATIDO = 20
+
+
+def intervalo_latido() -> int:
+    """Segundos entre latidos, que es también el tiempo que cuenta cada uno."""
+    return getattr(settings, 'TIEMPO_ESTUDIO_LATIDO_S', 30)
+
+
+def registrar_latido(usuario_id, capitulo_ids, ahora=None) -> bool:
+    """Suma un intervalo de estudio repartido entre los capítulos indicados.
+
+    Devuelve False si el latido se descarta por llegar antes de que venza el
+    intervalo del anterior (otra pestaña del mismo usuario) o por no quedar
+    ningún capítulo existente. Los capítulos borrados se ignoran.
+    """
+    capitulo_ids = sorted(set(capitulo_ids))[:MAX_CAPITULOS_POR_LATIDO]
+    intervalo = intervalo_latido()
+    # Margen para los relojes del navegador, que no disparan con exactitud
+    if not capitulo_ids or not cache.add(f'{PREFIJO}:ultimo:{usuario_id}', 1, max(1, int(intervalo * 0.8))):
+        return False
+
+    # El reparto se hace sobre los capítulos pedidos, existan o no: un
+    # capítulo borrado no regala su parte a los demás
+    base, resto = divmod(intervalo, len(capitulo_ids))
+    reparto = {
+        capitulo_id: base + (1 if posicion < resto else 0)
+        for posicion, capitulo_id in enumerate(capitulo_ids)
+    }
+    existentes = Capitulo.objects.filter(pk__in=capitulo_ids).values_list('pk', flat=True)
+    reparto = {capitulo_id: reparto[capitulo_id] for capitulo_id in existentes if reparto[capitulo_id]}
+    if not reparto:
+        return False
+
+    fecha = timezone.localdate(ahora)
+    with transaction.atomic():
+        TiempoEstudio.objects.bulk_create(
+            [
+                TiempoEstudio(usuario_id=usuario_id, capitulo_id=capitulo_id, fecha=fecha)
+                for capitulo_id in reparto
+            ],
+            ignore_conflicts=True,
+        )
+        TiempoEstudio.objects.filter(
+            usuario_id=usuario_id, fecha=fecha, capitulo_id__in=reparto,
+        ).update(segundos=F('segundos') + Case(
+            *(When(capitulo_id=capitulo_id, then=Value(segundos)) for capitulo_id, segundos in reparto.items()),
+            default=Value(0),
+        ))
+        transaction.on_commit(lambda: invalidar_dashboard(usuario_id))
+    return True
@@ -18,10 +18,18 @@ urlpatterns = [
     path("capitulo/<int:pk>/imprimir/", examen_views.CapituloImpresionView.as_view(), name="capitulo_impresion"),
     path("capitulo/<int:pk>/simulacro/", examen_views.StartExamenCapituloView.as_view(), name="simular_examen_capitulo"),
 
+    # Latidos de tiempo de estudio (static/js/latido_estudio.js)
+    path("latido/", examen_views.LatidoEstudioView.as_view(), name="latido_estudio"),
+
+    path("buscar/", examen_views.BusquedaView.as_view(), name="busqueda"),
+
     path("descargar/tema/<int:pk>/", examen_views.descargar_tema, name="descargar_tema"),
+    path("descargar/recurso/<int:pk>/", examen_views.descargar_recurso, name="descargar_recurso"),
     path("simulacion/", examen_views.StartExamenView.as_view(), name="simular_examen"),
     # URL principal para hacer el examen. Recibe el ID del examen
     path('simulacion/<int:examen_id>/', examen_views.SimulacionView.as_view(), name='simulacion_pagina'),
+    # Autoguardado JSON de las respuestas (static/js/simulacion_autosave.js)
+    path('simulacion/<int:examen_id>/respuestas/', examen_views.AutoguardadoRespuestasView.as_view(), name='simulacion_autoguardado'),
     # URL para ver los resultados finales
     path('simulacion/<int:examen_id>/resultados/', examen_views.ResultadosView.as_view(), name='simulacion_resultados'),
     path("seleccionar-oposicion/<int:pk>/", examen_views.SelectorOposicionView.as_view(), name="seleccionar_oposicion"),
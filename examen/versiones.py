@@ -0,0 +1,55 @@
+"""Contadores de versión guardados en la caché de Django.
+
+Se usan para invalidar cachés por eventos: en lugar de borrar claves, cada
+dato cacheado incluye en su clave la versión de su ámbito y, cuando algo
+cambia, basta con incrementar el contador.
+
+Si el contador desaparece de la caché (expulsión o reinicio) se vuelve a
+crear con un valor basado en la hora actual, de modo que nunca coincide con
+una versión antigua que siguiera cacheada.
+"""
+
+import time
+
+from django.core.cache import cache
+
+PREFIJO = 'version:'
+
+
+def _clave(ambito: str) -> str:
+    return f'{PREFIJO}{ambito}'
+
+
+def _version_inicial() -> int:
+    return time.time_ns() // 1000
+
+
+def obtener_version(ambito: str) -> int:
+    """Versión actual del ámbito indicado (p. ej. 'dashboard:12')."""
+    return obtener_versiones(ambito)[ambito]
+
+
+def obtener_versiones(*ambitos: str) -> dict:
+    """Versiones de varios ámbitos con una sola lectura de la caché."""
+    claves = {_clave(ambito): ambito for ambito in ambitos}
+    encontradas = cache.get_many(claves.keys())
+    versiones = {}
+    for clave, ambito in claves.items():
+        version = encontradas.get(clave)
+        if version is None:
+            version = _version_inicial()
+            if not cache.add(clave, version, timeout=None):
+                version = cache.get(clave, version)
+        versiones[ambito] = version
+    return versiones
+
+
+def incrementar_version(ambito: str) -> int:
+    """Invalida todo lo cacheado bajo el ámbito indicado."""
+    clave = _clave(ambito)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        version = _version_inicial()
+        cache.set(clave, version, timeout=None)
+        return version
@@ -1,5 +1,6 @@
 """Vistas de la aplicación examen."""
 
+import io
 import json
 import logging
 from decimal import Decimal
@@ -9,19 +10,33 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import View, TemplateView, ListView, DetailView
 from django.urls import reverse
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.core.paginator import Paginator
 from django.utils import timezone
-from django.db.models import Max, Min, Avg, Count
+from django.utils.decorators import method_decorator
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, Q
 
 # De Examen
 from .models import (
     Tema, Capitulo, Oposicion,
-    Examen, Pregunta, RespuestaUsuario, Articulo, NotaEstudio, PerfilUsuario,
-    ProgresoEstudio, RecursoTema,
+    Examen, PreguntaExamen, Pregunta, Articulo, NotaEstudio, PerfilUsuario,
+    ProgresoEstudio, RecursoTema, DocumentoBusqueda,
+)
+from .estadisticas import actualizar_estadisticas_capitulos, actualizar_estado_preguntas
+from .busqueda import ResultadosBusqueda
+from .descargas import servir_fichero
+from .condicional import (
+    etag_api_articulos, etag_api_temario, etag_capitulo, etag_capitulo_impresion,
+    etag_temario, validar_con_etag,
 )
+from .muestreo import muestrear, pool_capitulo, pool_oposicion
+from .seleccion import obtener_estrategia
+from .temario import arbol_con_capitulo, arbol_temario
+from .dashboard import contexto_dashboard, invalidar_dashboard
+from .tiempo_estudio import intervalo_latido, registrar_latido
 
 logger = logging.getLogger(__name__)
 
@@ -42,138 +57,24 @@ class HomeView(LoginRequiredMixin, TemplateView):
         perfil = getattr(usuario, 'perfil', None)
         oposicion_activa = perfil.oposicion_activa if perfil else None
 
-        # ── KPIs globales (solo de su oposición activa si existe) ─────────────
-        examenes_qs = Examen.objects.filter(usuario=usuario, puntuacion__isnull=False)
-        if oposicion_activa:
-            examenes_qs = examenes_qs.filter(oposicion=oposicion_activa)
-        total_examenes = examenes_qs.count()
-
-        stats = examenes_qs.aggregate(
-            media=Avg('puntuacion'),
-            maxima=Max('puntuacion'),
-        )
-        puntuacion_media = round(stats['media'] or 0, 2)
-        puntuacion_maxima = round(stats['maxima'] or 0, 2)
-
-        # Acierto global (sobre todas las respuestas dadas)
-        todas_respuestas = RespuestaUsuario.objects.filter(examen__usuario=usuario)
-        total_resp = todas_respuestas.count()
-        aciertos_resp = todas_respuestas.filter(es_correcta=True).count()
-        acierto_global_pct = round((aciertos_resp / total_resp) * 100, 1) if total_resp > 0 else 0
-
-        # ── Datos para el gráfico Chart.js (últimos 20 exámenes completados) ──
-        examenes_chart = list(
-            examenes_qs.order_by('fecha_finalizacion')
-            .values('fecha_finalizacion', 'puntuacion')
-        )
-        chart_labels = [
-            e['fecha_finalizacion'].strftime('%d/%m') for e in examenes_chart
-        ]
-        chart_data = [round(float(e['puntuacion']), 2) for e in examenes_chart]
-
-        # ── Últimos 10 exámenes ────────────────────────────────────────────────
-        ultimos_examenes = examenes_qs.select_related('oposicion').order_by(
-            '-fecha_finalizacion'
-        )[:10]
-
-        # ── Rendimiento por Tema (Oposición Activa) ────────────────────────────
-        rendimiento_por_tema = []
-        temas_a_evaluar = Tema.objects.filter(oposiciones=oposicion_activa) if oposicion_activa else Tema.objects.all()
-        
-        for tema in temas_a_evaluar:
-            resps_tema = todas_respuestas.filter(
-                pregunta__articulo__capitulo__tema=tema
-            )
-            total_tema = resps_tema.count()
-            if total_tema > 0:
-                aciertos_tema = resps_tema.filter(es_correcta=True).count()
-                pct = round((aciertos_tema / total_tema) * 100)
-                rendimiento_por_tema.append({
-                    'nombre': tema.titulo[:35],
-                    'pct': pct,
-                    'clase': 'success' if pct >= 75 else ('warning' if pct >= 50 else 'danger'),
-                })
-        rendimiento_por_tema.sort(key=lambda x: x['pct'])
-
-        # ── Preguntas urgentes: las más falladas por este usuario ──────────────
-        preguntas_urgentes = (
-            RespuestaUsuario.objects
-            .filter(examen__usuario=usuario, es_correcta=False)
-            .values(
-                'pregunta__enunciado',
-                'pregunta__articulo__capitulo__titulo',
-            )
-            .annotate(veces_fallada=Count('id'))
-            .order_by('-veces_fallada')[:5]
-        )
-
-        # ── Recomendaciones Diarias (Coach de Estudio) ─────────────────────────
-        recomendaciones = []
-        capitulos_evaluar = Capitulo.objects.filter(tema__oposiciones=oposicion_activa).distinct() if oposicion_activa else Capitulo.objects.all()
-        
-        hoy = timezone.now()
-        for capitulo in capitulos_evaluar:
-            resps_cap = RespuestaUsuario.objects.filter(
-                examen__usuario=usuario,
-                pregunta__articulo__capitulo=capitulo
-            )
-            
-            total_resp = resps_cap.count()
-            score = 0.0
-            
-            if total_resp > 0:
-                fallos = resps_cap.filter(es_correcta=False).count()
-                pct_fallo = (fallos / total_resp) * 100.0
-                
-                ultimo_acierto = resps_cap.filter(es_correcta=True).order_by('-examen__fecha_finalizacion').first()
-                if ultimo_acierto:
-                    dias_sin_acierto = (hoy - ultimo_acierto.examen.fecha_finalizacion).days
-                else:
-                    dias_sin_acierto = 30
-                    
-                olvido_normalizado = min(dias_sin_acierto / 30.0, 1.0) * 100.0
-                score = (pct_fallo * 0.6) + (olvido_normalizado * 0.4)
-            else:
-                score = 40.0 # Ligera prioridad a lo inexplorado
-                
-            recomendaciones.append({
-                'capitulo': capitulo,
-                'score': score
-            })
-            
-        recomendaciones.sort(key=lambda x: x['score'], reverse=True)
-        top_recomendaciones = recomendaciones[:3]
-
-        context.update({
-            'oposicion_activa': oposicion_activa,
-            'total_examenes': total_examenes,
-            'puntuacion_media': puntuacion_media,
-            'puntuacion_maxima': puntuacion_maxima,
-            'acierto_global_pct': acierto_global_pct,
-            'chart_labels': json.dumps(chart_labels),
-            'chart_data': json.dumps(chart_data),
-            'ultimos_examenes': ultimos_examenes,
-            'rendimiento_por_tema': rendimiento_por_tema,
-            'preguntas_urgentes': preguntas_urgentes,
-            'recomendaciones_estudio': top_recomendaciones,
-        })
+        # KPIs, gráfico, rendimiento y recomendaciones (cacheados por usuario)
+        context.update(contexto_dashboard(usuario, oposicion_activa))
+        context['oposicion_activa'] = oposicion_activa
         return context
 
 
+@method_decorator(validar_con_etag(etag_temario), name='get')
 class TemarioView(LoginRequiredMixin, ListView):
     """Lista el temario filtrado por la oposicion activa del usuario."""
 
     template_name = 'examen/temario.html'
-    model = Tema
     context_object_name = 'temas'
-    ordering = ['bloque', 'orden', 'titulo']
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        # Temas del árbol cacheado, ya ordenados por bloque, orden y título
         perfil = getattr(self.request.user, 'perfil', None)
-        if perfil and perfil.oposicion_activa:
-            qs = qs.filter(oposiciones=perfil.oposicion_activa)
-        return qs
+        oposicion_id = perfil.oposicion_activa_id if perfil else None
+        return arbol_temario(oposicion_id).lista_temas()
 
 
 class TemarioDetalleView(LoginRequiredMixin, TemplateView):
@@ -183,17 +84,20 @@ class TemarioDetalleView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        tema = get_object_or_404(Tema, pk=kwargs['pk'])
-        capitulos = Capitulo.objects.filter(tema=tema).order_by('orden')
+        arbol = arbol_temario()
+        tema = arbol.temas.get(kwargs['pk'])
+        if tema is None:
+            raise Http404('Tema no encontrado')
+        capitulos = arbol.capitulos_de(tema.id)
         context['tema'] = tema
         context['capitulos'] = capitulos
 
         # Calcular el progreso del usuario en este tema
-        total = capitulos.count()
+        total = len(capitulos)
         completados_ids = set(
             ProgresoEstudio.objects.filter(
                 usuario=self.request.user,
-                capitulo__in=capitulos,
+                capitulo_id__in=tema.capitulos,
                 completado=True,
             ).values_list('capitulo_id', flat=True)
         )
@@ -210,22 +114,21 @@ class TemarioDetalleView(LoginRequiredMixin, TemplateView):
 def descargar_tema(request, pk):
     """Descarga el archivo de documentación de un Tema si existe."""
     tema = get_object_or_404(Tema, pk=pk)
-
-    if tema.documentacion and hasattr(tema.documentacion, 'path'):
-        tema_path = tema.documentacion.path
-        response = FileResponse(
-            open(tema_path, 'rb'),
-            as_attachment=True,
-            filename=tema.documentacion.name,
+    try:
+        return servir_fichero(request, tema.documentacion, adjunto=True)
+    except Http404:
+        return redirect(
+            reverse('examen:errores', kwargs={'error_code': 404})
+            + '?mensaje=No+se+encontr%C3%B3+el+archivo+de+documentaci%C3%B3n+del+tema'
         )
-        if not settings.DEBUG:
-            response['Connection'] = 'close'
-        return response
 
-    return redirect(
-        reverse('examen:errores', kwargs={'error_code': 404})
-        + '?mensaje=No+se+encontr%C3%B3+el+archivo+de+documentaci%C3%B3n+del+tema'
-    )
+
+@login_required
+def descargar_recurso(request, pk):
+    """Sirve el archivo de un recurso de capítulo (audio, vídeo, esquema...) para verlo en línea."""
+    recurso = get_object_or_404(RecursoTema, pk=pk)
+    return servir_fichero(request, recurso.archivo)
+
 
 class SelectorOposicionView(LoginRequiredMixin, View):
     """Permite al usuario cambiar a otra de sus oposiciones inscritas activas."""
@@ -242,10 +145,11 @@ class SelectorOposicionView(LoginRequiredMixin, View):
         next_url = request.POST.get('next', reverse('examen:home'))
         return redirect(next_url)
 
+@method_decorator(validar_con_etag(etag_capitulo), name='get')
 class CapituloDetalleView(LoginRequiredMixin, DetailView):
     """Vista de lectura profunda de los Artículos de un Capítulo y panel de Notas."""
     
-    model = Capitulo
+    queryset = Capitulo.objects.select_related('tema')
     template_name = 'examen/capitulo_detalle.html'
     context_object_name = 'capitulo'
 
@@ -253,23 +157,18 @@ class CapituloDetalleView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         capitulo = self.object
         
-        # Obtener los artículos ordenados
-        context['articulos'] = capitulo.articulosCapitulo.all().order_by('numero')
+        # Obtener los artículos ordenados (solo el HTML ya renderizado, no el Markdown)
+        context['articulos'] = capitulo.articulosCapitulo.defer('contenido').order_by('numero')
         
         # Recuperar nota si existe
         nota_qs = NotaEstudio.objects.filter(usuario=self.request.user, capitulo=capitulo)
         context['nota_estudio'] = nota_qs.first() if nota_qs.exists() else None
 
-        # Lógica de Siguiente y Anterior dentro del mismo Tema
-        todos_capitulos_mismo_tema = list(Capitulo.objects.filter(tema=capitulo.tema).order_by('orden'))
-        
-        try:
-            current_index = todos_capitulos_mismo_tema.index(capitulo)
-            context['capitulo_anterior'] = todos_capitulos_mismo_tema[current_index - 1] if current_index > 0 else None
-            context['capitulo_siguiente'] = todos_capitulos_mismo_tema[current_index + 1] if current_index < len(todos_capitulos_mismo_tema) - 1 else None
-        except ValueError:
-            context['capitulo_anterior'] = None
-            context['capitulo_siguiente'] = None
+        # Siguiente y Anterior dentro del mismo Tema, leídos del árbol cacheado
+        perfil = getattr(self.request.user, 'perfil', None)
+        arbol = arbol_con_capitulo(capitulo.pk, perfil.oposicion_activa_id if perfil else None)
+        context['capitulo_anterior'] = arbol.anterior(capitulo.pk)
+        context['capitulo_siguiente'] = arbol.siguiente(capitulo.pk)
 
         # Progreso de estudio del usuario en este capítulo
         progreso_qs = ProgresoEstudio.objects.filter(
@@ -280,6 +179,8 @@ class CapituloDetalleView(LoginRequiredMixin, DetailView):
         # Recursos multimedia adjuntos al capítulo
         context['recursos'] = capitulo.recursos.all().order_by('tipo', 'titulo')
 
+        context['latido_segundos'] = intervalo_latido()
+
         return context
 
 
@@ -321,9 +222,11 @@ class MarcarCapituloView(LoginRequiredMixin, View):
             progreso.completado = True
             progreso.fecha_completado = timezone.now()
         progreso.save()
+        invalidar_dashboard(request.user.pk)
         return redirect(reverse('examen:capitulo_detalle', kwargs={'pk': capitulo.pk}))
 
 
+@method_decorator(validar_con_etag(etag_capitulo_impresion), name='get')
 class CapituloImpresionView(LoginRequiredMixin, DetailView):
     """Vista optimizada para impresión/PDF de un capítulo completo."""
 
@@ -334,7 +237,7 @@ class CapituloImpresionView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         capitulo = self.object
-        context['articulos'] = capitulo.articulosCapitulo.all().order_by('numero')
+        context['articulos'] = capitulo.articulosCapitulo.defer('contenido').order_by('numero')
         return context
 
 
@@ -344,31 +247,30 @@ class StartExamenCapituloView(LoginRequiredMixin, View):
     def post(self, request, pk, *args, **kwargs):
         capitulo = get_object_or_404(Capitulo, pk=pk)
         
-        # Obtener todas las preguntas del capítulo
-        preguntas = list(Pregunta.objects.filter(articulo__capitulo=capitulo).order_by('?'))
+        # Ids de todas las preguntas del capítulo (pool en memoria del proceso)
+        candidatas = pool_capitulo(capitulo.pk)
         
-        if not preguntas:
+        if not candidatas:
             # Podríamos redirigir con un mensaje de error si el capítulo no tiene preguntas aún
             url = reverse('examen:capitulo_detalle', kwargs={'pk': capitulo.pk})
             return redirect(f"{url}?error=sin_preguntas")
 
-        # Configurar el examen
+        # Solo le ponemos preguntas de este capítulo, sorteadas sin ORDER BY RANDOM()
+        primera_oposicion = Oposicion.objects.first()
+        seleccion = muestrear(candidatas, primera_oposicion.num_preguntas if primera_oposicion else 100)
+
+        # Configurar el examen (con su total de preguntas ya en el INSERT)
         examen = Examen.objects.create(
             usuario=request.user,
-            tipo=Examen.TipoExamen.CAPITULO
+            tipo=Examen.TipoExamen.CAPITULO,
+            oposicion=primera_oposicion,
+            total_preguntas=len(seleccion),
         )
-
-        primera_oposicion = Oposicion.objects.first()
-        if primera_oposicion:
-            examen.oposicion = primera_oposicion
-            examen.save(update_fields=['oposicion'])
-
-        # Solo le ponemos las preguntas de este capítulo
-        examen.preguntas.set(preguntas[:primera_oposicion.num_preguntas if primera_oposicion else 100])
+        examen.asignar_preguntas(seleccion)
         
         logger.info(
             'Examen de Capítulo #%d iniciado por %s con %d preguntas.',
-            examen.pk, request.user.email, min(len(preguntas), 100)
+            examen.pk, request.user.email, len(seleccion)
         )
         return redirect(reverse('examen:simulacion_pagina', kwargs={'examen_id': examen.id}))
 
@@ -377,11 +279,13 @@ class StartExamenView(LoginRequiredMixin, View):
     """
     Crea un nuevo examen para el usuario, selecciona preguntas al azar
     según la configuración de la oposición, y redirige a la primera página.
+
+    La selección trabaja solo con ids: el pool de la oposición se mantiene en
+    memoria en cada proceso y las preguntas las elige la estrategia
+    configurada en la oposición (ver `examen.seleccion`).
     """
 
     def post(self, request, *args, **kwargs):
-        examen = Examen.objects.create(usuario=request.user)
-
         # ── Setup Oposición Activa ────────────────────────────────────────────
         perfil = getattr(request.user, 'perfil', None)
         oposicion_activa = perfil.oposicion_activa if perfil else Oposicion.objects.first()
@@ -389,78 +293,28 @@ class StartExamenView(LoginRequiredMixin, View):
         num_preguntas = 100
         if oposicion_activa:
             num_preguntas = oposicion_activa.num_preguntas
-            examen.oposicion = oposicion_activa
-            examen.save(update_fields=['oposicion'])
 
         # ── Pool de Preguntas de esta Oposición ───────────────────────────────
-        preguntas_base = Pregunta.objects.all()
-        if oposicion_activa:
-            preguntas_base = preguntas_base.filter(articulo__capitulo__tema__oposiciones=oposicion_activa)
-
-        # --- Algoritmo Adaptativo 40/30/30 ---
-        preguntas_finales = []
-        user_resps = RespuestaUsuario.objects.filter(examen__usuario=request.user)
-
-        # 1. 40% Preguntas Falladas (Prioridad Absoluta)
-        meta_falladas = int(num_preguntas * 0.40)
-        preguntas_falladas_ids = list(
-            user_resps.filter(es_correcta=False)
-            .values_list('pregunta_id', flat=True)
-            .distinct()
-        )
-        falladas = list(preguntas_base.filter(id__in=preguntas_falladas_ids).order_by('?')[:meta_falladas])
-        preguntas_finales.extend(falladas)
-
-        huecos_restantes = num_preguntas - len(preguntas_finales)
-
-        # 2. 30% Preguntas Olvidadas (Acertadas hace mucho tiempo)
-        meta_olvidadas = min(int(num_preguntas * 0.30), huecos_restantes)
-        if meta_olvidadas > 0:
-            preguntas_acertadas_ids = list(
-                user_resps.filter(es_correcta=True)
-                .exclude(pregunta_id__in=[p.id for p in preguntas_finales])
-                .order_by('examen__fecha_finalizacion')  # Las más antiguas primero
-                .values_list('pregunta_id', flat=True)
-                .distinct()
-            )
-            olvidadas_ids = []
-            vistos = set()
-            for pid in preguntas_acertadas_ids:
-                if pid not in vistos:
-                    olvidadas_ids.append(pid)
-                    vistos.add(pid)
-                    if len(olvidadas_ids) >= meta_olvidadas:
-                        break
-            
-            olvidadas = list(preguntas_base.filter(id__in=olvidadas_ids))
-            preguntas_finales.extend(olvidadas)
+        pool = pool_oposicion(oposicion_activa.pk if oposicion_activa else None)
 
-        huecos_restantes = num_preguntas - len(preguntas_finales)
+        # ── Selección según la estrategia de la oposición ─────────────────────
+        estrategia = obtener_estrategia(oposicion_activa)
+        cubos = estrategia.seleccionar(request.user.pk, pool, num_preguntas, timezone.now())
+        preguntas_finales = [pid for ids in cubos.values() for pid in ids]
 
-        # 3. 30% Preguntas Nuevas (o rellenar los huecos que falten)
-        respondidas_total_ids = list(user_resps.values_list('pregunta_id', flat=True).distinct())
-        nuevas = list(
-            preguntas_base.exclude(id__in=respondidas_total_ids)
-            .order_by('?')[:huecos_restantes]
+        # El examen se crea ya con su oposición y su total de preguntas, y las
+        # preguntas se guardan en orden con un único INSERT (por id, sin cargarlas)
+        examen = Examen.objects.create(
+            usuario=request.user,
+            oposicion=oposicion_activa,
+            total_preguntas=len(preguntas_finales),
         )
-        preguntas_finales.extend(nuevas)
-
-        huecos_restantes = num_preguntas - len(preguntas_finales)
-
-        # 4. Fallback de Seguridad
-        if huecos_restantes > 0:
-            ids_actuales = [p.id for p in preguntas_finales]
-            relleno = list(preguntas_base.exclude(id__in=ids_actuales).order_by('?')[:huecos_restantes])
-            preguntas_finales.extend(relleno)
-
-        # Guardamos la relación
-        examen.preguntas.set(preguntas_finales)
+        examen.asignar_preguntas(preguntas_finales)
 
         logger.info(
-            'Examen #%d Adaptativo iniciado por %s. Total seleccionadas: %d (F:%d, O:%d, N:%d, R:%d).',
-            examen.pk, request.user.email, len(preguntas_finales),
-            len(falladas), len(olvidadas) if 'olvidadas' in locals() else 0,
-            len(nuevas), huecos_restantes if huecos_restantes > 0 and 'relleno' in locals() else 0
+            'Examen #%d (%s) iniciado por %s. Total seleccionadas: %d (%s).',
+            examen.pk, estrategia.codigo, request.user.email, len(preguntas_finales),
+            ', '.join(f'{cubo}: {len(ids)}' for cubo, ids in cubos.items())
         )
         return redirect(reverse('examen:simulacion_pagina', kwargs={'examen_id': examen.id}))
 
@@ -476,7 +330,7 @@ class SimulacionView(LoginRequiredMixin, View):
         if examen.fecha_finalizacion:
             return redirect(reverse('examen:simulacion_resultados', kwargs={'examen_id': examen.id}))
 
-        paginator = Paginator(examen.preguntas.all(), PREGUNTAS_POR_PAGINA)
+        paginator = Paginator(examen.preguntas_ordenadas(), PREGUNTAS_POR_PAGINA)
         page_number = request.GET.get('page', 1)
         page_obj = paginator.get_page(page_number)
 
@@ -488,31 +342,43 @@ class SimulacionView(LoginRequiredMixin, View):
             )
         }
 
+        # Capítulos de la página, entre los que se reparte el tiempo de estudio
+        latido_capitulos = Articulo.objects.filter(
+            pk__in={pregunta.articulo_id for pregunta in page_obj.object_list}
+        ).values_list('capitulo_id', flat=True).distinct()
+
         context = {
             'examen': examen,
             'page_obj': page_obj,
             'total_preguntas': paginator.count,
             'respuestas_guardadas': respuestas_guardadas,
+            'latido_capitulos': ','.join(map(str, latido_capitulos)),
+            'latido_segundos': intervalo_latido(),
         }
         return render(request, self.template_name, context)
 
     def post(self, request, examen_id):
         examen = get_object_or_404(Examen, id=examen_id, usuario=request.user)
 
+        if examen.fecha_finalizacion:
+            return redirect(reverse('examen:simulacion_resultados', kwargs={'examen_id': examen.id}))
+
+        respuestas = {}
         for key, value in request.POST.items():
             if key.startswith('pregunta_'):
                 try:
-                    pregunta_id = int(key.split('_')[1])
-                    pregunta = Pregunta.objects.get(id=pregunta_id)
-                    RespuestaUsuario.objects.update_or_create(
-                        examen=examen,
-                        pregunta=pregunta,
-                        defaults={'respuesta_seleccionada': value},
-                    )
-                except (ValueError, Pregunta.DoesNotExist):
+                    respuestas[int(key.split('_')[1])] = value
+                except ValueError:
                     logger.warning('Respuesta inválida ignorada: key=%s', key)
 
-        paginator = Paginator(examen.preguntas.all(), PREGUNTAS_POR_PAGINA)
+        # Una consulta para la plantilla y un único upsert para todas las respuestas
+        guardadas = examen.guardar_respuestas(respuestas)
+        if guardadas < len(respuestas):
+            logger.warning(
+                'Examen #%d: %d respuestas inválidas ignoradas.', examen.pk, len(respuestas) - guardadas
+            )
+
+        paginator = Paginator(examen.preguntas_ordenadas(), PREGUNTAS_POR_PAGINA)
         current_page_number = int(request.POST.get('page_number', 1))
         page_obj = paginator.get_page(current_page_number)
 
@@ -526,6 +392,71 @@ class SimulacionView(LoginRequiredMixin, View):
         return redirect(reverse('examen:simulacion_resultados', kwargs={'examen_id': examen.id}))
 
 
+class AutoguardadoRespuestasView(LoginRequiredMixin, View):
+    """
+    POST /simulacion/<id>/respuestas/ — autoguardado de respuestas en JSON.
+
+    Cuerpo: {"version": <int>, "respuestas": {"<pregunta_id>": "<letra>", ...}}.
+    Responde {"version": <nueva>} o 409 con la versión vigente si el lote llega
+    desfasado, para que el cliente lo reenvíe sobre ella.
+    """
+
+    raise_exception = True
+
+    def post(self, request, examen_id):
+        examen = get_object_or_404(
+            Examen.objects.only('id', 'version_respuestas', 'fecha_finalizacion'),
+            id=examen_id, usuario=request.user,
+        )
+        if examen.fecha_finalizacion:
+            return JsonResponse(
+                {'error': 'finalizado', 'url': examen.get_absolute_url()}, status=409
+            )
+
+        try:
+            datos = json.loads(request.body)
+            version = int(datos['version'])
+            respuestas = {
+                int(pregunta_id): str(letra)
+                for pregunta_id, letra in dict(datos['respuestas']).items()
+            }
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'error': 'lote inválido'}, status=400)
+
+        nueva_version = examen.guardar_lote_respuestas(respuestas, version)
+        if nueva_version is None:
+            examen.refresh_from_db(fields=['version_respuestas', 'fecha_finalizacion'])
+            if examen.fecha_finalizacion:
+                return JsonResponse(
+                    {'error': 'finalizado', 'url': examen.get_absolute_url()}, status=409
+                )
+            return JsonResponse(
+                {'error': 'version', 'version': examen.version_respuestas}, status=409
+            )
+        return JsonResponse({'version': nueva_version})
+
+
+class LatidoEstudioView(LoginRequiredMixin, View):
+    """
+    POST /latido/ — latido de las páginas de capítulo y de simulacro.
+
+    Cuerpo (formulario): uno o varios `capitulo=<id>`. Suma un intervalo de
+    estudio en `TiempoEstudio` (ver `examen.tiempo_estudio`) y responde 204.
+    """
+
+    raise_exception = True
+
+    def post(self, request):
+        try:
+            capitulos = [int(capitulo_id) for capitulo_id in request.POST.getlist('capitulo')]
+        except ValueError:
+            return JsonResponse({'error': 'capítulo inválido'}, status=400)
+        if not capitulos:
+            return JsonResponse({'error': 'capítulo requerido'}, status=400)
+        registrar_latido(request.user.pk, capitulos)
+        return HttpResponse(status=204)
+
+
 class ResultadosView(LoginRequiredMixin, DetailView):
     """Muestra los resultados finales de un examen y calcula la puntuación si aún no existe."""
 
@@ -536,38 +467,63 @@ class ResultadosView(LoginRequiredMixin, DetailView):
 
     def get_object(self, queryset=None):
         examen = super().get_object(queryset)
-        if examen.usuario != self.request.user:
+        if examen.usuario_id != self.request.user.pk:
             raise Http404("Examen no encontrado.")
-        if examen.puntuacion is None:
-            self._calcular_y_guardar_puntuacion(examen)
+        if examen.fecha_finalizacion is None:
+            examen = self._finalizar(examen)
         return examen
 
+    def post(self, request, examen_id):
+        """El botón «Finalizar» envía un POST: se redirige al GET que finaliza y muestra."""
+        return redirect(reverse('examen:simulacion_resultados', kwargs={'examen_id': examen_id}))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         examen = self.object
 
-        respuestas = examen.respuestas_usuario.select_related(
-            'pregunta',
-            'pregunta__articulo',
-            'pregunta__articulo__capitulo',
-        ).all()
-
-        aciertos = respuestas.filter(es_correcta=True).count()
-        errores = respuestas.filter(es_correcta=False).count()
-        sin_contestar = examen.preguntas.count() - (aciertos + errores)
-
+        # Los contadores se guardaron al finalizar; solo se leen las falladas
         context.update({
-            'aciertos': aciertos,
-            'errores': errores,
-            'sin_contestar': sin_contestar,
-            'preguntas_falladas': respuestas.filter(es_correcta=False),
+            'aciertos': examen.respuestas_correctas,
+            'errores': examen.respuestas_erroneas,
+            'sin_contestar': examen.respuestas_en_blanco,
+            'preguntas_falladas': list(
+                examen.respuestas_usuario
+                .filter(es_correcta=False)
+                .select_related('pregunta', 'pregunta__articulo', 'pregunta__articulo__capitulo')
+            ),
         })
         return context
 
-    def _calcular_y_guardar_puntuacion(self, examen: Examen) -> None:
-        """Calcula la puntuación aplicando penalización por error según la oposición."""
-        aciertos = examen.respuestas_usuario.filter(es_correcta=True).count()
-        errores = examen.respuestas_usuario.filter(es_correcta=False).count()
+    @transaction.atomic
+    def _finalizar(self, examen: Examen) -> Examen:
+        """Puntúa el examen aplicando la penalización de la oposición y lo cierra.
+
+        El UPDATE condicional sobre `fecha_finalizacion` bloquea la fila del
+        examen: si dos peticiones llegan a la vez, solo una lo finaliza y la
+        otra lee el resultado ya guardado. También corta el autoguardado, que
+        exige `fecha_finalizacion` vacía.
+        """
+        reclamado = Examen.objects.filter(
+            pk=examen.pk, fecha_finalizacion__isnull=True,
+        ).update(fecha_finalizacion=timezone.now())
+        examen = Examen.objects.select_related('oposicion').get(pk=examen.pk)
+        if not reclamado:
+            return examen
+
+        # Total, aciertos y errores en un único agregado condicional
+        resumen = (
+            PreguntaExamen.objects.filter(examen=examen)
+            .alias(respuesta=FilteredRelation(
+                'pregunta__respuestas_usuario',
+                condition=Q(pregunta__respuestas_usuario__examen=examen),
+            ))
+            .aggregate(
+                total=Count('id'),
+                aciertos=Count('respuesta', filter=Q(respuesta__es_correcta=True)),
+                errores=Count('respuesta', filter=Q(respuesta__es_correcta=False)),
+            )
+        )
+        aciertos, errores = resumen['aciertos'], resumen['errores']
 
         penalizacion = (
             examen.oposicion.penalizacion
@@ -580,13 +536,46 @@ class ResultadosView(LoginRequiredMixin, DetailView):
         examen.puntuacion = float(puntuacion_final)
         examen.respuestas_correctas = aciertos
         examen.respuestas_erroneas = errores
-        examen.fecha_finalizacion = timezone.now()
-        examen.save()
+        examen.respuestas_en_blanco = resumen['total'] - aciertos - errores
+        examen.total_preguntas = resumen['total']
+        examen.save(update_fields=[
+            'puntuacion', 'respuestas_correctas', 'respuestas_erroneas',
+            'respuestas_en_blanco', 'total_preguntas',
+        ])
+
+        actualizar_estadisticas_capitulos(examen)
+        actualizar_estado_preguntas(examen)
+        transaction.on_commit(lambda: invalidar_dashboard(examen.usuario_id))
 
         logger.info(
             'Examen #%d finalizado. Puntuación: %.2f (aciertos=%d, errores=%d)',
             examen.pk, float(puntuacion_final), aciertos, errores
         )
+        return examen
+
+
+class BusquedaView(LoginRequiredMixin, TemplateView):
+    """Búsqueda de texto completo en artículos, preguntas y capítulos."""
+
+    template_name = 'examen/busqueda.html'
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        consulta = self.request.GET.get('q', '').strip()
+        tipo = self.request.GET.get('tipo', '')
+        if tipo not in DocumentoBusqueda.TipoDocumento.values:
+            tipo = ''
+
+        context['consulta'] = consulta
+        context['tipo'] = tipo
+        context['tipos'] = DocumentoBusqueda.TipoDocumento.choices
+        if consulta:
+            resultados = ResultadosBusqueda(consulta, tipo or None)
+            context['page_obj'] = Paginator(resultados, self.paginate_by).get_page(
+                self.request.GET.get('page')
+            )
+        return context
 
 
 class ErrorView(LoginRequiredMixin, TemplateView):
@@ -684,7 +673,11 @@ from django.utils.decorators import method_decorator
 from django.http import JsonResponse
 from django.contrib import messages as _messages
 
-from .forms import PreguntaStaffForm
+from usuarios.middleware.profiler import PARAMETRO as PARAMETRO_PERFIL, lista_perfiles, obtener_perfil
+
+from .duplicados import grupos_duplicados
+from .forms import ImportarPreguntasForm, PreguntaStaffForm
+from .importacion import MAX_ERRORES_MOSTRADOS, contar_filas, importar_preguntas
 
 
 @method_decorator(staff_member_required, name='dispatch')
@@ -721,6 +714,8 @@ class PanelStaffView(LoginRequiredMixin, TemplateView):
             'articulos_sin_preguntas': articulos_sin_preguntas,
             'preguntas_por_oposicion': list(preguntas_por_oposicion),
             'ultimas_preguntas': ultimas_preguntas,
+            'perfiles': lista_perfiles(),
+            'parametro_perfil': PARAMETRO_PERFIL,
         })
         return context
 
@@ -750,38 +745,134 @@ class NuevaPreguntaStaffView(LoginRequiredMixin, View):
 
 
 @method_decorator(staff_member_required, name='dispatch')
+class ImportarPreguntasStaffView(LoginRequiredMixin, View):
+    """Importación masiva de preguntas desde un fichero (ver `examen.importacion`).
+
+    La importación se hace dentro de la petición, así que se limita a
+    `IMPORTACION_WEB_MAX_PREGUNTAS` filas para no agotar el tiempo del worker
+    a mitad (cada lote se guarda por separado). Los ficheros más grandes se
+    importan con `manage.py importar_preguntas`.
+    """
+
+    template_name = 'staff/importar_preguntas.html'
+
+    def get(self, request, *args, **kwargs):
+        return render(request, self.template_name, {'form': ImportarPreguntasForm()})
+
+    def post(self, request, *args, **kwargs):
+        form = ImportarPreguntasForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, self.template_name, {'form': form})
+
+        archivo = form.cleaned_data['archivo']
+        archivo.seek(0)
+        # El fichero subido se decodifica en streaming, sin leerlo entero
+        flujo = io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline='')
+        limite = getattr(settings, 'IMPORTACION_WEB_MAX_PREGUNTAS', 1000)
+        try:
+            if contar_filas(flujo, form.cleaned_data['formato'], limite + 1) > limite:
+                form.add_error('archivo', (
+                    f'El fichero tiene más de {limite} preguntas: impórtalo con el '
+                    f'comando manage.py importar_preguntas.'
+                ))
+                return render(request, self.template_name, {'form': form})
+            flujo.seek(0)
+            resultado = importar_preguntas(
+                flujo, form.cleaned_data['formato'], form.cleaned_data['oposicion'],
+                simular=form.cleaned_data['simular'],
+            )
+        finally:
+            flujo.detach()
+
+        if resultado.importadas:
+            _messages.success(request, f'{resultado.importadas} preguntas importadas.')
+        return render(request, self.template_name, {
+            'form': form,
+            'resultado': resultado,
+            'errores': resultado.errores[:MAX_ERRORES_MOSTRADOS],
+            'max_errores': MAX_ERRORES_MOSTRADOS,
+        })
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class PerfilStaffView(LoginRequiredMixin, View):
+    """Detalle de una petición perfilada (ver `usuarios.middleware.profiler`).
+
+    Con `?descargar=1` devuelve el volcado de cProfile como fichero `.prof`.
+    """
+
+    template_name = 'staff/perfil.html'
+
+    def get(self, request, perfil_id, *args, **kwargs):
+        perfil = obtener_perfil(perfil_id)
+        if perfil is None:
+            raise Http404('El perfil ya no está disponible')
+        if request.GET.get('descargar'):
+            respuesta = HttpResponse(perfil['volcado'], content_type='application/octet-stream')
+            respuesta['Content-Disposition'] = f'attachment; filename="perfil-{perfil_id}.prof"'
+            return respuesta
+        # El middleware las guarda ya de la más lenta a la más rápida
+        return render(request, self.template_name, {'perfil': perfil, 'consultas': perfil['sql']})
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class DuplicadosStaffView(LoginRequiredMixin, TemplateView):
+    """Grupos de preguntas casi duplicadas del banco (ver `examen.duplicados`)."""
+
+    template_name = 'staff/duplicados.html'
+    max_grupos = 100
+
+    def get_context_data(self, **kwargs: dict) -> dict:
+        context = super().get_context_data(**kwargs)
+        grupos = grupos_duplicados()
+        mostrados = grupos[:self.max_grupos]
+        preguntas = Pregunta.objects.select_related('articulo__capitulo__tema').in_bulk(
+            [pregunta_id for miembros in mostrados for pregunta_id in miembros]
+        )
+        context.update({
+            'grupos': [[preguntas[pregunta_id] for pregunta_id in miembros] for miembros in mostrados],
+            'total_grupos': len(grupos),
+            'total_repetidas': sum(len(miembros) - 1 for miembros in grupos),
+            'max_grupos': self.max_grupos,
+        })
+        return context
+
+
+@method_decorator(staff_member_required, name='dispatch')
+@method_decorator(validar_con_etag(etag_api_temario), name='get')
 class ApiTemasPorOposicionView(View):
     """GET /staff/api/temas/?oposicion_id=<id>"""
 
     def get(self, request, *args, **kwargs):
         oposicion_id = request.GET.get('oposicion_id')
-        if not oposicion_id:
+        if not oposicion_id or not oposicion_id.isdigit():
             return JsonResponse({'error': 'oposicion_id requerido'}, status=400)
-        temas = (
-            Tema.objects.filter(oposiciones__id=oposicion_id)
-            .order_by('orden', 'titulo')
-            .values('id', 'titulo', 'bloque', 'orden')
+        temas = sorted(
+            arbol_temario(int(oposicion_id)).lista_temas(),
+            key=lambda tema: (tema.orden, tema.titulo),
         )
-        return JsonResponse({'temas': list(temas)})
+        return JsonResponse({'temas': [
+            {'id': t.id, 'titulo': t.titulo, 'bloque': t.bloque, 'orden': t.orden} for t in temas
+        ]})
 
 
 @method_decorator(staff_member_required, name='dispatch')
+@method_decorator(validar_con_etag(etag_api_temario), name='get')
 class ApiCapitulosPorTemaView(View):
     """GET /staff/api/capitulos/?tema_id=<id>"""
 
     def get(self, request, *args, **kwargs):
         tema_id = request.GET.get('tema_id')
-        if not tema_id:
+        if not tema_id or not tema_id.isdigit():
             return JsonResponse({'error': 'tema_id requerido'}, status=400)
-        capitulos = (
-            Capitulo.objects.filter(tema__id=tema_id)
-            .order_by('orden', 'titulo')
-            .values('id', 'titulo', 'orden')
-        )
-        return JsonResponse({'capitulos': list(capitulos)})
+        capitulos = arbol_temario().capitulos_de(int(tema_id))
+        return JsonResponse({'capitulos': [
+            {'id': c.id, 'titulo': c.titulo, 'orden': c.orden} for c in capitulos
+        ]})
 
 
 @method_decorator(staff_member_required, name='dispatch')
+@method_decorator(validar_con_etag(etag_api_articulos), name='get')
 class ApiArticulosPorCapituloView(View):
     """GET /staff/api/articulos/?capitulo_id=<id>"""
 
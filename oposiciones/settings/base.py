@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from decouple import config, Csv
 
@@ -48,6 +49,10 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    # El primero, para que la duración registrada cubra todo el resto
+    "usuarios.middleware.access_logging.AccessLogMiddleware",
+    "usuarios.middleware.db_logging.DbLoggingMiddleware",
+    "usuarios.middleware.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -55,7 +60,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "usuarios.middleware.access_logging.AccessLogMiddleware",
+    # Tras la autenticación: solo perfila peticiones de staff
+    "usuarios.middleware.profiler.ProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "oposiciones.urls"
@@ -122,6 +128,32 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collectstatic')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Envío de ficheros protegidos (examen.descargas): 'django', 'x-accel' (nginx)
+# o 'x-sendfile' (Apache/lighttpd). Con 'x-accel', el prefijo es una location
+# `internal` de nginx con `alias` a MEDIA_ROOT.
+DESCARGAS_BACKEND = config('DESCARGAS_BACKEND', default='django')
+DESCARGAS_X_ACCEL_PREFIJO = config('DESCARGAS_X_ACCEL_PREFIJO', default='/protegido/')
+
+# Caché
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'oposiciones',
+    }
+}
+
+# Segundos que se conserva el contexto cacheado del dashboard de cada usuario
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=900, cast=int)
+
+# Tiempo de estudio: segundos entre latidos de las páginas de capítulo y de
+# simulacro (cada latido cuenta ese intervalo)
+TIEMPO_ESTUDIO_LATIDO_S = config('TIEMPO_ESTUDIO_LATIDO_S', default=30, cast=int)
+
+# Preguntas que admite la importación desde el panel de staff; los ficheros
+# más grandes se importan con `manage.py importar_preguntas`
+IMPORTACION_WEB_MAX_PREGUNTAS = config('IMPORTACION_WEB_MAX_PREGUNTAS', default=1000, cast=int)
+
 # Usuarios customizados
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
@@ -137,6 +169,36 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Configuración de logging
 USE_X_FORWARDED_HOST = True
 
+# Registro de accesos (usuarios.middleware.access_logging): prefijos de ruta
+# que no se registran y fracción de respuestas correctas que sí (los errores
+# se registran siempre)
+ACCESS_LOG_EXCLUIR = config(
+    'ACCESS_LOG_EXCLUIR', default=f'/{STATIC_URL},/{MEDIA_URL},/favicon.ico', cast=Csv(),
+)
+ACCESS_LOG_MUESTREO = config('ACCESS_LOG_MUESTREO', default=1.0, cast=float)
+
+# Registro de consultas (usuarios.middleware.db_logging): umbral de consulta
+# lenta, fracción del resto que se registra y consultas por petición a partir
+# de las cuales se registra un resumen
+CONSULTAS_LENTAS_UMBRAL_MS = config('CONSULTAS_LENTAS_UMBRAL_MS', default=100, cast=float)
+CONSULTAS_LENTAS_MUESTREO = config('CONSULTAS_LENTAS_MUESTREO', default=0.0, cast=float)
+CONSULTAS_LIMITE_POR_PETICION = config('CONSULTAS_LIMITE_POR_PETICION', default=200, cast=int)
+# La cabecera Server-Timing (tiempo y consultas de BD) solo se envía con DEBUG
+# o a usuarios staff, salvo que se haga pública
+SERVER_TIMING_PUBLICO = config('SERVER_TIMING_PUBLICO', default=False, cast=bool)
+
+# Métricas Prometheus (usuarios.middleware.metrics): directorio compartido por
+# los workers (vaciarlo al desplegar), segundos entre volcados de cada proceso
+# y token para `Authorization: Bearer <token>` en /metricas/ (sin token, solo staff)
+METRICAS_DIR = config('METRICAS_DIR', default=os.path.join(tempfile.gettempdir(), 'oposiciones-metricas'))
+METRICAS_INTERVALO_S = config('METRICAS_INTERVALO_S', default=5, cast=float)
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
+# Perfilado bajo demanda (usuarios.middleware.profiler): perfiles que se
+# conservan y consultas más lentas de cada uno con su EXPLAIN
+PERFILES_MAX = config('PERFILES_MAX', default=20, cast=int)
+PERFIL_MAX_EXPLAIN = config('PERFIL_MAX_EXPLAIN', default=5, cast=int)
+
 LOGGING = {
     # Versión del esquema, siempre es 1
     "version": 1,
@@ -155,23 +217,23 @@ LOGGING = {
     # ----------- SALIDAS DE LOGS --------------
     # Define dónde se guardarán los archivos
     'handlers': {
+        # Solo consultas lentas o muestreadas, en JSON Lines
         'file_db': {
-            'level': 'DEBUG',  # Nivel medio de eventos para registrar
-            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'level': 'INFO',
+            'class': 'usuarios.middleware.access_logging.ManejadorEnCola',
             'filename': os.path.join(BASE_DIR, 'logs/db.log'),
             'when': 'midnight',         # Rota cada día
             'backupCount': 7,
-            'utc': True, 
-            'formatter': 'verbose',  # Usa el formato definido arriba
+            'utc': True,
         },
+        # JSON Lines escrito desde un hilo aparte: no bloquea las peticiones
         'file_access': {
             'level': 'INFO',
-            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'class': 'usuarios.middleware.access_logging.ManejadorEnCola',
             'filename': os.path.join(BASE_DIR, 'logs/access.log'),
             'when': 'midnight',         # Rota cada día
             'backupCount': 7,
-            'utc': True, 
-            'formatter': 'verbose',
+            'utc': True,
         },
         'file_errors': {
             'level': 'ERROR',
@@ -187,10 +249,10 @@ LOGGING = {
     # ----------- REGISTRO DE EVENTOS ----------
     # Define que cosas se van a registrar y con qué nivel de detalle
     'loggers': {
-        # Logger para el backend de la base de datos (Django ejecutando SQL)
-        'django.db.backends': {
+        # Consultas lentas y muestreadas (usuarios.middleware.db_logging)
+        'consultas_lentas': {
             'handlers': ['file_db'],
-            'level': 'DEBUG',
+            'level': 'INFO',
             'propagate': False,
         },
 
@@ -34,3 +34,21 @@ DATABASES = {
         'PORT': config('DB_PORT'),
     }
 }
+
+# Caché
+# Compartida en disco entre los workers de gunicorn: los contadores de versión
+# que invalidan las cachés deben ser los mismos para todos los procesos.
+# FileBasedCache no es atómica entre procesos y, al pasar de MAX_ENTRIES,
+# borra al azar una de cada CULL_FREQUENCY entradas: solo debe guardar datos
+# que se puedan recalcular. El límite por defecto de Django (300) se queda
+# corto con una entrada de dashboard por usuario.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int),
+            'CULL_FREQUENCY': config('CACHE_CULL_FREQUENCY', default=4, cast=int),
+        },
+    }
+}
@@ -22,6 +22,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from examen import views as examen_views
+from usuarios import views as usuarios_views
 
 urlpatterns = [
     path("", examen_views.HomeView.as_view(), name='home'),
@@ -29,6 +30,7 @@ urlpatterns = [
     path("examen/", include("examen.urls")),
     path("examen/staff/", include("examen.staff_urls")),
     path("admin/", admin.site.urls),
+    path("metricas/", usuarios_views.metricas_view, name='metricas'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG:
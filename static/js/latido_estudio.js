@@ -0,0 +1,48 @@
+/**
+ * latido_estudio.js
+ * Latidos de tiempo de estudio de las páginas de capítulo y de simulacro.
+ *
+ * Cada `data-intervalo` segundos envía un latido con los capítulos de la
+ * página, siempre que la pestaña esté visible y el usuario haya interactuado
+ * con ella hace poco. El servidor cuenta un intervalo por latido.
+ *
+ * Uso:
+ *   <script src="latido_estudio.js" data-url="..." data-capitulos="3,7"
+ *           data-intervalo="30" data-csrf="..."></script>
+ */
+
+'use strict';
+
+(function () {
+    const script = document.currentScript;
+    if (!script || !script.dataset.url || !script.dataset.capitulos) return;
+
+    // ── Configuración ─────────────────────────────────────────────────────────
+    const URL_API = script.dataset.url;
+    const CAPITULOS = script.dataset.capitulos.split(',').filter(Boolean);
+    const INTERVALO_MS = (parseInt(script.dataset.intervalo, 10) || 30) * 1000;
+    const INACTIVIDAD_MS = 5 * 60 * 1000;  // Sin interacción, el tiempo no cuenta
+    const csrfToken = script.dataset.csrf;
+
+    // ── Actividad del usuario ─────────────────────────────────────────────────
+    let ultimaActividad = Date.now();
+    ['mousemove', 'keydown', 'scroll', 'touchstart', 'click'].forEach(function (evento) {
+        window.addEventListener(evento, function () { ultimaActividad = Date.now(); }, { passive: true });
+    });
+
+    function latido() {
+        if (document.visibilityState !== 'visible') return;
+        if (Date.now() - ultimaActividad > INACTIVIDAD_MS) return;
+
+        const datos = new FormData();
+        datos.append('csrfmiddlewaretoken', csrfToken);
+        CAPITULOS.forEach(function (capitulo) { datos.append('capitulo', capitulo); });
+        // sendBeacon no bloquea la página ni espera respuesta
+        if (!navigator.sendBeacon || !navigator.sendBeacon(URL_API, datos)) {
+            fetch(URL_API, { method: 'POST', credentials: 'same-origin', body: datos })
+                .catch(function (err) { console.error('Latido fallido:', err); });
+        }
+    }
+
+    setInterval(latido, INTERVALO_MS);
+})();
@@ -0,0 +1,147 @@
+/**
+ * simulacion_autosave.js
+ * Autoguardado de respuestas en la página del simulacro.
+ *
+ * Cada cambio de respuesta se acumula en un lote {pregunta_id: letra} que se
+ * envía como JSON tras una breve pausa, junto con el contador de versión del
+ * examen. Cambiar de página vacía antes el lote pendiente y navega con un GET,
+ * sin reenviar el formulario completo.
+ *
+ * Si el servidor rechaza un lote por versión desfasada (409), se adopta la
+ * versión que devuelve y se reenvía fusionado con los cambios posteriores.
+ */
+
+'use strict';
+
+(function () {
+    const form = document.getElementById('mainSimulacionForm');
+    if (!form || !form.dataset.autoguardadoUrl) return; // No estamos en un simulacro
+
+    // ── Configuración ─────────────────────────────────────────────────────────
+    const URL_API = form.dataset.autoguardadoUrl;
+    const ESPERA_MS = 800;       // Pausa sin cambios antes de enviar el lote
+    const MAX_REINTENTOS = 3;    // Reenvíos tras un 409 por versión
+    const csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+
+    // ── Estado ────────────────────────────────────────────────────────────────
+    let version = parseInt(form.dataset.version, 10) || 0;
+    let pendientes = {};              // Cambios aún no confirmados por el servidor
+    let cola = Promise.resolve();     // Encadena los envíos para respetar el orden
+    let temporizador = null;
+
+    function hayPendientes() {
+        return Object.keys(pendientes).length > 0;
+    }
+
+    /**
+     * Envía los cambios pendientes en un único lote.
+     * @param {boolean} keepalive - Permite que el envío sobreviva al cierre de la página.
+     * @param {number} reintentos - Reenvíos restantes tras un conflicto de versión.
+     * @returns {Promise<void>}
+     */
+    async function enviar(keepalive = false, reintentos = MAX_REINTENTOS) {
+        if (!hayPendientes()) return;
+        const lote = pendientes;
+        pendientes = {};
+
+        let resp, datos;
+        try {
+            resp = await fetch(URL_API, {
+                method: 'POST',
+                credentials: 'same-origin',
+                keepalive: keepalive,
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': csrfToken,
+                    'X-Requested-With': 'XMLHttpRequest',
+                },
+                body: JSON.stringify({ version: version, respuestas: lote }),
+            });
+            datos = await resp.json().catch(() => ({}));
+        } catch (err) {
+            // Sin conexión: el lote vuelve a la cola, sin pisar cambios más nuevos
+            pendientes = { ...lote, ...pendientes };
+            console.error('Autoguardado fallido:', err);
+            return;
+        }
+
+        if (resp.ok) {
+            version = datos.version;
+            return;
+        }
+        if (resp.status === 409 && datos.error === 'finalizado') {
+            window.location.assign(datos.url);
+            return;
+        }
+        pendientes = { ...lote, ...pendientes };
+        if (resp.status === 409 && datos.version !== undefined && reintentos > 0) {
+            version = datos.version;
+            return enviar(keepalive, reintentos - 1);
+        }
+        console.error(`Autoguardado rechazado: HTTP ${resp.status}`);
+    }
+
+    /**
+     * Envía ya lo pendiente, después de cualquier envío en curso.
+     * @returns {Promise<void>}
+     */
+    function vaciar() {
+        clearTimeout(temporizador);
+        cola = cola.then(() => enviar());
+        return cola;
+    }
+
+    function programarEnvio() {
+        clearTimeout(temporizador);
+        temporizador = setTimeout(vaciar, ESPERA_MS);
+    }
+
+    // ── Eventos ───────────────────────────────────────────────────────────────
+    form.addEventListener('change', (evento) => {
+        const radio = evento.target;
+        if (!radio.classList.contains('op-radio')) return;
+        pendientes[radio.name.replace('pregunta_', '')] = radio.value;
+        programarEnvio();
+    });
+
+    // Al abandonar la página, lo que quede se envía con keepalive
+    window.addEventListener('pagehide', () => {
+        if (hayPendientes()) enviar(true);
+    });
+
+    // ── API para la plantilla ─────────────────────────────────────────────────
+
+    /**
+     * Guarda lo pendiente y navega a otra página del examen con un GET.
+     * Si no se ha podido guardar, recurre al envío clásico del formulario.
+     * @param {number|string} numero
+     */
+    function irAPagina(numero) {
+        vaciar().then(() => {
+            if (hayPendientes()) {
+                document.getElementById('id_page_number').value = numero;
+                form.submit();
+                return;
+            }
+            const url = new URL(window.location.href);
+            url.searchParams.set('page', numero);
+            window.location.assign(url);
+        });
+    }
+
+    /**
+     * Guarda lo pendiente y envía el formulario indicado (p. ej. finalizar).
+     * @param {HTMLFormElement} formulario
+     */
+    function enviarTrasGuardar(formulario) {
+        vaciar().then(() => {
+            if (hayPendientes()) {
+                alert('No se han podido guardar algunas respuestas. Revisa tu conexión e inténtalo de nuevo.');
+                return;
+            }
+            formulario.submit();
+        });
+    }
+
+    window.autoguardado = { vaciar, irAPagina, enviarTrasGuardar };
+})();
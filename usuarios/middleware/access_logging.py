@@ -1,29 +1,138 @@
 """
 Middleware para el registro de logs
+
+Cada petición deja una línea JSON (JSON Lines) en el logger `access_logger`
+con el método, la ruta, la vista, el estado, la duración, la IP, el usuario
+y, si está activo `DbLoggingMiddleware`, las consultas y el tiempo en la base
+de datos.
+
+- Las rutas que empiezan por algún prefijo de `ACCESS_LOG_EXCLUIR` (estáticos,
+  media) no se registran.
+- `ACCESS_LOG_MUESTREO` (0-1) es la fracción de respuestas correctas que se
+  registran; los errores (4xx y 5xx) se registran siempre. Cada línea lleva
+  la tasa aplicada para poder reescalar los recuentos.
+- El usuario se lee después de la respuesta y solo si la vista ya lo había
+  cargado: el registro nunca provoca la consulta de la sesión y del usuario.
+
+La escritura en disco no bloquea la petición: `ManejadorEnCola` deja el
+registro en una cola y un `QueueListener` lo escribe desde otro hilo.
 """
+import json
 import logging
-from datetime import datetime
+import os
+import queue
+import random
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from django.conf import settings
+from django.utils.functional import empty
 
 logger = logging.getLogger('access_logger')
 
 
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro; los campos van en `record.datos` (`extra={'datos': ...}`)."""
+
+    def format(self, record):
+        datos = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+        }
+        datos.update(getattr(record, 'datos', None) or {'mensaje': record.getMessage()})
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorEnCola(QueueHandler):
+    """Encola los registros y los escribe en un fichero rotado desde un hilo aparte.
+
+    El hilo se arranca con el primer registro de cada proceso, de modo que
+    funciona también en los workers de gunicorn creados con `fork`.
+    """
+
+    def __init__(self, filename, when='midnight', backupCount=7, utc=True):
+        super().__init__(queue.SimpleQueue())
+        self.destino = TimedRotatingFileHandler(
+            filename, when=when, backupCount=backupCount, utc=utc, delay=True,
+        )
+        self.destino.setFormatter(FormatoJSON())
+        self._oyente = None
+        self._pid = None
+
+    def enqueue(self, record):
+        # `handle()` ya tiene el lock del manejador: no hay carreras al arrancar
+        if self._pid != os.getpid():
+            self._arrancar()
+        super().enqueue(record)
+
+    def _arrancar(self):
+        # Tras un fork, la cola y el hilo del proceso padre no sirven
+        self.queue = queue.SimpleQueue()
+        self._oyente = QueueListener(self.queue, self.destino, respect_handler_level=True)
+        self._oyente.start()
+        self._pid = os.getpid()
+
+    def close(self):
+        if self._oyente is not None and self._pid == os.getpid():
+            self._oyente.stop()
+            self._oyente = None
+        self.destino.close()
+        super().close()
+
+
 class AccessLogMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.excluidas = tuple(getattr(settings, 'ACCESS_LOG_EXCLUIR', ()))
+        self.muestreo = float(getattr(settings, 'ACCESS_LOG_MUESTREO', 1.0))
 
     def __call__(self, request):
-        ip = self.get_client_ip(request)
-        user = request.user if request.user.is_authenticated else 'Anonymous'
-        path = request.path
-        method = request.method
-        logger.info(f'{datetime.now()} - {ip} - {user} - {method} {path}')
+        if self.excluidas and request.path.startswith(self.excluidas):
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
         response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        if response.status_code < 400 and self.muestreo < 1 and random.random() >= self.muestreo:
+            return response
+        if logger.isEnabledFor(logging.INFO):
+            coincidencia = getattr(request, 'resolver_match', None)
+            logger.info('acceso', extra={'datos': {
+                'metodo': request.method,
+                'ruta': request.path,
+                'vista': coincidencia.view_name if coincidencia else None,
+                'estado': response.status_code,
+                'duracion_ms': round(duracion * 1000, 1),
+                'ip': self.get_client_ip(request),
+                'usuario': self.get_user_id(request),
+                'muestreo': self.muestreo,
+                **self.get_db_stats(request),
+            }})
         return response
 
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+            ip = x_forwarded_for.split(',')[0].strip()
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+    def get_db_stats(self, request):
+        """Consultas y tiempo en la base de datos medidos por `DbLoggingMiddleware`."""
+        estadisticas = getattr(request, 'estadisticas_bd', None)
+        if estadisticas is None:
+            return {}
+        return {
+            'consultas': estadisticas.consultas,
+            'tiempo_bd_ms': round(estadisticas.tiempo * 1000, 1),
+        }
+
+    def get_user_id(self, request):
+        """Id del usuario si la petición ya lo cargó; no fuerza la consulta."""
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return None
+        return user.pk if user.is_authenticated else None
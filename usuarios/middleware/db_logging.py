@@ -0,0 +1,132 @@
+"""
+Middleware para el registro de consultas lentas
+
+En lugar de registrar todo el SQL, un `execute_wrapper` mide cada consulta de
+la petición y solo registra en el logger `consultas_lentas`:
+
+- las que tardan al menos `CONSULTAS_LENTAS_UMBRAL_MS`;
+- una fracción `CONSULTAS_LENTAS_MUESTREO` (0-1) del resto, para conocer la
+  carga normal;
+- un resumen de la petición si lanza más de `CONSULTAS_LIMITE_POR_PETICION`
+  consultas (el síntoma de un N+1).
+
+Cada línea lleva la vista de origen y la huella del SQL: la sentencia con los
+literales sustituidos por `?` y las listas `IN (...)` colapsadas, que agrupa
+las ejecuciones de una misma consulta y no expone los datos de los
+parámetros.
+
+El número de consultas y el tiempo total en la base de datos quedan en
+`request.estadisticas_bd` (los usa el registro de accesos). La cabecera
+`Server-Timing`, visible en las herramientas de desarrollo del navegador, solo
+se envía con `DEBUG`, con `SERVER_TIMING_PUBLICO` o a usuarios staff cuya
+petición ya había cargado el usuario: es información interna.
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.functional import empty
+
+logger = logging.getLogger('consultas_lentas')
+
+_CADENAS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETROS = re.compile(r'%s|\$\d+|\?')
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_sql(sql: str) -> str:
+    """SQL sin literales ni parámetros: igual para todas las ejecuciones de una consulta."""
+    sql = _CADENAS.sub('?', sql)
+    sql = _NUMEROS.sub('?', sql)
+    sql = _PARAMETROS.sub('?', sql)
+    sql = _LISTAS.sub('(...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def huella_sql(sql_normalizado: str) -> str:
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+def nombre_vista(request) -> str:
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.view_name if coincidencia else request.path
+
+
+class EstadisticasConsultas:
+    """Contadores de una petición; también es el `execute_wrapper` que los alimenta."""
+
+    def __init__(self, request, umbral: float, muestreo: float):
+        self.request = request
+        self.umbral = umbral
+        self.muestreo = muestreo
+        self.consultas = 0
+        self.tiempo = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tiempo += duracion
+            lenta = duracion >= self.umbral
+            if lenta or (self.muestreo and random.random() < self.muestreo):
+                self.registrar(sql, duracion, context['connection'].alias, lenta)
+
+    def registrar(self, sql, duracion, alias, lenta):
+        normalizado = normalizar_sql(sql)
+        logger.log(logging.WARNING if lenta else logging.INFO, 'consulta', extra={'datos': {
+            'tipo': 'lenta' if lenta else 'muestra',
+            'vista': nombre_vista(self.request),
+            'bd': alias,
+            'duracion_ms': round(duracion * 1000, 1),
+            'huella': huella_sql(normalizado),
+            'sql': normalizado,
+        }})
+
+
+class DbLoggingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.umbral = getattr(settings, 'CONSULTAS_LENTAS_UMBRAL_MS', 100) / 1000
+        self.muestreo = float(getattr(settings, 'CONSULTAS_LENTAS_MUESTREO', 0.0))
+        self.limite = getattr(settings, 'CONSULTAS_LIMITE_POR_PETICION', 200)
+
+    def __call__(self, request):
+        estadisticas = EstadisticasConsultas(request, self.umbral, self.muestreo)
+        request.estadisticas_bd = estadisticas
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(estadisticas))
+            response = self.get_response(request)
+
+        if self.mostrar_server_timing(request):
+            response['Server-Timing'] = (
+                f'db;dur={estadisticas.tiempo * 1000:.1f};desc="{estadisticas.consultas} consultas"'
+            )
+        if self.limite and estadisticas.consultas > self.limite:
+            logger.warning('peticion', extra={'datos': {
+                'tipo': 'peticion',
+                'vista': nombre_vista(request),
+                'ruta': request.path,
+                'consultas': estadisticas.consultas,
+                'tiempo_bd_ms': round(estadisticas.tiempo * 1000, 1),
+            }})
+        return response
+
+    def mostrar_server_timing(self, request):
+        """Con `DEBUG`, si se ha hecho pública o a staff (sin forzar la carga del usuario)."""
+        if settings.DEBUG or getattr(settings, 'SERVER_TIMING_PUBLICO', False):
+            return True
+        user = getattr(request, 'user', None)
+        if user is None or getattr(user, '_wrapped', None) is empty:
+            return False
+        return user.is_staff
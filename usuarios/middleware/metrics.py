@@ -0,0 +1,206 @@
+"""
+Middleware de métricas por vista en formato Prometheus
+
+Por cada petición se acumula, con el nombre de la vista como etiqueta:
+
+- `oposiciones_peticiones_total`: peticiones por vista, método y estado;
+- `oposiciones_peticion_duracion_segundos`: histograma de latencia;
+- `oposiciones_peticion_consultas_bd`: histograma de consultas a la base de datos;
+- `oposiciones_peticion_bd_segundos`: histograma del tiempo en la base de datos.
+
+Las consultas salen del `execute_wrapper` de `DbLoggingMiddleware`
+(`request.estadisticas_bd`); si no está activo, el middleware instala el suyo.
+
+Cada proceso de gunicorn acumula en memoria y vuelca su estado, como mucho
+cada `METRICAS_INTERVALO_S` segundos, en su propio fichero JSON dentro de
+`METRICAS_DIR` (escritura atómica con `os.replace`, sin bloqueos entre
+procesos). `exposicion()` suma los ficheros de todos los procesos. Los de
+procesos terminados se conservan para que los contadores no retrocedan: el
+directorio debe vaciarse al desplegar, antes de arrancar gunicorn.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from glob import glob
+
+from django.conf import settings
+from django.db import connections
+
+from .db_logging import EstadisticasConsultas
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+METODOS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+SIN_VISTA = 'sin_vista'
+
+METRICAS = {
+    'oposiciones_peticiones_total': ('counter', 'Peticiones atendidas por vista, método y estado.'),
+    'oposiciones_peticion_duracion_segundos': ('histogram', 'Duración de las peticiones por vista.'),
+    'oposiciones_peticion_consultas_bd': ('histogram', 'Consultas a la base de datos por petición y vista.'),
+    'oposiciones_peticion_bd_segundos': ('histogram', 'Tiempo en la base de datos por petición y vista.'),
+}
+
+
+class RegistroMetricas:
+    """Contadores e histogramas del proceso, volcados a su fichero en `METRICAS_DIR`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self.contadores = {}     # (nombre, etiquetas) -> valor
+        self.histogramas = {}    # (nombre, etiquetas) -> [límites, cubetas, suma, cuenta]
+        self._ultimo_volcado = 0.0
+
+    def _comprobar_proceso(self):
+        # Un worker creado con fork no debe heredar lo acumulado por el padre
+        if self._pid != os.getpid():
+            self._reiniciar()
+
+    def incrementar(self, nombre, etiquetas, valor=1):
+        with self._lock:
+            self._comprobar_proceso()
+            clave = (nombre, etiquetas)
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor, limites):
+        with self._lock:
+            self._comprobar_proceso()
+            histograma = self.histogramas.get((nombre, etiquetas))
+            if histograma is None:
+                histograma = self.histogramas[(nombre, etiquetas)] = [list(limites), [0] * len(limites), 0.0, 0]
+            for indice, limite in enumerate(limites):
+                if valor <= limite:
+                    histograma[1][indice] += 1
+                    break
+            histograma[2] += valor
+            histograma[3] += 1
+
+    def volcar(self, forzar=False):
+        """Escribe el estado del proceso si ha pasado el intervalo (o si se fuerza)."""
+        intervalo = getattr(settings, 'METRICAS_INTERVALO_S', 5)
+        ahora = time.monotonic()
+        with self._lock:
+            self._comprobar_proceso()
+            if not forzar and ahora - self._ultimo_volcado < intervalo:
+                return
+            self._ultimo_volcado = ahora
+            estado = {
+                'contadores': [[n, e, v] for (n, e), v in self.contadores.items()],
+                'histogramas': [[n, e, *h] for (n, e), h in self.histogramas.items()],
+            }
+        directorio = settings.METRICAS_DIR
+        os.makedirs(directorio, exist_ok=True)
+        ruta = os.path.join(directorio, f'metricas-{self._pid}.json')
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as fichero:
+            json.dump(estado, fichero)
+        os.replace(temporal, ruta)
+
+
+registro = RegistroMetricas()
+
+
+def registrar_peticion(vista, metodo, estado, duracion, consultas, tiempo_bd):
+    etiquetas = (('vista', vista),)
+    registro.incrementar(
+        'oposiciones_peticiones_total',
+        (('vista', vista), ('metodo', metodo if metodo in METODOS else 'OTRO'), ('estado', str(estado))),
+    )
+    registro.observar('oposiciones_peticion_duracion_segundos', etiquetas, duracion, LIMITES_SEGUNDOS)
+    registro.observar('oposiciones_peticion_consultas_bd', etiquetas, consultas, LIMITES_CONSULTAS)
+    registro.observar('oposiciones_peticion_bd_segundos', etiquetas, tiempo_bd, LIMITES_SEGUNDOS)
+
+
+# ── Exposición ────────────────────────────────────────────────────────────────
+
+def _leer_estados(directorio):
+    for ruta in glob(os.path.join(directorio, 'metricas-*.json')):
+        try:
+            with open(ruta, encoding='utf-8') as fichero:
+                yield json.load(fichero)
+        except (OSError, ValueError):
+            continue  # Proceso escribiendo o fichero dañado: se omite en esta lectura
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares) -> str:
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exposicion() -> str:
+    """Métricas de todos los procesos en el formato de texto de Prometheus."""
+    registro.volcar(forzar=True)
+    contadores, histogramas = {}, {}
+    for estado in _leer_estados(settings.METRICAS_DIR):
+        for nombre, etiquetas, valor in estado.get('contadores', ()):
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, limites, cubetas, suma, cuenta in estado.get('histogramas', ()):
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumulado = histogramas.setdefault(clave, [limites, [0] * len(limites), 0.0, 0])
+            if acumulado[0] != limites:
+                continue  # Límites cambiados entre versiones: se descarta el fichero antiguo
+            acumulado[1] = [a + b for a, b in zip(acumulado[1], cubetas)]
+            acumulado[2] += suma
+            acumulado[3] += cuenta
+
+    lineas = []
+    for nombre, (tipo, ayuda) in METRICAS.items():
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+        if tipo == 'counter':
+            for (metrica, etiquetas), valor in sorted(contadores.items()):
+                if metrica == nombre:
+                    lineas.append(f'{nombre}{_etiquetas(etiquetas)} {_numero(valor)}')
+            continue
+        for (metrica, etiquetas), (limites, cubetas, suma, cuenta) in sorted(histogramas.items()):
+            if metrica != nombre:
+                continue
+            acumuladas = 0
+            for limite, cubeta in zip(limites, cubetas):
+                acumuladas += cubeta
+                lineas.append(f'{nombre}_bucket{_etiquetas((*etiquetas, ("le", limite)))} {acumuladas}')
+            lineas.append(f'{nombre}_bucket{_etiquetas((*etiquetas, ("le", "+Inf")))} {cuenta}')
+            lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(float(suma))}')
+            lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {cuenta}')
+    return '\n'.join(lineas) + '\n'
+
+
+# ── Middleware ────────────────────────────────────────────────────────────────
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with ExitStack() as pila:
+            estadisticas = getattr(request, 'estadisticas_bd', None)
+            if estadisticas is None:
+                estadisticas = EstadisticasConsultas(request, umbral=float('inf'), muestreo=0.0)
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(estadisticas))
+            inicio = time.perf_counter()
+            response = self.get_response(request)
+            duracion = time.perf_counter() - inicio
+
+        coincidencia = getattr(request, 'resolver_match', None)
+        registrar_peticion(
+            coincidencia.view_name if coincidencia else SIN_VISTA,
+            request.method, response.status_code, duracion,
+            estadisticas.consultas, estadisticas.tiempo,
+        )
+        registro.volcar()
+        return response
@@ -0,0 +1,157 @@
+"""
+Middleware de perfilado bajo demanda para el staff
+
+Un usuario staff perfila una petición añadiendo `?_perfil=1` a la URL o la
+cabecera `X-Perfil: 1`. Para esa petición se guarda:
+
+- el volcado de cProfile (descargable como `.prof` para snakeviz o pstats) y
+  el resumen de pstats ordenado por tiempo acumulado;
+- las consultas SQL con su duración y el plan (`EXPLAIN`) de las
+  `PERFIL_MAX_EXPLAIN` `SELECT` más lentas. Si hay más de
+  `MAX_CONSULTAS_GUARDADAS`, se conservan las más lentas.
+
+Los perfiles se guardan en la caché (compartida entre los workers) como un
+búfer circular de los `PERFILES_MAX` más recientes, que se consulta desde el
+panel de staff. La respuesta lleva su id en la cabecera `X-Perfil-Id`.
+
+Sin la marca, el coste es leer un parámetro de `request.GET` y una clave en
+`META`: no se consulta el usuario ni se instala nada.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+PARAMETRO = '_perfil'
+CABECERA = 'HTTP_X_PERFIL'
+CACHE_INDICE = 'perfiles:indice'
+CACHE_TIMEOUT = 24 * 60 * 60
+LINEAS_ESTADISTICAS = 60
+MAX_CONSULTAS_GUARDADAS = 500
+
+
+def _cache_perfil(perfil_id) -> str:
+    return f'perfiles:{perfil_id}'
+
+
+def guardar_perfil(perfil: dict) -> None:
+    """Añade el perfil al búfer circular y descarta los más antiguos."""
+    maximo = getattr(settings, 'PERFILES_MAX', 20)
+    cache.set(_cache_perfil(perfil['id']), perfil, CACHE_TIMEOUT)
+    indice = [perfil['id'], *cache.get(CACHE_INDICE, [])]
+    for antiguo in indice[maximo:]:
+        cache.delete(_cache_perfil(antiguo))
+    cache.set(CACHE_INDICE, indice[:maximo], CACHE_TIMEOUT)
+
+
+def obtener_perfil(perfil_id):
+    return cache.get(_cache_perfil(perfil_id))
+
+
+def lista_perfiles() -> list:
+    """Perfiles guardados, el más reciente primero (sin los datos pesados)."""
+    perfiles = cache.get_many([_cache_perfil(perfil_id) for perfil_id in cache.get(CACHE_INDICE, [])])
+    return [
+        {clave: valor for clave, valor in perfil.items() if clave not in ('volcado', 'estadisticas', 'sql')}
+        for perfil in sorted(perfiles.values(), key=lambda perfil: perfil['fecha'], reverse=True)
+    ]
+
+
+class _RegistroSQL:
+    """`execute_wrapper` que guarda cada consulta con sus parámetros y su duración."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'sql': sql, 'params': None if many else params,
+                'bd': context['connection'].alias,
+                'duracion_ms': round((time.perf_counter() - inicio) * 1000, 2),
+            })
+
+
+def _explicar(consulta):
+    """Plan de ejecución de una SELECT (o None si no se puede obtener)."""
+    if consulta['params'] is None or not consulta['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+    conexion = connections[consulta['bd']]
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(f"{conexion.ops.explain_query_prefix()} {consulta['sql']}", consulta['params'])
+            return '\n'.join(' '.join(str(columna) for columna in fila) for fila in cursor.fetchall())
+    except DatabaseError as error:
+        return f'No disponible: {error}'
+
+
+def _resumen(estadisticas) -> str:
+    salida = io.StringIO()
+    estadisticas.stream = salida
+    estadisticas.sort_stats('cumulative').print_stats(LINEAS_ESTADISTICAS)
+    return salida.getvalue()
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_explain = getattr(settings, 'PERFIL_MAX_EXPLAIN', 5)
+
+    def __call__(self, request):
+        solicitado = request.GET.get(PARAMETRO) == '1' or request.META.get(CABECERA) == '1'
+        if not solicitado or not request.user.is_staff:
+            return self.get_response(request)
+
+        registro_sql = _RegistroSQL()
+        perfilador = cProfile.Profile()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(registro_sql))
+            inicio = time.perf_counter()
+            perfilador.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfilador.disable()
+            duracion = time.perf_counter() - inicio
+
+        consultas = registro_sql.consultas
+        # Las más lentas primero: son las que se explican y las que se conservan
+        lentas = sorted(consultas, key=lambda c: c['duracion_ms'], reverse=True)
+        for consulta in lentas[:self.max_explain]:
+            consulta['explain'] = _explicar(consulta)
+        # `Stats` se queda con los datos del perfilador: volcado y resumen salen de él
+        estadisticas = pstats.Stats(perfilador)
+        coincidencia = getattr(request, 'resolver_match', None)
+        perfil = {
+            'id': uuid.uuid4().hex[:12],
+            'fecha': timezone.now(),
+            'usuario': str(request.user),
+            'metodo': request.method,
+            'ruta': request.get_full_path(),
+            'vista': coincidencia.view_name if coincidencia else None,
+            'estado': response.status_code,
+            'duracion_ms': round(duracion * 1000, 1),
+            'num_consultas': len(consultas),
+            'tiempo_bd_ms': round(sum(c['duracion_ms'] for c in consultas), 1),
+            'volcado': marshal.dumps(estadisticas.stats),
+            'estadisticas': _resumen(estadisticas),
+            'sql': [
+                {clave: valor for clave, valor in consulta.items() if clave != 'params'}
+                for consulta in lentas[:MAX_CONSULTAS_GUARDADAS]
+            ],
+        }
+        guardar_perfil(perfil)
+        response['X-Perfil-Id'] = perfil['id']
+        return response
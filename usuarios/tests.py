@@ -1,3 +1,216 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import pstats
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from .middleware.access_logging import AccessLogMiddleware, ManejadorEnCola
+from .middleware.db_logging import DbLoggingMiddleware, normalizar_sql
+from .middleware.metrics import registro as registro_metricas
+from .middleware.profiler import lista_perfiles
+
+
+def usuario_sin_cargar():
+    def cargar():
+        raise AssertionError('El registro no debe cargar el usuario')
+    return SimpleLazyObject(cargar)
+
+
+@override_settings(ACCESS_LOG_EXCLUIR=['/static/'], ACCESS_LOG_MUESTREO=1.0)
+class AccessLogMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def procesar(self, ruta, estado=200, usuario=None):
+        request = self.factory.get(ruta, REMOTE_ADDR='10.0.0.1')
+        request.user = usuario if usuario is not None else usuario_sin_cargar()
+        middleware = AccessLogMiddleware(lambda request: HttpResponse(status=estado))
+        return middleware(request)
+
+    def test_registro_estructurado_sin_cargar_usuario(self):
+        with self.assertLogs('access_logger', 'INFO') as registro:
+            self.procesar('/temario/', estado=404)
+        acceso = registro.records[0].datos
+        self.assertEqual(
+            {clave: acceso[clave] for clave in ('metodo', 'ruta', 'estado', 'ip', 'usuario')},
+            {'metodo': 'GET', 'ruta': '/temario/', 'estado': 404, 'ip': '10.0.0.1', 'usuario': None},
+        )
+        self.assertGreaterEqual(acceso['duracion_ms'], 0)
+
+        usuario = SimpleLazyObject(AnonymousUser)
+        str(usuario)  # la vista ya lo cargó
+        with self.assertLogs('access_logger', 'INFO') as registro:
+            self.procesar('/', usuario=usuario)
+        self.assertIsNone(registro.records[0].datos['usuario'])
+
+    def test_exclusiones_y_muestreo(self):
+        with self.assertNoLogs('access_logger', 'INFO'):
+            self.procesar('/static/css/estilos.css')
+        with override_settings(ACCESS_LOG_MUESTREO=0.0):
+            with self.assertNoLogs('access_logger', 'INFO'):
+                self.procesar('/')
+            # Los errores se registran siempre
+            with self.assertLogs('access_logger', 'INFO'):
+                self.procesar('/', estado=500)
+
+    def test_manejador_en_cola_escribe_json_lines(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'access.log')
+            manejador = ManejadorEnCola(ruta)
+            registro = logging.LogRecord('access_logger', logging.INFO, __file__, 1, 'acceso', None, None)
+            registro.datos = {'ruta': '/', 'estado': 200}
+            manejador.handle(registro)
+            manejador.close()
+            with open(ruta, encoding='utf-8') as fichero:
+                linea = json.loads(fichero.readline())
+        self.assertEqual((linea['ruta'], linea['estado'], linea['nivel']), ('/', 200, 'INFO'))
+
+
+class DbLoggingMiddlewareTests(TestCase):
+
+    def procesar(self, vista, usuario=None):
+        request = RequestFactory().get('/')
+        request.user = usuario if usuario is not None else AnonymousUser()
+        return request, DbLoggingMiddleware(vista)(request)
+
+    def vista_con_consultas(self, request):
+        for ids in ([1, 2, 3], [4]):
+            get_user_model().objects.filter(pk__in=ids, username='x').count()
+        return HttpResponse()
+
+    def test_normalizar_sql(self):
+        self.assertEqual(
+            normalizar_sql("SELECT * FROM t WHERE a IN (%s, %s,%s) AND b = 'o''k' LIMIT 21"),
+            'SELECT * FROM t WHERE a IN (...) AND b = ? LIMIT ?',
+        )
+
+    @override_settings(
+        CONSULTAS_LENTAS_UMBRAL_MS=0, CONSULTAS_LIMITE_POR_PETICION=1, SERVER_TIMING_PUBLICO=True,
+    )
+    def test_registra_consultas_lentas_y_resumen(self):
+        with self.assertLogs('consultas_lentas', 'INFO') as registro:
+            request, respuesta = self.procesar(self.vista_con_consultas)
+        consultas = [r.datos for r in registro.records if r.datos['tipo'] == 'lenta']
+        self.assertEqual(len(consultas), 2)
+        # Misma consulta con distintos parámetros: misma huella, sin los valores
+        self.assertEqual(consultas[0]['huella'], consultas[1]['huella'])
+        self.assertNotIn("'x'", consultas[0]['sql'])
+        self.assertEqual(registro.records[-1].datos['consultas'], 2)
+        self.assertEqual(request.estadisticas_bd.consultas, 2)
+        self.assertIn('desc="2 consultas"', respuesta['Server-Timing'])
+
+    def test_sin_registro_por_debajo_del_umbral(self):
+        with self.assertNoLogs('consultas_lentas', 'INFO'):
+            self.procesar(self.vista_con_consultas)
+
+    def test_server_timing_solo_para_staff(self):
+        _request, respuesta = self.procesar(self.vista_con_consultas)
+        self.assertNotIn('Server-Timing', respuesta)
+        # Usuario sin cargar por la vista: no se consulta para decidir
+        _request, respuesta = self.procesar(self.vista_con_consultas, usuario=usuario_sin_cargar())
+        self.assertNotIn('Server-Timing', respuesta)
+
+        staff = get_user_model()(email='staff@example.com', username='staff@example.com', is_staff=True)
+        _request, respuesta = self.procesar(self.vista_con_consultas, usuario=staff)
+        self.assertTrue(respuesta['Server-Timing'].startswith('db;dur='))
+
+
+class MetricasTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(METRICAS_DIR=self.directorio, METRICAS_TOKEN='secreto')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        registro_metricas._reiniciar()
+
+    def test_suma_los_procesos_y_exige_autorizacion(self):
+        # Estado volcado por otro worker
+        with open(os.path.join(self.directorio, 'metricas-1.json'), 'w', encoding='utf-8') as fichero:
+            json.dump({'contadores': [[
+                'oposiciones_peticiones_total',
+                [['vista', 'login'], ['metodo', 'GET'], ['estado', '200']], 3,
+            ]], 'histogramas': []}, fichero)
+
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+
+        respuesta = Client(HTTP_AUTHORIZATION='Bearer secreto').get(reverse('metricas'))
+        self.assertEqual(respuesta.status_code, 200)
+        texto = respuesta.content.decode()
+        self.assertIn('oposiciones_peticiones_total{vista="login",metodo="GET",estado="200"} 4', texto)
+        self.assertIn('oposiciones_peticion_duracion_segundos_bucket{vista="login",le="+Inf"} 1', texto)
+        self.assertIn('# TYPE oposiciones_peticion_consultas_bd histogram', texto)
+
+        staff = get_user_model().objects.create_user(
+            email='staff@example.com', username='staff@example.com', password='clave', is_staff=True,
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 200)
+
+
+@override_settings(PERFILES_MAX=2)
+class ProfilerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = get_user_model().objects.create_user(
+            email='staff@example.com', username='staff@example.com', password='clave', is_staff=True,
+        )
+
+    def test_solo_staff_y_con_la_marca(self):
+        alumno = get_user_model().objects.create_user(
+            email='alumno@example.com', username='alumno@example.com', password='clave',
+        )
+        self.client.force_login(alumno)
+        self.assertNotIn('X-Perfil-Id', self.client.get(reverse('home') + '?_perfil=1'))
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Perfil-Id', self.client.get(reverse('staff:panel')))
+        for marca in ('?_perfil=0', '?x_perfil=1', '?q=_perfil=1'):
+            self.assertNotIn('X-Perfil-Id', self.client.get(reverse('staff:panel') + marca))
+        self.assertEqual(lista_perfiles(), [])
+
+    def test_perfil_con_sql_explain_y_bufer_circular(self):
+        self.client.force_login(self.staff)
+        ids = [
+            self.client.get(reverse('staff:panel'), HTTP_X_PERFIL='1')['X-Perfil-Id']
+            for _ in range(3)
+        ]
+        self.assertEqual([perfil['id'] for perfil in lista_perfiles()], ids[:0:-1])
+
+        respuesta = self.client.get(reverse('staff:perfil', args=[ids[-1]]))
+        perfil = respuesta.context['perfil']
+        self.assertEqual((perfil['vista'], perfil['estado']), ('staff:panel', 200))
+        self.assertEqual(len(perfil['sql']), perfil['num_consultas'])
+        self.assertTrue(any(consulta.get('explain') for consulta in perfil['sql']))
+        self.assertIn('cumulative', perfil['estadisticas'])
+
+        volcado = self.client.get(reverse('staff:perfil', args=[ids[-1]]) + '?descargar=1').content
+        with tempfile.NamedTemporaryFile(suffix='.prof') as fichero:
+            fichero.write(volcado)
+            fichero.flush()
+            self.assertGreater(pstats.Stats(fichero.name).total_calls, 0)
+        self.assertEqual(self.client.get(reverse('staff:perfil', args=[ids[0]])).status_code, 404)
+
+    def test_conserva_las_consultas_mas_lentas(self):
+        self.client.force_login(self.staff)
+        with mock.patch('usuarios.middleware.profiler.MAX_CONSULTAS_GUARDADAS', 2):
+            perfil_id = self.client.get(reverse('staff:panel') + '?_perfil=1')['X-Perfil-Id']
+        perfil = self.client.get(reverse('staff:perfil', args=[perfil_id])).context['perfil']
+        self.assertGreater(perfil['num_consultas'], 2)
+        self.assertEqual(len(perfil['sql']), 2)
+        duraciones = [consulta['duracion_ms'] for consulta in perfil['sql']]
+        self.assertEqual(duraciones, sorted(duraciones, reverse=True))
+        self.assertIn('explain', perfil['sql'][0])
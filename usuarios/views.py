@@ -1,11 +1,15 @@
+import hmac
 import logging
 
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
 from django.contrib import messages
 
+from .middleware.metrics import exposicion
 from .models import Usuario
 
 logger = logging.getLogger(__name__)
@@ -94,3 +98,14 @@ def reset_password(request):
         form = PasswordResetForm()
 
     return render(request, 'usuarios/reset_password.html', {'form': form})
+
+
+def metricas_view(request):
+    """Métricas en formato Prometheus, para el staff o con `Authorization: Bearer <METRICAS_TOKEN>`."""
+    token = settings.METRICAS_TOKEN
+    cabecera = request.headers.get('Authorization', '')
+    # El token se comprueba antes que la sesión para que el scraper no la consulte
+    con_token = bool(token) and hmac.compare_digest(cabecera.encode(), f'Bearer {token}'.encode())
+    if not con_token and not request.user.is_staff:
+        return HttpResponse('No autorizado.', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')